@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Benchmarks for the parse -> dispatch -> classify pipeline.
+
+Each stage is run on its own over synthetic data, then the whole stack is run
+from raw BGAPI bytes to on_raw_pose:
+
+    framing    BT.recv_packet over a synthetic notification stream
+    dispatch   MyoRaw.handle_data on already framed packets
+    classify   NNClassifier.classify with 10 classes and N stored samples
+    emg        Myo.emg_handler (classification plus pose voting)
+    emg_batch  the same with frames classified in batches of BATCH_SIZE
+    full       bytes -> BT -> handle_data -> Myo.emg_handler -> on_raw_pose
+
+For every stage frames/s, per-frame latency percentiles and allocations per
+frame are reported, and with --output the results are written as JSON so runs
+on different commits can be compared with --compare.
+
+    python benchmark.py [--quick] [--stages a,b] [--sizes N,N] [--output f.json]
+                        [--compare old.json]
+'''
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from common import *
+
+NUM_CLASSES = 10
+SIZES = [1000, 10000, 100000, 1000000]
+PERCENTILES = [50, 90, 99, 99.9]
+
+clock = time.perf_counter
+
+
+## synthetic data
+def synthetic_emg(n, seed=0):
+    '''n EMG frames drawn from NUM_CLASSES clusters; returns (X, Y).'''
+    rng = np.random.RandomState(seed)
+    centers = rng.randint(50, 1000, size=(NUM_CLASSES, 8))
+    Y = rng.randint(0, NUM_CLASSES, size=n)
+    X = centers[Y] + rng.normal(0, 40, size=(n, 8))
+    return np.clip(X, 0, 65535).astype(np.uint16), Y
+
+
+def notification(attr, val, conn=0):
+    pay = pack('BHBB', conn, attr, 1, len(val)) + val
+    return pack('4B', 0x80, len(pay), 4, 5) + pay
+
+
+def synthetic_stream(n, imu_every=4, seed=0):
+    '''BGAPI bytes for n EMG notifications with an IMU notification after
+    every imu_every of them, as the dongle would send at 200 Hz/50 Hz.'''
+    X, _ = synthetic_emg(n, seed)
+    imu = notification(0x1c, pack('10h', 16384, 0, 0, 0, 0, 0, 2048, 0, 0, 0))
+    out = []
+    for i, row in enumerate(X):
+        out.append(notification(0x27, pack('8HB', *(list(row) + [0]))))
+        if imu_every and i % imu_every == imu_every - 1:
+            out.append(imu)
+    return b''.join(out)
+
+
+def replay_serial(stream, chunk=512):
+    '''A ReplaySerial over `stream`, split into chunk-sized reads.'''
+    from myo_capture import CaptureWriter, ReplaySerial
+
+    fd, path = tempfile.mkstemp(suffix='.cap')
+    os.close(fd)
+    try:
+        w = CaptureWriter(path)
+        for i in range(0, len(stream), chunk):
+            w.write(stream[i:i + chunk])
+        w.close()
+        return ReplaySerial(path)
+    finally:
+        os.remove(path)
+
+
+class TrainingDir(object):
+    '''A temporary working directory holding n stored training samples, so
+    NNClassifier can be built exactly as the scripts build it.'''
+
+    def __init__(self, n, seed=1):
+        self.n = n
+        self.seed = seed
+
+    def __enter__(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp(prefix='myo_bench_')
+        X, Y = synthetic_emg(self.n, self.seed)
+        for c in range(NUM_CLASSES):
+            X[Y == c].tofile(os.path.join(self.dir, 'vals%d.dat' % c))
+        os.chdir(self.dir)
+        return self
+
+    def __exit__(self, *exc):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir)
+
+
+## measurement
+def measure(step, n, min_time=1.0):
+    '''Calls step() up to n times (each call handles one frame and returns
+    False when there is nothing left) and returns frames/s and latency
+    percentiles in microseconds.'''
+    lat = []
+    t_start = clock()
+    for i in range(n):
+        t0 = clock()
+        if step() is False:
+            break
+        t1 = clock()
+        lat.append(t1 - t0)
+        if t1 - t_start > min_time and len(lat) >= 100:
+            break
+    total = clock() - t_start
+    lat = np.array(lat) * 1e6
+
+    res = {
+        'frames': len(lat),
+        'frames_per_s': len(lat) / total if total else 0.0,
+        'latency_us': dict(('p%g' % p, float(np.percentile(lat, p))) for p in PERCENTILES)
+                      if len(lat) else {},
+    }
+    res['latency_us']['mean'] = float(lat.mean()) if len(lat) else 0.0
+    return res
+
+
+def measure_allocs(step, n):
+    '''Allocation pass under tracemalloc: blocks is the net number of memory
+    blocks still allocated per frame, bytes the mean transient peak.'''
+    tracemalloc.start()
+    blocks0 = sys.getallocatedblocks()
+    peaks = []
+    frames = 0
+    for i in range(n):
+        cur, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        if step() is False:
+            break
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - cur)
+        frames += 1
+    blocks = sys.getallocatedblocks() - blocks0
+    tracemalloc.stop()
+    return {
+        'alloc_blocks_per_frame': blocks / float(frames) if frames else 0.0,
+        'alloc_bytes_per_frame': float(np.mean(peaks)) if peaks else 0.0,
+    }
+
+
+## stages
+def bench_framing(n, min_time):
+    from myo_raw import BT
+
+    def make():
+        bt = BT(replay_serial(synthetic_stream(n, imu_every=0)))
+        return lambda: bt.recv_packet() is not None
+    res = measure(make(), n, min_time)
+    res.update(measure_allocs(make(), min(n, 2000)))
+    return res
+
+
+def framed_packets(n):
+    from myo_raw import BT
+
+    bt = BT(replay_serial(synthetic_stream(n, imu_every=0)))
+    pkts = []
+    while True:
+        p = bt.recv_packet()
+        if p is None:
+            return pkts
+        pkts.append(p)
+
+
+def bench_dispatch(n, min_time):
+    from myo_raw import MyoRaw
+
+    pkts = framed_packets(n)
+    def make():
+        m = MyoRaw(replay_serial(b''))
+        m.add_emg_handler(lambda emg, moving: None)
+        it = iter(pkts)
+        def step():
+            p = next(it, None)
+            if p is None:
+                return False
+            m.handle_data(p)
+        return step
+    res = measure(make(), n, min_time)
+    res.update(measure_allocs(make(), min(n, 2000)))
+    return res
+
+
+def frame_iter(n):
+    X, _ = synthetic_emg(n, seed=2)
+    return [tuple(int(v) for v in row) for row in X]
+
+
+def bench_classify(n, min_time, size):
+    import myo
+
+    frames = frame_iter(n)
+    with TrainingDir(size):
+        cls = myo.NNClassifier()
+        def make():
+            it = iter(frames)
+            def step():
+                d = next(it, None)
+                if d is None:
+                    return False
+                cls.classify(d)
+            return step
+        res = measure(make(), n, min_time)
+        res.update(measure_allocs(make(), min(n, 500)))
+    return res
+
+
+def bench_emg(n, min_time, size, batch_size=1):
+    import myo
+
+    frames = frame_iter(n)
+    with TrainingDir(size):
+        m = myo.Myo(myo.NNClassifier(), replay_serial(b''), batch_size=batch_size)
+        def make():
+            it = iter(frames)
+            def step():
+                d = next(it, None)
+                if d is None:
+                    return False
+                m.emg_handler(d, 0)
+            return step
+        res = measure(make(), n, min_time)
+        res.update(measure_allocs(make(), min(n, 500)))
+    return res
+
+
+def bench_full(n, min_time, size):
+    import myo
+
+    stream = synthetic_stream(n)
+    with TrainingDir(size):
+        cls = myo.NNClassifier()
+        def make():
+            m = myo.Myo(cls, replay_serial(stream))
+            m.add_raw_pose_handler(lambda pose: None)
+            m.bt.add_handler(m.handle_data)
+            return lambda: m.run() is not None
+        res = measure(make(), n * 2, min_time)
+        res.update(measure_allocs(make(), min(n, 500)))
+    return res
+
+
+STAGES = ['framing', 'dispatch', 'classify', 'emg', 'emg_batch', 'full']
+BATCH_SIZE = 32
+
+
+def run(stages, sizes, n, min_time):
+    results = {}
+    for stage in stages:
+        if stage == 'framing':
+            results['framing'] = bench_framing(n, min_time)
+        elif stage == 'dispatch':
+            results['dispatch'] = bench_dispatch(n, min_time)
+        else:
+            f = {'classify': bench_classify, 'emg': bench_emg, 'full': bench_full,
+                 'emg_batch': lambda n, t, size: bench_emg(n, t, size, BATCH_SIZE)}[stage]
+            for size in sizes:
+                results['%s/%d' % (stage, size)] = f(n, min_time, size)
+        for k in sorted(results):
+            if k == stage or k.startswith(stage + '/'):
+                report(k, results[k])
+    return results
+
+
+def report(name, r):
+    lat = r['latency_us']
+    print('%-16s %10.0f frames/s  p50 %8.1f us  p99 %8.1f us  p99.9 %8.1f us  %6.2f blocks/frame  %8.0f B/frame' %
+          (name, r['frames_per_s'], lat.get('p50', 0), lat.get('p99', 0), lat.get('p99.9', 0),
+           r.get('alloc_blocks_per_frame', 0), r.get('alloc_bytes_per_frame', 0)))
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.STDOUT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new):
+    print()
+    print('%-16s %12s %12s %8s' % ('stage', 'old f/s', 'new f/s', 'change'))
+    for k in sorted(new['results']):
+        if k not in old['results']:
+            continue
+        a = old['results'][k]['frames_per_s']
+        b = new['results'][k]['frames_per_s']
+        print('%-16s %12.0f %12.0f %+7.1f%%' % (k, a, b, 100. * (b - a) / a if a else 0))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Benchmark the Myo processing pipeline.')
+    parser.add_argument('--stages', default=','.join(STAGES))
+    parser.add_argument('--sizes', default=','.join(str(s) for s in SIZES),
+                        help='stored training samples for the classifier stages')
+    parser.add_argument('--frames', type=int, default=20000, help='max frames per stage')
+    parser.add_argument('--min-time', type=float, default=2.0, help='seconds per stage before stopping early')
+    parser.add_argument('--quick', action='store_true', help='small sizes and short runs')
+    parser.add_argument('--output', help='write results as JSON')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    args = parser.parse_args(argv[1:])
+
+    sizes = [int(s) for s in args.sizes.split(',')]
+    frames, min_time = args.frames, args.min_time
+    if args.quick:
+        sizes = [s for s in sizes if s <= 10000] or sizes[:1]
+        frames, min_time = min(frames, 2000), min(min_time, .2)
+
+    results = run(args.stages.split(','), sizes, frames, min_time)
+    out = {
+        'commit': git_commit(),
+        'time': time.time(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(out, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), out)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Classifier backends for Myo.
+
+Every backend has what Myo and classify_myo use (classify, classify_batch,
+store_data, store) on top of a common interface:
+
+    fit(X, Y)          fit from scratch
+    partial_fit(X, Y)  learn more samples, if `incremental`
+    save(path)         the fitted model only, without the training store
+    Backend.load(path)
+
+Like NNClassifier, a backend keeps its samples in a TrainingStore and fits
+on them when opened. store_data adds a sample to the store; incremental
+backends also learn it (in batches of PARTIAL_EVERY), the others only
+when the data is read again (read_data).
+
+Each backend records the time classify_batch takes per frame in
+`latency`, a Histogram. compare() fits every backend on one split of the
+data and reports its accuracy and latency on single frames, as
+Myo.emg_handler classifies them; fastest() picks the quickest one that
+is accurate enough.
+
+    python classifiers.py [training.myo] [--target ACCURACY]
+'''
+
+from __future__ import print_function
+
+import pickle
+import sys
+import time
+
+import numpy as np
+
+from instrument import Histogram, monotonic
+from knn import BlockKNN
+from myo import K, SUBSAMPLE, TRAINING_PATH, load_sklearn
+from training_store import TrainingStore
+
+
+def dump(obj, path):
+    '''Pickles obj to path, with joblib if available (better for arrays).'''
+    try:
+        import joblib
+    except ImportError:
+        with open(path, 'wb') as f:
+            pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+        return
+    joblib.dump(obj, path)
+
+
+def undump(path):
+    try:
+        import joblib
+    except ImportError:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    return joblib.load(path)
+
+
+class Backend(object):
+    '''Base of the classifier backends; subclasses implement fit_model,
+    predict and, if incremental, partial_fit_model. path is the training
+    store, or None to use the backend without one.'''
+
+    name = None
+    incremental = False
+    ## samples store_data collects before handing them to partial_fit
+    PARTIAL_EVERY = 64
+
+    def __init__(self, path=TRAINING_PATH):
+        self.fitted = False
+        self.latency = Histogram()
+        self.pending = []
+        self.store = None
+        if path is not None:
+            self.open(path)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(store=None, latency=None, pending=[])
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.latency = Histogram()
+
+    def open(self, path):
+        '''Switches to the training data at path and fits on it.'''
+        if self.store is not None:
+            self.store.close()
+        self.store = TrainingStore(path)
+        if self.store.created:
+            self.store.import_vals()
+        self.read_data()
+
+    def read_data(self):
+        self.pending = []
+        X, Y = self.store.load()
+        if len(Y):
+            self.fit(X, Y)
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+
+    ## training
+    def fit(self, X, Y):
+        self.fit_model(np.asarray(X, np.float32), np.asarray(Y).astype(np.intp))
+        self.fitted = True
+        return self
+
+    def partial_fit(self, X, Y):
+        if not self.incremental:
+            raise NotImplementedError('the %s backend cannot learn incrementally' % self.name)
+        self.partial_fit_model(np.atleast_2d(np.asarray(X, np.float32)), np.asarray(Y).astype(np.intp))
+        self.fitted = True
+        return self
+
+    def store_data(self, cls, vals):
+        if self.store is not None:
+            self.store.append(cls, vals)
+        if self.incremental:
+            self.pending.append((cls, vals))
+            if len(self.pending) >= self.PARTIAL_EVERY:
+                Y, X = zip(*self.pending)
+                self.pending = []
+                self.partial_fit(X, Y)
+
+    ## inference
+    def classify_batch(self, frames):
+        '''Labels for each row of frames, classified in one call.'''
+        if not self.fitted:
+            return np.zeros(len(frames), np.intp)
+        t = monotonic()
+        ys = self.predict(np.atleast_2d(np.asarray(frames, np.float32)))
+        if len(frames):
+            self.latency.record((monotonic() - t) / len(frames))
+        return ys
+
+    def classify(self, d):
+        return int(self.classify_batch([d])[0])
+
+    ## persistence
+    def save(self, path):
+        dump(self, path)
+
+    @staticmethod
+    def load(path):
+        return undump(path)
+
+
+class KNNBackend(Backend):
+    '''k nearest neighbours among every subsample-th sample, as
+    NNClassifier, in plain NumPy (knn.BlockKNN); samples can be added one
+    at a time.'''
+
+    name = 'knn'
+    incremental = True
+
+    def __init__(self, path=TRAINING_PATH, k=K, subsample=SUBSAMPLE):
+        self.k = k
+        self.subsample = subsample
+        self.engine = BlockKNN(k)
+        ## samples seen, to keep subsampling in step across partial_fit calls
+        self.seen = 0
+        Backend.__init__(self, path)
+
+    def fit_model(self, X, Y):
+        self.engine = BlockKNN(self.k).fit(X[::self.subsample], Y[::self.subsample])
+        self.seen = len(X)
+
+    def partial_fit_model(self, X, Y):
+        start = -self.seen % self.subsample
+        if start < len(X):
+            self.engine.add(X[start::self.subsample], Y[start::self.subsample])
+        self.seen += len(X)
+
+    def predict(self, X):
+        return self.engine.classify_batch(X)
+
+
+class ForestBackend(Backend):
+    '''sklearn's random forest, with the parameters of
+    training/random_forest_01.ipynb. Refitted only by fit/read_data.'''
+
+    name = 'forest'
+
+    def __init__(self, path=TRAINING_PATH, n_estimators=30, max_depth=30, random_state=42):
+        if not load_sklearn():
+            raise ImportError('the forest backend needs sklearn')
+        from sklearn.ensemble import RandomForestClassifier
+        self.model = RandomForestClassifier(n_estimators=n_estimators, max_depth=max_depth,
+                                            random_state=random_state)
+        Backend.__init__(self, path)
+
+    def fit_model(self, X, Y):
+        self.model.fit(X, Y)
+
+    def predict(self, X):
+        return self.model.predict(X)
+
+
+class LinearBackend(Backend):
+    '''Ridge regression onto one-hot labels, in plain NumPy. It keeps X'X and
+    X'Y, so partial_fit gives the same model as fitting on all the samples
+    at once, and predicting is one matrix product.'''
+
+    name = 'linear'
+    incremental = True
+
+    def __init__(self, path=TRAINING_PATH, alpha=1.0):
+        self.alpha = alpha
+        self.XX = None
+        self.XY = None
+        self.W = None
+        Backend.__init__(self, path)
+
+    def fit_model(self, X, Y):
+        self.XX = self.XY = None
+        self.partial_fit_model(X, Y)
+
+    def partial_fit_model(self, X, Y):
+        ## with a constant column for the intercept; float64 for the sums
+        Xb = np.ones((len(X), X.shape[1] + 1))
+        Xb[:, :-1] = X
+        nclasses = int(Y.max()) + 1
+        if self.XX is None:
+            self.XX = np.zeros((Xb.shape[1], Xb.shape[1]))
+            self.XY = np.zeros((Xb.shape[1], nclasses))
+        elif nclasses > self.XY.shape[1]:
+            self.XY = np.pad(self.XY, ((0, 0), (0, nclasses - self.XY.shape[1])), 'constant')
+        self.XX += Xb.T.dot(Xb)
+        onehot = np.zeros((len(Y), self.XY.shape[1]))
+        onehot[np.arange(len(Y)), Y] = 1
+        self.XY += Xb.T.dot(onehot)
+
+        ## the intercept isn't penalized
+        reg = np.full(Xb.shape[1], float(self.alpha))
+        reg[-1] = 0
+        self.W = np.linalg.solve(self.XX + np.diag(reg), self.XY).astype(np.float32)
+
+    def predict(self, X):
+        return (X.dot(self.W[:-1]) + self.W[-1]).argmax(1)
+
+
+BACKENDS = {'knn': KNNBackend, 'forest': ForestBackend, 'linear': LinearBackend}
+
+
+def compare(X, Y, names=None, test_size=.3, frames=1000, seed=42):
+    '''Fits each backend in names (all of BACKENDS by default) on a random
+    split of X, Y and returns a dict per backend: name, accuracy on the
+    rest, fit time and the latency of classifying up to `frames` test
+    frames one by one (Histogram.snapshot, in us).'''
+    X = np.asarray(X, np.float32)
+    Y = np.asarray(Y).astype(np.intp)
+    order = np.random.RandomState(seed).permutation(len(X))
+    n_test = int(len(X) * test_size)
+    test, train = order[:n_test], order[n_test:]
+
+    results = []
+    for name in names or sorted(BACKENDS):
+        try:
+            b = BACKENDS[name](path=None)
+        except ImportError as e:
+            print('skipping %s: %s' % (name, e))
+            continue
+        t = time.time()
+        b.fit(X[train], Y[train])
+        fit_time = time.time() - t
+        accuracy = float((b.classify_batch(X[test]) == Y[test]).mean()) if n_test else 0.0
+        b.latency = Histogram()
+        for d in X[test[:frames]]:
+            b.classify(d)
+        results.append({'name': name, 'accuracy': accuracy, 'fit_s': fit_time,
+                        'latency': b.latency.snapshot()})
+    return results
+
+
+def fastest(results, accuracy):
+    '''The result with the lowest p99 latency among those with at least the
+    given accuracy, or None.'''
+    ok = [r for r in results if r['accuracy'] >= accuracy]
+    return min(ok, key=lambda r: r['latency'].get('p99_us', 0)) if ok else None
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    target = 0.0
+    if '--target' in args:
+        i = args.index('--target')
+        target = float(args[i + 1])
+        del args[i:i + 2]
+    store = TrainingStore(args[0] if args else TRAINING_PATH)
+    X, Y = store.load()
+    print('%d samples' % len(Y))
+    results = compare(X, Y)
+    for r in results:
+        lat = r['latency']
+        print('%-8s accuracy %.3f  fit %7.2f s  per frame p50 %8.1f us  p99 %8.1f us' %
+              (r['name'], r['accuracy'], r['fit_s'], lat.get('p50_us', 0), lat.get('p99_us', 0)))
+    best = fastest(results, target)
+    print('fastest with accuracy >= %g: %s' % (target, best['name'] if best else 'none'))
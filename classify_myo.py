@@ -7,22 +7,27 @@ import time
 
 import numpy as np
 
-try:
-    from sklearn import neighbors, svm
-    HAVE_SK = True
-except ImportError:
-    HAVE_SK = False
-
-try:
-    import pygame
-    from pygame.locals import *
-    HAVE_PYGAME = True
-except ImportError:
-    HAVE_PYGAME = False
-
 from common import *
 import myo
 
+## pygame is only imported by load_pygame, when the window is wanted
+pygame = None
+HAVE_PYGAME = None
+
+def load_pygame():
+    '''Imports pygame and its constants into this module on first use;
+    returns whether it is available.'''
+    global pygame, HAVE_PYGAME
+    if HAVE_PYGAME is None:
+        try:
+            import pygame
+            import pygame.locals
+            globals().update((k, v) for k, v in vars(pygame.locals).items() if not k.startswith('_'))
+            HAVE_PYGAME = True
+        except ImportError:
+            HAVE_PYGAME = False
+    return HAVE_PYGAME
+
 class EMGHandler(object):
     def __init__(self, m):
         self.recording = -1
@@ -34,25 +39,30 @@ class EMGHandler(object):
         if self.recording >= 0:
             self.m.cls.store_data(self.recording, emg)
 
-if __name__ == '__main__':
-    if HAVE_PYGAME:
+def main(m, gui=True):
+    '''Shows the votes of connected Myo m until interrupted, in a pygame
+    window if gui and pygame is available, on the terminal otherwise.'''
+    gui = gui and load_pygame()
+    if gui:
         pygame.init()
         w, h = 800, 320
         scr = pygame.display.set_mode((w, h))
         font = pygame.font.Font(None, 30)
 
-    m = myo.Myo(myo.NNClassifier(), sys.argv[1] if len(sys.argv) >= 2 else None)
     hnd = EMGHandler(m)
     m.add_emg_handler(hnd)
-    m.connect()
+    ## read and classify on background threads so drawing can't hold off
+    ## the serial port
+    m.start_reader()
 
     try:
         while True:
             m.run()
 
-            r = m.history_cnt.most_common(1)[0][0]
+            ## the vote changes under us on the reader's consumer thread
+            r, votes, hist_len = m.votes()
 
-            if HAVE_PYGAME:
+            if gui:
                 for ev in pygame.event.get():
                     if ev.type == QUIT or (ev.type == KEYDOWN and ev.unicode == 'q'):
                         raise KeyboardInterrupt()
@@ -75,17 +85,18 @@ if __name__ == '__main__':
 
                     clr = (0,200,0) if i == r else (255,255,255)
 
-                    txt = font.render('%5d' % (m.cls.Y == i).sum(), True, (255,255,255))
+                    txt = font.render('%5d' % m.cls.store.counts()[i], True, (255,255,255))
                     scr.blit(txt, (x + 20, y))
 
                     txt = font.render('%d' % i, True, clr)
                     scr.blit(txt, (x + 110, y))
 
 
-                    scr.fill((0,0,0), (x+130, y + txt.get_height() / 2 - 10, len(m.history) * 20, 20))
-                    scr.fill(clr, (x+130, y + txt.get_height() / 2 - 10, m.history_cnt[i] * 20, 20))
+                    scr.fill((0,0,0), (x+130, y + txt.get_height() / 2 - 10, hist_len * 20, 20))
+                    scr.fill(clr, (x+130, y + txt.get_height() / 2 - 10, votes.get(i, 0) * 20, 20))
 
-                if HAVE_SK and m.cls.nn is not None:
+                ## neighbours are only shown for NNClassifier with sklearn
+                if getattr(m.cls, 'nn', None) is not None:
                     dists, inds = m.cls.nn.kneighbors(hnd.emg)
                     for i, (d, ind) in enumerate(zip(dists[0], inds[0])):
                         y = m.cls.Y[myo.SUBSAMPLE*ind]
@@ -95,7 +106,7 @@ if __name__ == '__main__':
             else:
                 for i in range(10):
                     if i == r: sys.stdout.write('\x1b[32m')
-                    print(i, '-' * m.history_cnt[i], '\x1b[K')
+                    print(i, '-' * votes.get(i, 0), '\x1b[K')
                     if i == r: sys.stdout.write('\x1b[m')
                 sys.stdout.write('\x1b[11A')
                 print()
@@ -104,7 +115,15 @@ if __name__ == '__main__':
         pass
     finally:
         m.disconnect()
+        m.stop_reader()
+        m.cls.close()
         print()
 
-    if HAVE_PYGAME:
+    if gui:
         pygame.quit()
+
+
+if __name__ == '__main__':
+    m = myo.Myo(myo.NNClassifier(), sys.argv[1] if len(sys.argv) >= 2 else None)
+    m.connect()
+    main(m)
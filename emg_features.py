@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Sliding-window EMG features: RMS, MAV, waveform length, zero crossings and
+variance per channel.
+
+EMGFeatures is an EMG handler for MyoRaw that keeps a ring buffer per channel
+and running sums, so each sample costs O(1) whatever the window length.
+features() computes the same windows from a recorded (samples, channels)
+array in one vectorized pass.
+
+Feature vectors are feature-major: the RMS of every channel, then the MAV of
+every channel, and so on in the order of FEATURES.
+'''
+
+from __future__ import print_function
+
+import numpy as np
+
+FEATURES = ('rms', 'mav', 'wl', 'zc', 'var')
+
+
+class EMGFeatures(object):
+    '''Emits a feature vector over the last `window` samples every `hop`
+    samples, once the window has filled.
+
+    Zero crossings are counted on x - offset, and only when consecutive
+    samples also differ by at least zc_threshold.
+    '''
+
+    ## recompute the running sums from the buffers this often (in samples) so
+    ## floating-point error can't accumulate on non-integer input
+    RESYNC = 1 << 16
+
+    def __init__(self, window=40, hop=10, channels=8, zc_threshold=0.0, offset=0.0):
+        if window < 2 or hop < 1:
+            raise ValueError('need window >= 2 and hop >= 1')
+        self.window = window
+        self.hop = hop
+        self.channels = channels
+        self.zc_threshold = zc_threshold
+        self.offset = offset
+        self.handlers = []
+        self.reset()
+
+    def reset(self):
+        W, C = self.window, self.channels
+        self.x = np.zeros((W, C))
+        ## per-sample contributions of the pair (previous sample, this sample)
+        self.d = np.zeros((W, C))
+        self.z = np.zeros((W, C))
+        self.s1 = np.zeros(C)
+        self.s2 = np.zeros(C)
+        self.sa = np.zeros(C)
+        self.sd = np.zeros(C)
+        self.sz = np.zeros(C)
+        self.prev = None
+        self.pos = 0
+        self.count = 0
+
+    def add_handler(self, h):
+        self.handlers.append(h)
+
+    def __call__(self, emg, moving=None):
+        self.update(emg)
+
+    def update(self, emg):
+        '''Adds one sample; returns the feature vector if one was emitted.'''
+        x = np.asarray(emg, float) - self.offset
+        i = self.pos
+
+        if self.prev is None:
+            d = z = np.zeros(self.channels)
+        else:
+            d = np.abs(x - self.prev)
+            z = ((self.prev * x < 0) & (d >= self.zc_threshold)).astype(float)
+
+        old = self.x[i]
+        self.s1 += x - old
+        self.s2 += x * x - old * old
+        self.sa += np.abs(x) - np.abs(old)
+        self.sd += d - self.d[i]
+        self.sz += z - self.z[i]
+        self.x[i] = x
+        self.d[i] = d
+        self.z[i] = z
+
+        self.prev = x
+        self.pos = (i + 1) % self.window
+        self.count += 1
+        if self.count % self.RESYNC == 0:
+            self.resync()
+
+        if self.count < self.window or (self.count - self.window) % self.hop:
+            return None
+        f = self.current()
+        for h in self.handlers:
+            h(f)
+        return f
+
+    def resync(self):
+        self.s1 = self.x.sum(0)
+        self.s2 = (self.x * self.x).sum(0)
+        self.sa = np.abs(self.x).sum(0)
+        self.sd = self.d.sum(0)
+        self.sz = self.z.sum(0)
+
+    def current(self):
+        '''Features of the window ending at the latest sample.'''
+        W = self.window
+        ## the oldest sample's pair reaches back outside the window
+        oldest = self.pos
+        f = np.empty(len(FEATURES) * self.channels)
+        f.shape = (len(FEATURES), self.channels)
+        f[0] = np.sqrt(np.maximum(self.s2, 0) / W)
+        f[1] = self.sa / W
+        f[2] = self.sd - self.d[oldest]
+        f[3] = self.sz - self.z[oldest]
+        f[4] = np.maximum(self.s2 - self.s1 * self.s1 / W, 0) / (W - 1)
+        return f.ravel()
+
+    def process(self, X):
+        '''Feeds every row of X; returns the emitted vectors as an array.'''
+        out = [self.update(x) for x in X]
+        out = [f for f in out if f is not None]
+        return np.array(out).reshape(-1, len(FEATURES) * self.channels)
+
+
+def features(X, window=40, hop=10, zc_threshold=0.0, offset=0.0):
+    '''Batch version of EMGFeatures: the feature vectors for every window of
+    a (samples, channels) array that the stream would emit.'''
+    X = np.asarray(X, float) - offset
+    n, C = X.shape
+    if n < window:
+        return np.zeros((0, len(FEATURES) * C))
+    starts = np.arange(0, n - window + 1, hop)
+    ends = starts + window
+
+    def window_sums(v):
+        c = np.zeros((len(v) + 1, C))
+        np.cumsum(v, axis=0, out=c[1:])
+        return c[ends] - c[starts]
+
+    s1 = window_sums(X)
+    s2 = window_sums(X * X)
+    sa = window_sums(np.abs(X))
+
+    ## pair t (between samples t and t + 1) is inside a window starting at s
+    ## for s <= t <= s + window - 2
+    d = np.abs(np.diff(X, axis=0))
+    z = ((X[:-1] * X[1:] < 0) & (d >= zc_threshold)).astype(float)
+    cd = np.zeros((n, C))
+    cz = np.zeros((n, C))
+    np.cumsum(d, axis=0, out=cd[1:])
+    np.cumsum(z, axis=0, out=cz[1:])
+
+    f = np.empty((len(starts), len(FEATURES), C))
+    f[:, 0] = np.sqrt(np.maximum(s2, 0) / window)
+    f[:, 1] = sa / window
+    f[:, 2] = cd[ends - 1] - cd[starts]
+    f[:, 3] = cz[ends - 1] - cz[starts]
+    f[:, 4] = np.maximum(s2 - s1 * s1 / window, 0) / (window - 1)
+    return f.reshape(len(starts), -1)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Growable row store for recording sessions.'''
+
+from __future__ import print_function
+
+import numpy as np
+
+
+class Recorder(object):
+    '''Appends fixed-width rows into preallocated storage.
+
+    Storage grows in chunks (at least `chunk` rows, or the current size,
+    whichever is larger), so appending stays amortized O(1). `data` is a
+    C-contiguous view of the recorded rows and column(i) a view of one
+    column; neither copies.
+
+    With `retention` set only the last `retention` rows are kept. The buffer
+    then holds twice that, and the live rows are moved back to the start
+    when they reach its end, so `data` stays a contiguous view.
+    '''
+
+    def __init__(self, columns, chunk=4096, retention=None, dtype=float):
+        self.columns = columns
+        self.chunk = chunk
+        self.retention = retention
+        cap = 2 * retention if retention else chunk
+        self.buf = np.zeros((cap, columns), dtype)
+        self.start = 0
+        self.end = 0
+        self.total = 0
+
+    def __len__(self):
+        return self.end - self.start
+
+    @property
+    def data(self):
+        return self.buf[self.start:self.end]
+
+    def column(self, i):
+        return self.buf[self.start:self.end, i]
+
+    def append(self, row):
+        if self.end == len(self.buf):
+            self.make_room()
+        self.buf[self.end] = row
+        self.end += 1
+        self.total += 1
+        if self.retention and self.end - self.start > self.retention:
+            self.start += 1
+
+    def extend(self, rows):
+        '''Appends every row of a (n, columns) array at once.'''
+        rows = np.asarray(rows)
+        self.total += len(rows)
+        if self.retention and len(rows) > self.retention:
+            rows = rows[-self.retention:]
+        while self.end + len(rows) > len(self.buf):
+            self.make_room()
+        self.buf[self.end:self.end + len(rows)] = rows
+        self.end += len(rows)
+        if self.retention and self.end - self.start > self.retention:
+            self.start = self.end - self.retention
+
+    def make_room(self):
+        n = self.end - self.start
+        if self.retention:
+            self.buf[:n] = self.buf[self.start:self.end]
+        else:
+            buf = np.empty((len(self.buf) + max(self.chunk, len(self.buf)), self.columns), self.buf.dtype)
+            buf[:n] = self.buf[self.start:self.end]
+            self.buf = buf
+        self.start = 0
+        self.end = n
+
+    def clear(self):
+        self.start = self.end = 0
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''IMU samples in blocks, in physical units.
+
+MyoRaw unpacks every IMU notification into three tuples of raw int16 and
+calls the IMU handlers frame by frame. IMUBuffer keeps the samples as rows
+of a preallocated int16 array instead (quaternion w, x, y, z, then
+accelerometer and gyroscope x, y, z, as sent). Attached with raw=True it
+takes over the decoding of the IMU attribute and copies each
+notification's 20 bytes straight into the next row without unpacking
+them; the MyoRaw's own IMU handlers then get nothing.
+
+The rows form a ring of `capacity`, so memory stays the same however long
+the session: read() returns what arrived since the last read (the oldest
+rows are overwritten, and counted in `lost`, if it isn't called often
+enough) and latest(n) the last n. to_units() converts a block to float32
+unit quaternions, g and deg/s in one step; euler() and rotation_matrix()
+work on whole blocks of quaternions.
+
+    python imu.py [tty]   # print orientation as roll, pitch, yaw
+'''
+
+from __future__ import print_function
+
+import struct
+import sys
+import time
+
+import numpy as np
+
+## the whole notification value as one bytes object, to copy it unparsed
+RAW_IMU = struct.Struct('<20s')
+ROW_BYTES = 20
+
+## raw units per unit quaternion, per g and per deg/s
+ORIENTATION_SCALE = 16384.0
+ACCEL_SCALE = 2048.0
+GYRO_SCALE = 16.0
+SCALE = np.array([1 / ORIENTATION_SCALE] * 4 + [1 / ACCEL_SCALE] * 3 + [1 / GYRO_SCALE] * 3, np.float32)
+
+
+def decode_block(data):
+    '''Rows of int16 from concatenated 20-byte IMU values (a view of data).'''
+    return np.frombuffer(data, '<i2').reshape(-1, 10)
+
+
+def to_units(raw):
+    '''(quat, acc, gyro) of a block of raw rows, as float32: unit
+    quaternions (w, x, y, z), acceleration in g and angular rate in deg/s.'''
+    v = np.asarray(raw, np.float32) * SCALE
+    quat = v[:, :4]
+    norm = np.sqrt(np.einsum('ij,ij->i', quat, quat))
+    quat /= np.where(norm > 0, norm, 1)[:, None]
+    return quat, v[:, 4:7], v[:, 7:10]
+
+
+def euler(quat, degrees=False):
+    '''(n, 3) roll, pitch and yaw (x, y, z rotations, applied z first) of
+    unit quaternions (w, x, y, z).'''
+    w, x, y, z = np.asarray(quat, np.float32).T
+    out = np.empty((len(w), 3), np.float32)
+    out[:, 0] = np.arctan2(2 * (w * x + y * z), 1 - 2 * (x * x + y * y))
+    out[:, 1] = np.arcsin(np.clip(2 * (w * y - z * x), -1, 1))
+    out[:, 2] = np.arctan2(2 * (w * z + x * y), 1 - 2 * (y * y + z * z))
+    if degrees:
+        np.degrees(out, out=out)
+    return out
+
+
+def rotation_matrix(quat):
+    '''(n, 3, 3) rotation matrices of unit quaternions (w, x, y, z).'''
+    w, x, y, z = np.asarray(quat, np.float32).T
+    m = np.empty((len(w), 3, 3), np.float32)
+    m[:, 0, 0] = 1 - 2 * (y * y + z * z)
+    m[:, 0, 1] = 2 * (x * y - w * z)
+    m[:, 0, 2] = 2 * (x * z + w * y)
+    m[:, 1, 0] = 2 * (x * y + w * z)
+    m[:, 1, 1] = 1 - 2 * (x * x + z * z)
+    m[:, 1, 2] = 2 * (y * z - w * x)
+    m[:, 2, 0] = 2 * (x * z - w * y)
+    m[:, 2, 1] = 2 * (y * z + w * x)
+    m[:, 2, 2] = 1 - 2 * (x * x + y * y)
+    return m
+
+
+class IMUBuffer(object):
+    '''Ring of the last `capacity` raw IMU rows and their arrival times.'''
+
+    def __init__(self, capacity=1 << 16):
+        self.capacity = capacity
+        self.raw = np.zeros((capacity, 10), '<i2')
+        self.t = np.zeros(capacity)
+        self.bytes = memoryview(self.raw).cast('B')
+        ## rows ever written, and the next row read() returns
+        self.head = 0
+        self.pos = 0
+        self.lost = 0
+
+    def attach(self, m, raw=True):
+        '''Collects m's IMU data: raw=True replaces its IMU decoding (its IMU
+        handlers stop being called), raw=False adds an IMU handler.'''
+        if raw:
+            m.register_attr(0x1c, RAW_IMU, self.on_raw)
+        else:
+            m.add_imu_handler(self.on_imu)
+
+    def on_raw(self, vals):
+        i = self.head % self.capacity
+        self.bytes[i * ROW_BYTES:(i + 1) * ROW_BYTES] = vals[0]
+        self.t[i] = time.time()
+        ## publish only once the row is complete
+        self.head += 1
+
+    def on_imu(self, quat, acc, gyro):
+        i = self.head % self.capacity
+        row = self.raw[i]
+        row[:4] = quat
+        row[4:7] = acc
+        row[7:] = gyro
+        self.t[i] = time.time()
+        self.head += 1
+
+    def extend(self, rows, t=None):
+        '''Appends a block of raw rows (e.g. from decode_block), stamped with
+        t (an array, or now).'''
+        rows = np.asarray(rows, '<i2')
+        if len(rows) > self.capacity:
+            self.head += len(rows) - self.capacity
+            rows = rows[-self.capacity:]
+            if t is not None and np.ndim(t):
+                t = t[-self.capacity:]
+        t = time.time() if t is None else t
+        i = self.head % self.capacity
+        n = min(len(rows), self.capacity - i)
+        self.raw[i:i + n] = rows[:n]
+        self.raw[:len(rows) - n] = rows[n:]
+        if np.ndim(t):
+            self.t[i:i + n] = t[:n]
+            self.t[:len(rows) - n] = t[n:]
+        else:
+            self.t[i:i + n] = t
+            self.t[:len(rows) - n] = t
+        self.head += len(rows)
+
+    def __len__(self):
+        return min(self.head, self.capacity)
+
+    def rows(self, start, end):
+        '''Copies of (times, raw rows) start..end, counted in rows ever
+        written, oldest first.'''
+        idx = np.arange(start, end) % self.capacity
+        return self.t[idx], self.raw[idx]
+
+    def read(self):
+        '''(times, raw rows) that arrived since the last read.'''
+        head = self.head
+        ## the row at head - capacity may be being overwritten right now
+        oldest = head - self.capacity + 1
+        if self.pos < oldest:
+            self.lost += oldest - self.pos
+            self.pos = oldest
+        start, self.pos = self.pos, head
+        return self.rows(start, head)
+
+    def latest(self, n):
+        '''(times, raw rows) of the last n rows (fewer at first).'''
+        head = self.head
+        return self.rows(head - min(n, len(self), self.capacity - 1), head)
+
+    def units(self, n=None):
+        '''(times, quat, acc, gyro) of the last n rows (all held if None).'''
+        t, raw = self.latest(self.capacity if n is None else n)
+        return (t,) + to_units(raw)
+
+
+if __name__ == '__main__':
+    from myo_raw import MyoRaw
+
+    m = MyoRaw(sys.argv[1] if len(sys.argv) >= 2 else None)
+    buf = IMUBuffer()
+    buf.attach(m)
+    m.connect()
+    try:
+        while True:
+            m.run(.2)
+            t, raw = buf.read()
+            if len(raw):
+                quat, acc, gyro = to_units(raw)
+                print('roll %7.1f pitch %7.1f yaw %7.1f  (%d frames)' % (tuple(euler(quat[-1:], True)[0]) + (len(raw),)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        m.disconnect()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Hot-path timing for MyoRaw.
+
+Off by default. m.enable_stats() returns a Stats that then collects:
+
+ - framing: time to frame each packet out of the read buffer
+ - decode: unpacking a notification in handle_data
+ - handler.<stream>[i] <name>: each EMG/IMU/pose/arm handler
+ - classify: Myo's classifier, per frame or per batch
+ - latency.<stream>: from the read that completed a packet (its t_recv)
+   to the end of its handlers; for Myo, latency.raw_pose runs from the EMG
+   packet to the end of the on_raw_pose handlers. With a reader thread
+   this includes the time spent queued.
+ - rates.<stream>: effective sample rate, and gaps, the silences longer
+   than GAP_FACTOR times the usual interval (lost or late frames)
+ - myo: decode errors, unknown attributes, bytes skipped to resync the
+   packet stream and frames dropped by a reader thread
+
+Timings go into log-linear histograms (HDR style: about 3% precision over
+nanoseconds to minutes, O(1) per value). snapshot() returns everything as
+a dict; serve() makes the same available as text on a local HTTP port.
+While off, the hot path only tests `stats is None`.
+'''
+
+from __future__ import print_function
+
+from collections import Counter
+import json
+import threading
+import time
+
+monotonic = getattr(time, 'monotonic', time.time)
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+class Histogram(object):
+    '''Counts of durations in buckets 2 ** -SUB_BITS wide relative to their
+    value.'''
+
+    SUB_BITS = 5
+
+    def __init__(self):
+        self.sub = 1 << self.SUB_BITS
+        self.counts = [0] * (64 * self.sub)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def index(self, v):
+        ## values below 2 * sub have buckets of their own; above that every
+        ## power of two is split into sub buckets
+        if v < 2 * self.sub:
+            return v
+        shift = v.bit_length() - self.SUB_BITS - 1
+        return shift * self.sub + (v >> shift)
+
+    def value(self, i):
+        '''Upper bound of bucket i, in ns.'''
+        if i < 2 * self.sub:
+            return i
+        shift = i // self.sub - 1
+        return ((i - shift * self.sub + 1) << shift) - 1
+
+    def record(self, seconds):
+        v = int(seconds * 1e9)
+        if v < 0: v = 0
+        self.counts[self.index(v)] += 1
+        self.count += 1
+        self.total += v
+        if self.min is None or v < self.min: self.min = v
+        if v > self.max: self.max = v
+
+    def percentile(self, q):
+        '''The q-th percentile in seconds (an upper bound within the bucket
+        precision).'''
+        if not self.count:
+            return 0.0
+        rank = q / 100. * self.count
+        n = 0
+        for i, c in enumerate(self.counts):
+            n += c
+            if c and n >= rank:
+                return min(self.value(i), self.max) * 1e-9
+        return self.max * 1e-9
+
+    def snapshot(self):
+        if not self.count:
+            return {'count': 0}
+        res = {
+            'count': self.count,
+            'mean_us': self.total / self.count / 1e3,
+            'min_us': self.min / 1e3,
+            'max_us': self.max / 1e3,
+        }
+        for q in PERCENTILES:
+            res['p%s_us' % q] = self.percentile(q) * 1e6
+        return res
+
+
+class RateMeter(object):
+    '''Events per second over windows of `window` seconds, and gaps:
+    intervals over gap_factor times the average interval of the last
+    window. Packets arrive in bursts, so single intervals say little;
+    only a silence much longer than usual counts.'''
+
+    GAP_FACTOR = 3.0
+
+    def __init__(self, window=1.0, gap_factor=GAP_FACTOR):
+        self.window = window
+        self.gap_factor = gap_factor
+        self.count = 0
+        self.gaps = 0
+        self.rate = 0.0
+        self.last = None
+        self.t0 = None
+        self.n = 0
+
+    def tick(self, t=None):
+        if t is None:
+            t = monotonic()
+        if self.last is None:
+            self.t0 = t
+        elif self.rate and (t - self.last) * self.rate > self.gap_factor:
+            self.gaps += 1
+        self.last = t
+        self.count += 1
+        self.n += 1
+        if t - self.t0 >= self.window:
+            self.rate = (self.n - 1) / (t - self.t0)
+            self.t0 = t
+            self.n = 1
+
+    def snapshot(self):
+        return {'count': self.count, 'rate': self.rate, 'gaps': self.gaps}
+
+
+def handler_name(i, h):
+    return '[%d] %s' % (i, getattr(h, '__qualname__', None) or getattr(h, '__name__', None) or type(h).__name__)
+
+
+class Stats(object):
+    '''Timers, rate meters and counters of one MyoRaw.'''
+
+    def __init__(self):
+        self.t_start = monotonic()
+        self.timers = {}
+        self.rates = {}
+        self.counters = Counter()
+        ## name -> function returning a dict merged into snapshot()
+        self.sources = {}
+        self.names = {}
+        self.server = None
+
+    def timer(self, name):
+        h = self.timers.get(name)
+        if h is None:
+            h = self.timers[name] = Histogram()
+        return h
+
+    def rate(self, name):
+        r = self.rates.get(name)
+        if r is None:
+            r = self.rates[name] = RateMeter()
+        return r
+
+    def call_handlers(self, stream, handlers, args):
+        '''Calls each handler with args, timing each one.'''
+        for i, h in enumerate(handlers):
+            t = monotonic()
+            h(*args)
+            dt = monotonic() - t
+            key = (stream, i, h)
+            name = self.names.get(key)
+            if name is None:
+                name = self.names[key] = 'handler.%s%s' % (stream, handler_name(i, h))
+            self.timer(name).record(dt)
+
+    def add_source(self, name, f):
+        self.sources[name] = f
+
+    def snapshot(self):
+        res = {
+            'uptime': monotonic() - self.t_start,
+            'timers': dict((k, h.snapshot()) for k, h in self.timers.items()),
+            'rates': dict((k, r.snapshot()) for k, r in self.rates.items()),
+            'counters': dict(self.counters),
+        }
+        for name, f in self.sources.items():
+            res[name] = f()
+        return res
+
+    def format(self):
+        '''snapshot() as "name value" lines.'''
+        lines = []
+        def walk(prefix, d):
+            for k in sorted(d, key=str):
+                v = d[k]
+                name = '%s.%s' % (prefix, k) if prefix else str(k)
+                if isinstance(v, dict):
+                    walk(name, v)
+                else:
+                    lines.append('%s %s' % (name, '%.3f' % v if isinstance(v, float) else v))
+        walk('', self.snapshot())
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port=8765, host='127.0.0.1'):
+        '''Serves format() (or the snapshot as JSON at /json) over HTTP on a
+        background thread; returns the server.'''
+        try:
+            from http.server import BaseHTTPRequestHandler, HTTPServer
+        except ImportError:
+            from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+        stats = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith('/json'):
+                    body, typ = json.dumps(stats.snapshot(), sort_keys=True, default=str), 'application/json'
+                else:
+                    body, typ = stats.format(), 'text/plain'
+                body = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', typ)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer((host, port), Handler)
+        th = threading.Thread(target=self.server.serve_forever)
+        th.daemon = True
+        th.start()
+        return self.server
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
@@ -1,20 +1,32 @@
+from __future__ import print_function
+
 import sys, termios, atexit
 from select import select
 
+# the terminal settings are read on first use, not at import
+fd = None
+new_term = None
+old_term = None
+
 # save the terminal settings
-fd = sys.stdin.fileno()
-new_term = termios.tcgetattr(fd)
-old_term = termios.tcgetattr(fd)
+def init_term():
+    global fd, new_term, old_term
+    if fd is None:
+        fd = sys.stdin.fileno()
+        new_term = termios.tcgetattr(fd)
+        old_term = termios.tcgetattr(fd)
 
-# new terminal setting unbuffered
-new_term[3] = (new_term[3] & ~termios.ICANON & ~termios.ECHO)
+        # new terminal setting unbuffered
+        new_term[3] = (new_term[3] & ~termios.ICANON & ~termios.ECHO)
 
 # switch to normal terminal
 def set_normal_term():
-    termios.tcsetattr(fd, termios.TCSAFLUSH, old_term)
+    if fd is not None:
+        termios.tcsetattr(fd, termios.TCSAFLUSH, old_term)
 
 # switch to unbuffered terminal
 def set_curses_term():
+    init_term()
     termios.tcsetattr(fd, termios.TCSAFLUSH, new_term)
 
 def putch(ch):
@@ -30,7 +42,7 @@ def getche():
 
 def kbhit():
     dr,dw,de = select([sys.stdin], [], [], 0)
-    return dr <> []
+    return dr != []
 
 if __name__ == '__main__':
     atexit.register(set_normal_term)
@@ -42,4 +54,4 @@ if __name__ == '__main__':
             break
         sys.stdout.write('.')
 
-    print 'done'
+    print('done')
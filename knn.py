@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Pure-NumPy batched k-nearest-neighbour classifier.
+
+Used by NNClassifier when sklearn isn't installed. Stored samples are kept as
+float32 (uint16 EMG values convert exactly, so nothing wraps around) together
+with their squared norms. Queries are answered a batch at a time by scanning
+the samples in blocks small enough to stay in cache, keeping the running K
+best per query with argpartition, then taking a majority vote.
+'''
+
+from __future__ import print_function
+
+import numpy as np
+
+
+class BlockKNN(object):
+    '''k-NN over samples added with fit()/add(); classify_batch() labels a
+    whole array of frames in one call. Ties in the vote go to the smallest
+    label, as in sklearn.'''
+
+    ## queries per batch and bytes of float32 distances handled per block
+    QUERY_BLOCK = 256
+    BLOCK_BYTES = 1 << 22
+
+    def __init__(self, k=15):
+        self.k = k
+        self.clear()
+
+    def clear(self):
+        self.X = np.zeros((0, 0), np.float32)
+        self.norms = np.zeros(0, np.float32)
+        self.Y = np.zeros(0, np.intp)
+        self.n = 0
+
+    def fit(self, X, Y):
+        self.clear()
+        self.add(X, Y)
+        return self
+
+    def add(self, X, Y):
+        '''Appends samples; storage grows by doubling.'''
+        X = np.atleast_2d(np.asarray(X, np.float32))
+        Y = np.asarray(Y).astype(np.intp)
+        end = self.n + len(X)
+        if self.n == 0:
+            self.X = np.zeros((0, X.shape[1]), np.float32)
+        if end > len(self.X):
+            cap = max(end, 2 * len(self.X), 1024)
+            Xn = np.empty((cap, X.shape[1]), np.float32)
+            Nn = np.empty(cap, np.float32)
+            Yn = np.empty(cap, np.intp)
+            Xn[:self.n] = self.X[:self.n]
+            Nn[:self.n] = self.norms[:self.n]
+            Yn[:self.n] = self.Y[:self.n]
+            self.X, self.norms, self.Y = Xn, Nn, Yn
+        self.X[self.n:end] = X
+        self.norms[self.n:end] = np.einsum('ij,ij->i', X, X)
+        self.Y[self.n:end] = Y
+        self.n = end
+
+    def kneighbors(self, Q):
+        '''Returns (squared distances, indices) of the k nearest samples for
+        each row of Q, nearest first.'''
+        Q = np.atleast_2d(np.asarray(Q, np.float32))
+        k = min(self.k, self.n)
+        dists = np.empty((len(Q), k), np.float32)
+        inds = np.empty((len(Q), k), np.intp)
+        for q in range(0, len(Q), self.QUERY_BLOCK):
+            dists[q:q + self.QUERY_BLOCK], inds[q:q + self.QUERY_BLOCK] = \
+                self.kneighbors_block(Q[q:q + self.QUERY_BLOCK], k)
+        return dists, inds
+
+    def kneighbors_block(self, Q, k):
+        ## |q - x|^2 = |q|^2 - 2 q.x + |x|^2; |q|^2 doesn't change the ranking,
+        ## so it is only added at the end
+        Qm2 = -2 * Q
+        block = max(k, self.BLOCK_BYTES // (4 * len(Q)))
+        rows = np.arange(len(Q))
+
+        best_d = best_i = None
+        for start in range(0, self.n, block):
+            stop = min(start + block, self.n)
+            d = Qm2.dot(self.X[start:stop].T)
+            d += self.norms[start:stop]
+
+            if best_d is None:
+                part = np.argpartition(d, k - 1, axis=1)[:, :k]
+                best_d = np.take_along_axis(d, part, 1)
+                best_i = part + start
+                continue
+
+            ## only samples closer than a row's current k-th best can enter it
+            r, c = np.nonzero(d < best_d.max(1)[:, None])
+            if not len(r):
+                continue
+            all_r = np.concatenate([np.repeat(rows, k), r])
+            all_d = np.concatenate([best_d.ravel(), d[r, c]])
+            all_i = np.concatenate([best_i.ravel(), c + start])
+            order = np.lexsort((all_d, all_r))
+            counts = np.bincount(all_r, minlength=len(Q))
+            rank = np.arange(len(order)) - (np.cumsum(counts) - counts)[all_r[order]]
+            keep = order[rank < k]
+            best_d = all_d[keep].reshape(len(Q), k)
+            best_i = all_i[keep].reshape(len(Q), k)
+
+        best_d += np.einsum('ij,ij->i', Q, Q)[:, None]
+        order = np.argsort(best_d, axis=1, kind='mergesort')
+        return np.take_along_axis(best_d, order, 1), np.take_along_axis(best_i, order, 1)
+
+    def classify_batch(self, frames):
+        '''Labels for each row of frames.'''
+        if self.n == 0:
+            return np.zeros(len(frames), np.intp)
+        _, inds = self.kneighbors(frames)
+        return vote(self.Y[inds])
+
+    def classify(self, d):
+        return int(self.classify_batch([d])[0])
+
+
+def vote(labels):
+    '''Majority label of each row of a (queries, k) array of non-negative
+    integer labels; ties go to the smallest label.'''
+    labels = np.asarray(labels).astype(np.intp)
+    nclasses = int(labels.max()) + 1 if labels.size else 1
+    rows = np.arange(len(labels))[:, None] * nclasses
+    votes = np.bincount((rows + labels).ravel(), minlength=len(labels) * nclasses)
+    return votes.reshape(len(labels), nclasses).argmax(1)
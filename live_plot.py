@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Live EMG plot.
+
+LivePlot keeps the last `window` seconds of EMG in a Recorder and redraws
+at a fixed frame rate, whatever the sample rate. Each redraw reduces every
+channel to a min and a max per horizontal pixel, so the number of points
+drawn depends on the plot's width, not on how many samples the window
+holds, and only the lines are redrawn (blitting) over a cached background.
+
+Samples arrive through on_emg, normally on a MyoRaw reader thread (see
+myo_reader), and are only appended under a lock; all drawing happens in
+poll(), which the main thread calls from its own loop, so the reader never
+waits for a frame to be drawn. Agg holds the GIL while it rasterizes,
+though, which can delay the reader by a few milliseconds (the OS buffers
+the port meanwhile). For complete isolation, plot from another process
+that follows a shm_ring published by the acquiring one.
+
+    python live_plot.py [white|black] [tty]
+    python live_plot.py --ring [name] [white|black]
+'''
+
+from __future__ import print_function
+
+import sys
+import threading
+import time
+
+import numpy as np
+
+from emg_recorder import Recorder
+
+## electrode labels of EMG0..EMG7 on each armband
+CHANNEL_LABELS = {
+    'black': ['EMG D', 'EMG E', 'EMG F', 'EMG G', 'EMG H', 'EMG A', 'EMG B', 'EMG C'],
+    'white': ['EMG F', 'EMG G', 'EMG H', 'EMG A', 'EMG B', 'EMG C', 'EMG D', 'EMG E'],
+}
+CHANNEL_COLORS = ['black', 'red', 'green', 'blue', 'sienna', 'greenyellow', 'lightsalmon', 'lightpink']
+
+
+def minmax_decimate(t, y, bins):
+    '''Reduces samples (t, y), with y of shape (n, channels), to the first
+    time, minimum and maximum of each of `bins` equal runs of samples.
+    Returns (t, y) with 2 * bins rows, drawing the same envelope as the
+    full data. Data that fits in 2 * bins rows is returned unchanged.'''
+    n = len(t)
+    if n <= 2 * bins:
+        return t, y
+    per = n // bins
+    ## drop the oldest samples that don't fill a run
+    start = n - per * bins
+    yb = y[start:].reshape(bins, per, -1)
+    out_y = np.empty((bins, 2, y.shape[1]), y.dtype)
+    out_y[:, 0] = yb.min(1)
+    out_y[:, 1] = yb.max(1)
+    tb = t[start::per][:bins]
+    out_t = np.repeat(tb, 2)
+    return out_t, out_y.reshape(2 * bins, -1)
+
+
+class LivePlot(object):
+    '''Rolling plot of the last `window` seconds of EMG at `fps` frames per
+    second. myo picks the channel labels ('white' or 'black').'''
+
+    def __init__(self, window=5.0, fps=30, myo='white', channels=8, rate=1000, ylim=None):
+        ## enough rows for the window at up to `rate` samples per second
+        self.recorder = Recorder(channels + 1, retention=int(window * rate))
+        self.lock = threading.Lock()
+        self.window = window
+        self.fps = fps
+        self.myo = myo
+        self.channels = channels
+        self.ylim = ylim
+        self.t_start = None
+        self.next_frame = 0
+        self.frames = 0
+        self.fig = None
+        self.ring = None
+
+    def attach(self, m):
+        m.add_emg_handler(self.on_emg)
+
+    def on_emg(self, emg, moving=None):
+        now = time.time()
+        if self.t_start is None:
+            self.t_start = now
+        with self.lock:
+            self.recorder.append((now - self.t_start,) + tuple(emg))
+
+    def follow(self, name):
+        '''Takes samples from the shm_ring `name` instead of on_emg.'''
+        from shm_ring import RingReader
+        self.ring = RingReader(name, latest=True)
+
+    def pull(self):
+        while self.ring.behind:
+            f = self.ring.read()
+            if self.t_start is None and len(f):
+                self.t_start = f['t'][0]
+            rows = np.empty((len(f), self.channels + 1))
+            rows[:, 0] = f['t'] - self.t_start
+            rows[:, 1:] = f['emg'][:, :self.channels]
+            if not self.ring.intact():
+                continue
+            with self.lock:
+                self.recorder.extend(rows)
+
+    def open(self):
+        from matplotlib import pyplot as plt
+        self.fig, self.ax = plt.subplots()
+        ax = self.ax
+        labels = CHANNEL_LABELS[self.myo]
+        self.lines = [ax.plot([], [], label=labels[i], color=CHANNEL_COLORS[i], animated=True)[0]
+                      for i in range(self.channels)]
+        ax.set_xlim(-self.window, 0)
+        ax.set_ylim(*(self.ylim or (0, 1)))
+        ax.set_xlabel("Time[sec]", fontsize=16)
+        ax.set_ylabel("EMG", fontsize=16)
+        ax.grid()
+        ax.legend(loc=1, fontsize=16)
+        self.background = None
+        self.fig.canvas.mpl_connect('draw_event', self.on_draw)
+        plt.show(block=False)
+        self.fig.canvas.draw()
+        return self
+
+    def on_draw(self, event):
+        ## anything but the lines changed (first draw, resize, new limits)
+        self.background = self.fig.canvas.copy_from_bbox(self.ax.bbox)
+        self.draw_lines()
+
+    def closed(self):
+        from matplotlib import pyplot as plt
+        return self.fig is None or not plt.fignum_exists(self.fig.number)
+
+    def poll(self):
+        '''Redraws if a frame is due and handles GUI events; returns at once
+        otherwise. Call it often from the main thread.'''
+        if self.fig is None:
+            self.open()
+        if self.ring is not None:
+            self.pull()
+        now = time.time()
+        if now >= self.next_frame:
+            self.next_frame = max(self.next_frame + 1. / self.fps, now)
+            self.redraw()
+        self.fig.canvas.flush_events()
+
+    def snapshot(self):
+        with self.lock:
+            return self.recorder.data.copy()
+
+    def redraw(self):
+        data = self.snapshot()
+        if not len(data):
+            return
+        t = data[:, 0] - data[-1, 0]
+        keep = t >= -self.window
+        t, y = minmax_decimate(t[keep], data[keep, 1:], max(int(self.ax.bbox.width), 1))
+        for i, line in enumerate(self.lines):
+            line.set_data(t, y[:, i])
+        self.frames += 1
+
+        ## rescaling needs a full draw (which calls draw_lines); otherwise
+        ## only the lines are drawn over the saved background
+        if self.ylim is None:
+            lo, hi = self.ax.get_ylim()
+            if y.min() < lo or y.max() > hi:
+                self.ax.set_ylim(min(lo, y.min()), max(hi, y.max() * 1.1))
+                self.fig.canvas.draw()
+                return
+        self.draw_lines()
+
+    def draw_lines(self):
+        if self.background is None:
+            return
+        canvas = self.fig.canvas
+        canvas.restore_region(self.background)
+        for line in self.lines:
+            self.ax.draw_artist(line)
+        canvas.blit(self.ax.bbox)
+
+    def wait(self, timeout):
+        '''Runs the GUI event loop for up to timeout seconds or until the
+        next frame is due.'''
+        remaining = min(timeout, self.next_frame - time.time())
+        if remaining > 0:
+            self.fig.canvas.start_event_loop(remaining)
+
+
+def show(plot):
+    plot.open()
+    while not plot.closed():
+        plot.poll()
+        plot.wait(1. / plot.fps)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if args[:1] == ['--ring']:
+        from shm_ring import NAME
+        plot = LivePlot(myo=args[2] if len(args) >= 3 else 'white')
+        plot.follow(args[1] if len(args) >= 2 else NAME)
+        try:
+            show(plot)
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    from myo_raw import MyoRaw
+
+    m = MyoRaw(args[1] if len(args) >= 2 else None)
+    plot = LivePlot(myo=args[0] if args else 'white')
+    plot.attach(m)
+    m.connect()
+    m.start_reader()
+    try:
+        show(plot)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        m.disconnect()
+        m.stop_reader()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Fitted classifiers cached on disk and in memory.
+
+Fitting the kd-tree of a large training set takes long enough to delay the
+first classification by seconds. ModelCache.get() saves each fitted model
+next to its training data (<path>.model, written with joblib) under a key
+that includes a hash of the data (TrainingStore.fingerprint) and the
+fitting parameters. On the next start the model is loaded from there with
+its arrays memory-mapped, so it costs little more than opening the file;
+when the data or the parameters changed the key doesn't match and the
+model is fitted and saved again. The last few models are also kept in
+memory, so switching between datasets (NNClassifier.open) doesn't even
+reload them.
+'''
+
+from __future__ import print_function
+
+from collections import Counter, OrderedDict
+import os
+import threading
+
+SUFFIX = '.model'
+
+
+class ModelCache(object):
+    '''Keeps the maxsize most recently used models in memory, and each
+    dataset's latest model on disk.'''
+
+    def __init__(self, maxsize=4):
+        self.maxsize = maxsize
+        ## key -> model, least recently used first
+        self.models = OrderedDict()
+        self.lock = threading.Lock()
+        ## where models came from: 'memory', 'disk' or 'fit'
+        self.sources = Counter()
+
+    def get(self, path, key, fit):
+        '''The model for the dataset at path with the given key: from memory,
+        from path + SUFFIX, or fit() (and then saved there).'''
+        with self.lock:
+            model = self.models.get(key)
+            if model is not None:
+                self.models.pop(key)
+                self.models[key] = model
+                self.sources['memory'] += 1
+                return model
+
+        model = self.load(path, key)
+        if model is not None:
+            self.sources['disk'] += 1
+        else:
+            model = fit()
+            self.sources['fit'] += 1
+            self.save(path, key, model)
+
+        with self.lock:
+            self.models[key] = model
+            while len(self.models) > self.maxsize:
+                self.models.popitem(last=False)
+        return model
+
+    def load(self, path, key):
+        '''The model saved for path if it was saved under key, else None.'''
+        try:
+            import joblib
+            saved = joblib.load(path + SUFFIX, mmap_mode='r')
+        except Exception:
+            ## missing, damaged or written by another sklearn version: refit
+            return None
+        if not isinstance(saved, dict) or saved.get('key') != key:
+            return None
+        return saved['model']
+
+    def save(self, path, key, model):
+        try:
+            import joblib
+        except ImportError:
+            return
+        tmp = path + SUFFIX + '.tmp'
+        try:
+            joblib.dump({'key': key, 'model': model}, tmp)
+            os.replace(tmp, path + SUFFIX)
+        except (IOError, OSError) as e:
+            print('could not save model: %s' % e)
+
+    def clear(self):
+        with self.lock:
+            self.models.clear()
+
+
+## shared by every NNClassifier
+models = ModelCache()
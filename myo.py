@@ -1,98 +1,301 @@
 from __future__ import print_function
 
-from collections import Counter, deque
 import sys
+import threading
 import time
 
 import numpy as np
 
-try:
-    from sklearn import neighbors, svm
-    HAVE_SK = True
-except ImportError:
-    HAVE_SK = False
+## sklearn takes a second or more to import, so it is only imported once a
+## classifier is built (see load_sklearn); None until then
+HAVE_SK = None
+SK_VERSION = None
+neighbors = None
 
-from common import *
+from instrument import monotonic
+from knn import BlockKNN, vote
+import model_cache
+from pose_vote import PoseVoter
 from myo_raw import MyoRaw
+from training_store import TrainingStore
 
 SUBSAMPLE = 3
 K = 15
+TRAINING_PATH = 'training.myo'
+
+def load_sklearn():
+    '''Imports sklearn's neighbors module if it hasn't been tried yet;
+    returns whether it is available.'''
+    global HAVE_SK, SK_VERSION, neighbors
+    if HAVE_SK is None:
+        try:
+            from sklearn import neighbors
+            import sklearn
+            SK_VERSION = sklearn.__version__
+            HAVE_SK = True
+        except ImportError:
+            HAVE_SK = False
+    return HAVE_SK
 
 class NNClassifier(object):
     '''A wrapper for sklearn's nearest-neighbor classifier that stores
-    training data in vals0, ..., vals9.dat.'''
+    training data in a TrainingStore (importing vals0, ..., vals9.dat from
+    older versions the first time).
+
+    Recorded samples go into arrays that grow by doubling. Samples added since
+    the kd-tree was last fitted are searched by brute force next to it, and
+    once there are DELTA_MAX of them the tree is refitted in a background
+    thread, so storing a sample costs O(1) and predictions are the same as
+    with a tree fitted on everything.
+
+    The tree fitted on the stored data is cached (see model_cache), so it
+    is only refitted at startup when the data has changed.'''
+
+    DELTA_MAX = 2000
 
-    def __init__(self):
-        for i in range(10):
-            with open('vals%d.dat' % i, 'ab') as f: pass
+    def __init__(self, path=TRAINING_PATH, models=None):
+        load_sklearn()
+        self.rebuilding = None
+        self.generation = 0
+        self.models = model_cache.models if models is None else models
+        self.store = None
+        self.open(path)
+
+    def open(self, path):
+        '''Switches to the training data at path, e.g. another user's.'''
+        if self.store is not None:
+            self.store.close()
+        self.store = TrainingStore(path)
+        if self.store.created:
+            self.store.import_vals()
         self.read_data()
 
-    def store_data(self, cls, vals):
-        with open('vals%d.dat' % cls, 'ab') as f:
-            f.write(pack('8H', *vals))
+    @property
+    def X(self):
+        return self._X[:self.n]
 
-        self.train(np.vstack([self.X, vals]), np.hstack([self.Y, [cls]]))
+    @property
+    def Y(self):
+        return self._Y[:self.n]
+
+    @property
+    def nn(self):
+        return self.tree[0]
+
+    def store_data(self, cls, vals):
+        self.store.append(cls, vals)
+        self.append(cls, vals)
 
     def read_data(self):
-        X = []
-        Y = []
-        for i in range(10):
-            X.append(np.fromfile('vals%d.dat' % i, dtype=np.uint16).reshape((-1, 8)))
-            Y.append(i + np.zeros(X[-1].shape[0]))
-
-        self.train(np.vstack(X), np.hstack(Y))
-
-    def train(self, X, Y):
-        self.X = X
-        self.Y = Y
-        if HAVE_SK and self.X.shape[0] >= K * SUBSAMPLE:
-            self.nn = neighbors.KNeighborsClassifier(n_neighbors=K, algorithm='kd_tree')
-            self.nn.fit(self.X[::SUBSAMPLE], self.Y[::SUBSAMPLE])
+        ## memory-mapped views; append() copies them out once recording starts
+        X, Y = self.store.load()
+        self.train(X, Y, cached=True)
+
+    def close(self):
+        self.store.close()
+
+    def train(self, X, Y, cached=False):
+        '''Replaces the samples with X, Y and fits on them; cached=True if they
+        are the store's, so the fitted tree can come from the model cache.'''
+        self._X = X
+        self._Y = Y
+        self.n = X.shape[0]
+        if cached and HAVE_SK and self.n >= K * SUBSAMPLE:
+            key = (self.store.fingerprint(), K, SUBSAMPLE, 'kd_tree', SK_VERSION)
+            nn = self.models.get(self.store.path, key, lambda: self.fit(self.n))
         else:
-            self.nn = None
+            nn = self.fit(self.n)
+        ## (fitted classifier or None, number of samples it was fitted on)
+        self.tree = (nn, self.n)
+        self.generation += 1
+        if not HAVE_SK:
+            self.engine = BlockKNN(K).fit(X[::SUBSAMPLE], Y[::SUBSAMPLE])
+
+    def append(self, cls, vals):
+        if self.n == self._X.shape[0]:
+            cap = max(2 * self.n, 1024)
+            X = np.empty((cap, self._X.shape[1]), self._X.dtype)
+            Y = np.empty(cap, self._Y.dtype)
+            X[:self.n] = self._X[:self.n]
+            Y[:self.n] = self._Y[:self.n]
+            self._X, self._Y = X, Y
+        self._X[self.n] = vals
+        self._Y[self.n] = cls
+        self.n += 1
 
-    def nearest(self, d):
-        dists = ((self.X - d)**2).sum(1)
-        ind = dists.argmin()
-        return self.Y[ind]
+        if not HAVE_SK:
+            if (self.n - 1) % SUBSAMPLE == 0:
+                self.engine.add([vals], [cls])
+            return
+        if self.n < K * SUBSAMPLE:
+            return
+        nn, fitted = self.tree
+        if nn is None:
+            ## first time there is enough data; small enough to fit in place
+            self.tree = (self.fit(self.n), self.n)
+        elif self.n - fitted >= self.DELTA_MAX and self.rebuilding is None:
+            self.rebuilding = threading.Thread(target=self.rebuild,
+                                              args=(self._X, self._Y, self.n, self.generation))
+            self.rebuilding.daemon = True
+            self.rebuilding.start()
+
+    def fit(self, n, X=None, Y=None):
+        X = self._X if X is None else X
+        Y = self._Y if Y is None else Y
+        if HAVE_SK and n >= K * SUBSAMPLE:
+            nn = neighbors.KNeighborsClassifier(n_neighbors=K, algorithm='kd_tree')
+            nn.fit(X[:n:SUBSAMPLE], Y[:n:SUBSAMPLE])
+            return nn
+        return None
+
+    def rebuild(self, X, Y, n, generation):
+        ## rows below n never change, so fitting on them needs no locking;
+        ## the result is dropped if the data was reloaded in the meantime
+        nn = self.fit(n, X, Y)
+        if generation == self.generation:
+            self.tree = (nn, n)
+        self.rebuilding = None
 
     def classify(self, d):
-        if self.X.shape[0] < K * SUBSAMPLE: return 0
-        if not HAVE_SK: return self.nearest(d)
-        return int(self.nn.predict(d)[0])
+        return int(self.classify_batch([d])[0])
+
+    def classify_batch(self, frames):
+        '''Labels for each row of frames, classified in one call.'''
+        if self.n < K * SUBSAMPLE: return np.zeros(len(frames), int)
+        if not HAVE_SK: return self.engine.classify_batch(frames)
+
+        nn, fitted = self.tree
+        n = self.n
+        if fitted == n:
+            return nn.predict(frames).astype(int)
+
+        ## merge the tree's K nearest with the samples added since it was
+        ## fitted, keeping the same SUBSAMPLE stride
+        Q = np.asarray(frames, float)
+        dists, inds = nn.kneighbors(Q)
+        start = -(-fitted // SUBSAMPLE) * SUBSAMPLE
+        delta = self._X[start:n:SUBSAMPLE].astype(float)
+        delta_dists = np.sqrt(((delta[None, :, :] - Q[:, None, :])**2).sum(2))
+
+        dists = np.concatenate([dists, delta_dists], axis=1)
+        labels = np.concatenate([self._Y[inds * SUBSAMPLE],
+                                 np.broadcast_to(self._Y[start:n:SUBSAMPLE], delta_dists.shape)], axis=1)
+        nearest = np.argsort(dists, axis=1, kind='mergesort')[:, :K]
+        return vote(np.take_along_axis(labels, nearest, 1))
 
 
 class Myo(MyoRaw):
-    '''Adds higher-level pose classification and handling onto MyoRaw.'''
+    '''Adds higher-level pose classification and handling onto MyoRaw.
+
+    With batch_size > 1, EMG frames are queued and classified together once
+    batch_size of them are waiting or the oldest has waited max_latency
+    seconds; the pose vote is then replayed frame by frame, so on_raw_pose
+    fires exactly as it would unbatched, only later. batch_latency and
+    max_batch_latency record the delay that batching added.
+
+    With a reader thread running, emg_handler is called on its consumer
+    thread while run() may flush from the caller's, so the batch is locked;
+    other threads should read the vote through votes(), not history_cnt.'''
 
     HIST_LEN = 25
+    MARGIN = 5
 
-    def __init__(self, cls, tty=None):
+    def __init__(self, cls, tty=None, batch_size=1, max_latency=None):
         MyoRaw.__init__(self, tty)
         self.cls = cls
 
-        self.history = deque([0] * Myo.HIST_LEN, Myo.HIST_LEN)
-        self.history_cnt = Counter(self.history)
+        ## pose_vote.replay reproduces this offline
+        self.voter = PoseVoter(self.HIST_LEN, self.MARGIN)
+        self.history = self.voter.history
+        self.history_cnt = self.voter.counts
+        self.vote_lock = threading.Lock()
         self.add_emg_handler(self.emg_handler)
         self.last_pose = None
 
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.pending = []
+        self.pending_t0 = None
+        self.pending_lock = threading.Lock()
+        self.batch_latency = 0.0
+        self.max_batch_latency = 0.0
+
         self.pose_handlers = []
 
     def emg_handler(self, emg, moving):
-        y = self.cls.classify(emg)
-        self.history_cnt[self.history[0]] -= 1
-        self.history_cnt[y] += 1
-        self.history.append(y)
+        if self.batch_size <= 1:
+            if self.stats is None:
+                self.vote(self.cls.classify(emg))
+            else:
+                t = monotonic()
+                y = self.cls.classify(emg)
+                self.stats.timer('classify').record(monotonic() - t)
+                self.vote(y)
+            return
+
+        with self.pending_lock:
+            if not self.pending:
+                self.pending_t0 = time.time()
+            self.pending.append(emg)
+            if len(self.pending) >= self.batch_size or \
+               (self.max_latency is not None and time.time() - self.pending_t0 >= self.max_latency):
+                self.flush_locked()
 
-        r, n = self.history_cnt.most_common(1)[0]
-        if self.last_pose is None or (n > self.history_cnt[self.last_pose] + 5 and n > Myo.HIST_LEN / 2):
+    def flush(self):
+        '''Classifies the queued frames and replays the vote over them.'''
+        with self.pending_lock:
+            self.flush_locked()
+
+    def flush_locked(self):
+        if not self.pending: return
+        frames = self.pending
+        self.pending = []
+
+        t = monotonic()
+        classify_batch = getattr(self.cls, 'classify_batch', None)
+        if classify_batch is not None:
+            ys = classify_batch(frames)
+        else:
+            ys = [self.cls.classify(d) for d in frames]
+        if self.stats is not None:
+            self.stats.timer('classify_batch').record(monotonic() - t)
+
+        self.batch_latency = time.time() - self.pending_t0
+        self.max_batch_latency = max(self.max_batch_latency, self.batch_latency)
+        for y in ys:
+            self.vote(int(y))
+
+    def vote(self, y):
+        with self.vote_lock:
+            r = self.voter.vote(y)
+        if r is not None:
             self.on_raw_pose(r)
             self.last_pose = r
 
+    def votes(self):
+        '''A consistent copy of the vote: (most common label, {label: votes},
+        window length).'''
+        with self.vote_lock:
+            return self.history_cnt.most_common(1)[0][0], dict(self.history_cnt), len(self.history)
+
+    def run(self, timeout=None):
+        ## don't let a partial batch wait past max_latency just because no
+        ## more frames arrive; this may return before timeout has passed
+        if self.pending and self.max_latency is not None:
+            remaining = max(self.pending_t0 + self.max_latency - time.time(), 0)
+            if timeout is None or remaining < timeout:
+                p = MyoRaw.run(self, remaining)
+                if self.pending and time.time() - self.pending_t0 >= self.max_latency:
+                    self.flush()
+                return p
+        return MyoRaw.run(self, timeout)
+
     def add_raw_pose_handler(self, h):
         self.pose_handlers.append(h)
 
     def on_raw_pose(self, pose):
+        if self.stats is not None:
+            return self.call_handlers('raw_pose', 0x27, self.pose_handlers, (pose,))
         for h in self.pose_handlers:
             h(pose)
 
@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''asyncio front end for MyoRaw (Python 3 only).
+
+AsyncMyo registers the serial port's file descriptor with the event loop,
+so bytes are read, framed and decoded on the loop's own thread as they
+arrive, with no helper threads. Commands go through the same BT command
+layer as MyoRaw; their CommandFutures are wrapped in asyncio futures.
+
+    async with AsyncMyo() as myo:
+        await myo.connect()
+        async for emg, moving in myo.emg():
+            ...
+
+Every iterator has its own bounded buffer. When a subscriber falls
+maxlen values behind, overflow='drop_oldest' discards its oldest value
+(counted in Subscription.dropped) and overflow='block' stops reading
+the port until it has caught up, so the backlog stays in the OS buffer
+and the other subscribers wait too. Reading goes on while a command or
+event is awaited, though, or its response would never be read; the full
+subscriber's buffer grows past maxlen meanwhile.
+'''
+
+from __future__ import print_function
+
+import asyncio
+from collections import deque
+
+from common import *
+from myo_raw import MyoRaw, is_myo, multiord
+from myo_reader import OVERFLOW
+
+
+class Subscription(object):
+    '''Async iterator over the values one MyoRaw handler list receives.'''
+
+    def __init__(self, owner, handlers, maxlen=256, overflow='drop_oldest'):
+        if overflow not in OVERFLOW:
+            raise ValueError('overflow must be one of %s' % (OVERFLOW,))
+        self.owner = owner
+        self.handlers = handlers
+        self.maxlen = maxlen
+        self.overflow = overflow
+        self.items = deque()
+        self.waiter = None
+        self.closed = False
+        self.dropped = 0
+        handlers.append(self.push)
+
+    def push(self, *vals):
+        if len(vals) == 1:
+            vals = vals[0]
+        if len(self.items) >= self.maxlen:
+            if self.overflow == 'block':
+                ## the rest of the chunk being decoded still comes through
+                self.owner.pause(self)
+            else:
+                self.items.popleft()
+                self.dropped += 1
+        self.items.append(vals)
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self.items:
+            if self.closed:
+                raise StopAsyncIteration
+            self.waiter = self.owner.loop.create_future()
+            await self.waiter
+            self.waiter = None
+        vals = self.items.popleft()
+        if len(self.items) <= self.maxlen // 2:
+            self.owner.resume(self)
+        return vals
+
+    def close(self):
+        '''Ends the iteration once the buffered values are consumed.'''
+        if self.closed:
+            return
+        self.closed = True
+        try: self.handlers.remove(self.push)
+        except ValueError: pass
+        self.owner.resume(self)
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+
+class AsyncMyo(object):
+    '''Coroutine interface to one Myo; the MyoRaw underneath is `myo`.
+
+    Ports without a file descriptor (e.g. a myo_capture.ReplaySerial) are
+    polled every `poll` seconds instead.'''
+
+    def __init__(self, tty=None, capture=None, loop=None, poll=0.005):
+        self.myo = MyoRaw(tty, capture)
+        self.bt = self.myo.bt
+        self.loop = loop or asyncio.get_event_loop()
+        self.poll = poll
+        self.subscriptions = []
+        self.paused = set()
+        ## commands and events being awaited; the port is read while any are
+        self.awaiting = 0
+        self.fd = None
+        self.poller = None
+        self.reading = False
+        self.error = None
+
+        self.bt.set_timeout(0)
+        try:
+            self.fd = self.bt.ser.fileno()
+        except (AttributeError, ValueError, OSError):
+            self.fd = None
+        self.start_reading()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    ## reading
+    def start_reading(self):
+        if self.reading or self.bt.ser is None:
+            return
+        self.reading = True
+        if self.fd is not None:
+            self.loop.add_reader(self.fd, self.on_readable)
+        elif self.poller is None:
+            self.poller = self.loop.create_task(self.poll_port())
+
+    def stop_reading(self):
+        if not self.reading:
+            return
+        self.reading = False
+        if self.fd is not None:
+            self.loop.remove_reader(self.fd)
+
+    def pause(self, sub):
+        self.paused.add(sub)
+        if not self.awaiting:
+            self.stop_reading()
+
+    def resume(self, sub):
+        self.paused.discard(sub)
+        if not self.paused and self.error is None:
+            self.start_reading()
+
+    async def poll_port(self):
+        while self.error is None:
+            if self.reading:
+                self.on_readable()
+            await asyncio.sleep(self.poll)
+        self.poller = None
+
+    def on_readable(self):
+        bt = self.bt
+        try:
+            bt.fill()
+        except Exception as e:
+            self.fail(e)
+            return
+        while True:
+            p = bt.next_packet()
+            if p is None:
+                break
+            bt.dispatch(p)
+
+    def fail(self, e):
+        '''The port is gone: stop reading and end every iterator.'''
+        self.error = e
+        self.stop_reading()
+        for sub in list(self.subscriptions):
+            sub.close()
+
+    ## commands
+    def wrap(self, f):
+        '''asyncio future for a CommandFuture, resolving to its packet. The
+        port is read until it is done or cancelled, even if paused.'''
+        af = self.loop.create_future()
+        def done(f):
+            if not af.done():
+                af.set_result(f.packet)
+        self.awaiting += 1
+        af.add_done_callback(self.awaited)
+        if self.error is None:
+            self.start_reading()
+        f.add_done_callback(done)
+        return af
+
+    def awaited(self, af):
+        self.awaiting -= 1
+        if self.paused and not self.awaiting:
+            self.stop_reading()
+
+    def wait_event(self, cls, cmd, cond=None):
+        '''Future for the next event (cls, cmd) for which cond(p) holds. Call
+        it before sending the command that causes the event.'''
+        f = self.bt.wait_event_async(cls, cmd, cond)
+        af = self.wrap(f)
+        ## e.g. cancelled by a timeout
+        af.add_done_callback(lambda af: self.bt.remove_handler(f.handler))
+        return af
+
+    async def command(self, cls, cmd, payload=b''):
+        return await self.wrap(self.bt.send_command_async(cls, cmd, payload))
+
+    async def connect(self, timeout=None):
+        '''Scans for a Myo, connects and starts streaming, like
+        MyoRaw.connect.'''
+        m, bt = self.myo, self.bt
+
+        ## stop everything from before
+        await self.wrap(bt.end_scan(wait_resp=False))
+        for c in range(3):
+            await self.wrap(bt.disconnect(c, wait_resp=False))
+
+        scan = self.wait_event(6, 0, is_myo)
+        await self.wrap(bt.discover(wait_resp=False))
+        try:
+            p = await asyncio.wait_for(scan, timeout)
+        except asyncio.TimeoutError:
+            await self.wrap(bt.end_scan(wait_resp=False))
+            raise
+        addr = list(multiord(p.payload[2:8]))
+        await self.wrap(bt.end_scan(wait_resp=False))
+
+        ## connect and wait for status event
+        status = self.wait_event(3, 0, lambda p: p.payload[0] == m.conn)
+        f = bt.connect(addr, wait_resp=False)
+        ## the status event can be decoded together with the response, before
+        ## this coroutine resumes
+        f.add_done_callback(lambda f: setattr(m, 'conn', f.packet.payload[-1]))
+        await self.wrap(f)
+        m.addr = bytes(addr)
+        try:
+            await asyncio.wait_for(status, timeout)
+        except asyncio.TimeoutError:
+            ## cancel the attempt, or the dongle stays busy with it: this is
+            ## end_procedure, which shares its id with end_scan
+            await self.wrap(bt.end_scan(wait_resp=False))
+            m.conn = None
+            raise
+
+        m.set_firmware(await self.read_attr(0x17))
+        await self.write_attrs(m.config_writes(), coalesce=False)
+        bt.add_handler(m.handle_data)
+
+    async def read_attr(self, attr):
+        return await self.wrap(self.bt.read_attr_async(self.myo.conn, attr))
+
+    async def write_attr(self, attr, val, coalesce=True, ack=True):
+        '''Writes val to attr and returns the completing packet (see
+        BT.write_attr_async).'''
+        f = self.myo.write_attr_async(attr, val, coalesce, ack)
+        if f is None:
+            return None
+        return await self.wrap(f)
+
+    async def write_attrs(self, writes, coalesce=True):
+        '''Queues all the writes at once and waits for the last (see
+        MyoRaw.write_attrs).'''
+        f = None
+        for attr, val in writes:
+            f = self.myo.write_attr_async(attr, val, coalesce) or f
+        if f is not None:
+            return await self.wrap(f)
+        return None
+
+    async def vibrate(self, length):
+        if length in range(1, 4):
+            return await self.write_attr(0x19, pack('3B', 3, 1, length), coalesce=False)
+
+    async def disconnect(self):
+        if self.myo.conn is not None:
+            await self.wrap(self.bt.disconnect(self.myo.conn, wait_resp=False))
+            self.myo.conn = None
+
+    async def close(self):
+        for sub in list(self.subscriptions):
+            sub.close()
+        if self.error is None and self.myo.conn is not None:
+            await self.disconnect()
+        self.stop_reading()
+        self.error = self.error or EOFError('closed')
+        if self.poller is not None:
+            self.poller.cancel()
+            self.poller = None
+        self.bt.close()
+
+    ## streams
+    def subscribe(self, handlers, maxlen=256, overflow='drop_oldest'):
+        sub = Subscription(self, handlers, maxlen, overflow)
+        self.subscriptions.append(sub)
+        return sub
+
+    def emg(self, maxlen=256, overflow='drop_oldest'):
+        '''Iterator of (emg, moving).'''
+        return self.subscribe(self.myo.emg_handlers, maxlen, overflow)
+
+    def imu(self, maxlen=256, overflow='drop_oldest'):
+        '''Iterator of (quat, acc, gyro).'''
+        return self.subscribe(self.myo.imu_handlers, maxlen, overflow)
+
+    def pose(self, maxlen=256, overflow='drop_oldest'):
+        '''Iterator of Pose values.'''
+        return self.subscribe(self.myo.pose_handlers, maxlen, overflow)
+
+    def arm(self, maxlen=256, overflow='drop_oldest'):
+        '''Iterator of (arm, xdir).'''
+        return self.subscribe(self.myo.arm_handlers, maxlen, overflow)
+
+
+if __name__ == '__main__':
+    import sys
+
+    async def main(tty):
+        async with AsyncMyo(tty) as myo:
+            await myo.connect()
+            async for emg, moving in myo.emg():
+                print(emg, moving)
+
+    try:
+        asyncio.run(main(sys.argv[1] if len(sys.argv) >= 2 else None))
+    except KeyboardInterrupt:
+        pass
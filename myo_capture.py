@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Raw BGAPI capture files and a transport that replays them.
+
+A capture starts with MAGIC and the wall-clock start time (float64), followed
+by one record per chunk read from the dongle: the time since the start of the
+capture (float64), the chunk length (uint32) and the chunk itself. Everything
+is little-endian.
+
+    python myo_capture.py record session.cap [tty]
+    python myo_capture.py replay session.cap [--realtime] [--speed X] [--connect]
+'''
+
+from __future__ import print_function
+
+import struct
+import sys
+import time
+
+MAGIC = b'MYOCAP\x00\x01'
+START = struct.Struct('<d')
+RECORD = struct.Struct('<dI')
+
+
+class CaptureWriter(object):
+    '''Appends every chunk passed to write() to a capture file.'''
+
+    def __init__(self, path):
+        self.f = open(path, 'wb')
+        self.t0 = time.time()
+        self.f.write(MAGIC + START.pack(self.t0))
+
+    def write(self, data):
+        self.f.write(RECORD.pack(time.time() - self.t0, len(data)))
+        self.f.write(data)
+
+    def close(self):
+        self.f.close()
+
+
+def read_capture(path):
+    '''Returns (start time, [(t, chunk), ...]) for a capture file.'''
+    with open(path, 'rb') as f:
+        raw = f.read()
+    if raw[:len(MAGIC)] != MAGIC:
+        raise ValueError('%s is not a Myo capture file' % path)
+
+    pos = len(MAGIC)
+    t0, = START.unpack_from(raw, pos)
+    pos += START.size
+
+    records = []
+    while pos + RECORD.size <= len(raw):
+        t, n = RECORD.unpack_from(raw, pos)
+        pos += RECORD.size
+        if pos + n > len(raw):
+            ## truncated last record, e.g. the recorder was killed
+            break
+        records.append((t, raw[pos:pos + n]))
+        pos += n
+    return t0, records
+
+
+class ReplaySerial(object):
+    '''Stands in for serial.Serial and feeds a capture back to BT.
+
+    With realtime=False the bytes are available as fast as they are read;
+    otherwise each chunk becomes readable at its captured time, scaled by
+    speed. Writes are accepted and dropped: the responses to the commands
+    sent during the capture are part of the capture itself. Once the capture
+    is exhausted read() returns no data, like a port that timed out.
+    '''
+
+    def __init__(self, path, realtime=False, speed=1.0):
+        _, records = read_capture(path)
+        self.data = b''.join(chunk for _, chunk in records)
+        ## end offset of each chunk and the time it becomes readable
+        self.ends = []
+        self.times = []
+        end = 0
+        for t, chunk in records:
+            end += len(chunk)
+            self.ends.append(end)
+            self.times.append(t / speed)
+        self.realtime = realtime
+        self.pos = 0
+        self.chunk = 0
+        self.timeout = None
+        self.t_start = None
+
+    def available(self):
+        '''Offset up to which the capture has been "received" so far.'''
+        if not self.realtime:
+            return len(self.data)
+        if self.t_start is None:
+            self.t_start = time.time()
+        now = time.time() - self.t_start
+        while self.chunk < len(self.times) and self.times[self.chunk] <= now:
+            self.chunk += 1
+        return self.ends[self.chunk - 1] if self.chunk else 0
+
+    @property
+    def in_waiting(self):
+        return self.available() - self.pos
+
+    def read(self, size=1):
+        end = self.available()
+        if end <= self.pos and self.realtime and self.chunk < len(self.times):
+            ## wait for the next chunk, honouring the port timeout
+            wait = self.t_start + self.times[self.chunk] - time.time()
+            if self.timeout is not None and wait > self.timeout:
+                time.sleep(self.timeout)
+                return b''
+            time.sleep(max(wait, 0))
+            end = self.available()
+
+        data = self.data[self.pos:min(end, self.pos + size)]
+        self.pos += len(data)
+        return data
+
+    def write(self, data):
+        return len(data)
+
+    def close(self):
+        pass
+
+
+def replay(path, realtime=False, speed=1.0, connect=False):
+    '''Runs a capture through MyoRaw and returns (frames, seconds); frames
+    counts decoded EMG and IMU notifications.'''
+    from myo_raw import MyoRaw
+
+    m = MyoRaw(ReplaySerial(path, realtime, speed))
+    frames = [0]
+    def count(*args):
+        frames[0] += 1
+    m.add_emg_handler(count)
+    m.add_imu_handler(count)
+
+    t0 = time.time()
+    if connect:
+        m.connect()
+    else:
+        m.bt.add_handler(m.handle_data)
+    while m.run() is not None:
+        pass
+    return frames[0], time.time() - t0
+
+
+def main(argv):
+    if len(argv) < 3 or argv[1] not in ('record', 'replay'):
+        print(__doc__.strip().splitlines()[-2])
+        print(__doc__.strip().splitlines()[-1])
+        return 1
+
+    if argv[1] == 'record':
+        from myo_raw import MyoRaw
+
+        m = MyoRaw(argv[3] if len(argv) >= 4 else None, capture=argv[2])
+        m.connect()
+        try:
+            while True:
+                m.run(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            m.disconnect()
+            m.bt.close()
+        return 0
+
+    realtime = '--realtime' in argv
+    speed = float(argv[argv.index('--speed') + 1]) if '--speed' in argv else 1.0
+    frames, dt = replay(argv[2], realtime, speed, '--connect' in argv)
+    print('%d frames in %.3f s: %.0f frames/s' % (frames, dt, frames / dt if dt else 0))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''One entry point for the Myo scripts (Python 3).
+
+    python myo_cli.py record [path] [--plot] [--no-graph] [--csv] [--npy]
+    python myo_cli.py classify [--no-gui] [--model nn|knn|forest|linear]
+    python myo_cli.py stream [--ring NAME]
+    python myo_cli.py train LABEL [--seconds S]
+
+Every command takes --tty and --timings. Only what a command uses is
+imported, and only when it gets there: sklearn when the classifier is
+built, pygame for the classify window, matplotlib for plots, and the
+terminal is only touched by record. classify and train load the training
+data and build the classifier on another thread while the dongle is
+opened and the Myo connected (straight to the last one, see myo_profile).
+--timings prints what each import and step cost.
+'''
+
+from __future__ import print_function
+
+import time
+T0 = time.time()
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import importlib
+import sys
+import threading
+
+from myo_raw import MyoRaw
+from myo_profile import Profiles
+
+## (name, seconds) of each import and step, in the order they finished
+TIMINGS = [('import myo_raw', time.time() - T0)]
+timings_lock = threading.Lock()
+
+
+def timed(name, f, *args, **kw):
+    '''Calls f and records how long it took under name.'''
+    t = time.time()
+    res = f(*args, **kw)
+    with timings_lock:
+        TIMINGS.append((name, time.time() - t))
+    return res
+
+
+def load(module):
+    return timed('import ' + module, importlib.import_module, module)
+
+
+def report():
+    for name, dt in TIMINGS:
+        print('%-24s %8.1f ms' % (name, dt * 1e3))
+    print('%-24s %8.1f ms' % ('total', (time.time() - T0) * 1e3))
+
+
+def load_classifier(model='nn'):
+    myo = load('myo')
+    timed('import sklearn', myo.load_sklearn)
+    if model == 'nn':
+        return timed('load training data', myo.NNClassifier)
+    ## one of the classifiers backends
+    return timed('load training data', load('classifiers').BACKENDS[model])
+
+
+def connect(m):
+    timed('connect', m.connect, profiles=Profiles())
+
+
+def record(args):
+    out = load('myo_raw_OutputUnit').OutputUnit(args.path)
+    out.live_plot = args.plot
+    out.plt_graph = not args.no_graph
+    out.save_csv = args.csv
+    out.byn_np = args.npy
+    if args.timings:
+        report()
+    out.myo_main(args.tty)
+
+
+def classify(args):
+    with ThreadPoolExecutor(1) as pool:
+        cls = pool.submit(load_classifier, args.model)
+        myo = load('myo')
+        ## the classifier is only used once packets are handled, after run()
+        m = timed('open dongle', myo.Myo, None, args.tty)
+        connect(m)
+        m.cls = cls.result()
+    if args.timings:
+        report()
+    load('classify_myo').main(m, gui=not args.no_gui)
+
+
+def stream(args):
+    m = timed('open dongle', MyoRaw, args.tty)
+    writer = None
+    if args.ring is not None:
+        shm_ring = load('shm_ring')
+        writer = shm_ring.RingWriter(args.ring)
+        writer.attach(m)
+        print('publishing as %s' % writer.name)
+    else:
+        m.add_emg_handler(lambda emg, moving: print(emg))
+    connect(m)
+    if args.timings:
+        report()
+    try:
+        while True:
+            m.run(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        m.disconnect()
+        if writer is not None:
+            writer.close()
+
+
+def train(args):
+    with ThreadPoolExecutor(1) as pool:
+        cls = pool.submit(load_classifier)
+        m = timed('open dongle', MyoRaw, args.tty)
+        connect(m)
+        cls = cls.result()
+    if args.timings:
+        report()
+
+    count = [0]
+    def store(emg, moving):
+        cls.store_data(args.label, emg)
+        count[0] += 1
+    m.add_emg_handler(store)
+    print('recording class %d for %g s...' % (args.label, args.seconds))
+    t0 = time.time()
+    try:
+        while time.time() - t0 < args.seconds:
+            m.run(.1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        m.disconnect()
+        cls.close()
+    print('stored %d samples' % count[0])
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Myo armband tools.')
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--tty', default=None, help='dongle port (found automatically)')
+    common.add_argument('--timings', action='store_true', help='report import and startup times')
+    sub = parser.add_subparsers(dest='command')
+    sub.required = True
+
+    p = sub.add_parser('record', parents=[common], help='record EMG with keyboard labels (r/s/p)')
+    p.add_argument('path', nargs='?', default='data/temp/sample_EMGdata')
+    p.add_argument('--plot', action='store_true', help='plot EMG live')
+    p.add_argument('--no-graph', action='store_true', help="don't plot the session at the end")
+    p.add_argument('--csv', action='store_true', help='also export path.csv at the end')
+    p.add_argument('--npy', action='store_true', help='also export path.npy at the end')
+    p.set_defaults(f=record)
+
+    p = sub.add_parser('classify', parents=[common], help='classify poses')
+    p.add_argument('--no-gui', action='store_true', help='show votes on the terminal')
+    p.add_argument('--model', default='nn', choices=['nn', 'knn', 'forest', 'linear'],
+                   help='NNClassifier or a classifiers backend')
+    p.set_defaults(f=classify)
+
+    p = sub.add_parser('stream', parents=[common], help='print EMG or publish it to a shm_ring')
+    p.add_argument('--ring', default=None, help='shared ring name')
+    p.set_defaults(f=stream)
+
+    p = sub.add_parser('train', parents=[common], help='record training samples of one class')
+    p.add_argument('label', type=int, help='class 0-9')
+    p.add_argument('--seconds', type=float, default=5)
+    p.set_defaults(f=train)
+
+    args = parser.parse_args(argv[1:])
+    args.f(args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
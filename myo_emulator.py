@@ -0,0 +1,397 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Emulates a Myo dongle with one or more armbands over a pseudo-terminal.
+
+Only the BGAPI subset that MyoRaw.connect uses is implemented: end_scan,
+disconnect, discover (scan responses carry the Myo service UUID), connect,
+read_attr for the firmware version (0x17) and name (0x03), acknowledged
+write_attr and unacknowledged write commands, and the EMG (0x27), IMU (0x1c) and arm/pose (0x23)
+notifications.
+
+    python myo_emulator.py [--dongles N] [--armbands N] [--emg-hz R] [--imu-hz R]
+                           [--jitter S] [--loss P]
+    python myo_emulator.py loadtest [--duration S] [--rates R,R,...]
+'''
+
+from __future__ import print_function
+
+import argparse
+import math
+import os
+import random
+import struct
+import sys
+import threading
+import time
+import tty
+
+from common import *
+
+## advertisement payload: flags, then the 128-bit Myo service UUID
+MYO_ADV = b'\x02\x01\x06\x11\x06\x42\x48\x12\x4A\x7F\x2C\x48\x47\xB9\xDE\x04\xA9\x01\x00\x06\xD5'
+
+
+class Armband(object):
+    '''State of one virtual Myo.'''
+
+    def __init__(self, index, firmware=(1, 5, 1970, 2), name=None):
+        self.addr = bytes(bytearray([index + 1, 0x00, 0xe0, 0x5e, 0xed, 0x4a]))
+        self.firmware = firmware
+        self.name = name if name is not None else b'Myo %d' % index
+        self.conn = None
+        self.emg_on = False
+        self.imu_on = False
+        self.arm_on = False
+        self.synced = False
+        self.phase = random.random() * 2 * math.pi
+
+    def attr(self, attr):
+        if attr == 0x17:
+            return pack('4H', *self.firmware)
+        if attr == 0x03:
+            return self.name
+        return b''
+
+    def write(self, attr, val):
+        if attr == 0x28:
+            self.emg_on = val[:1] == b'\x01'
+        elif attr == 0x1d:
+            self.imu_on = val[:1] == b'\x01'
+        elif attr == 0x24:
+            self.arm_on = val[:1] in (b'\x01', b'\x02')
+        elif attr == 0x19 and val[:2] == b'\x01\x03' and len(val) >= 4:
+            ## set mode: EMG mode, IMU mode, classifier mode
+            self.emg_on = self.emg_on or val[2:3] != b'\x00'
+            self.imu_on = self.imu_on or val[3:4] != b'\x00'
+
+    def emg(self, t):
+        ## bursts of activity on top of a noisy baseline
+        level = 40 + 200 * max(0.0, math.sin(0.7 * t + self.phase))
+        return [max(0, int(random.gauss(level, 15))) for _ in range(8)]
+
+    def imu(self, t):
+        a = 0.5 * t + self.phase
+        quat = (int(16384 * math.cos(a / 2)), 0, 0, int(16384 * math.sin(a / 2)))
+        acc = (int(2048 * math.sin(a)), int(2048 * math.cos(a)), 0)
+        gyro = (0, 0, int(16 * 0.5 * 180 / math.pi))
+        return quat + acc + gyro
+
+
+class EmulatedDongle(object):
+    '''A BLED112-like dongle on a pty, hosting `armbands` virtual Myos.
+
+    EMG and IMU notifications are streamed at emg_hz/imu_hz once enabled.
+    Each frame is delayed by a uniform random jitter of up to `jitter`
+    seconds and dropped with probability `loss`. Pass dongle.port to MyoRaw.
+    '''
+
+    ADV_INTERVAL = .1
+
+    def __init__(self, armbands=1, emg_hz=50, imu_hz=50, jitter=0.0, loss=0.0,
+                 firmware=(1, 5, 1970, 2), seed=None):
+        self.armbands = [Armband(i, firmware) for i in range(armbands)]
+        self.emg_hz = emg_hz
+        self.imu_hz = imu_hz
+        self.jitter = jitter
+        self.loss = loss
+        self.rand = random.Random(seed)
+
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+
+        self.lock = threading.Lock()
+        self.scanning = False
+        self.running = False
+        self.sent = {'emg': 0, 'imu': 0, 'arm': 0}
+        self.lost = 0
+        self.threads = []
+
+    def start(self):
+        self.running = True
+        for f in (self.serve_commands, self.stream):
+            th = threading.Thread(target=f)
+            th.daemon = True
+            th.start()
+            self.threads.append(th)
+        return self
+
+    def stop(self):
+        self.running = False
+        for fd in (self.master, self.slave):
+            try: os.close(fd)
+            except OSError: pass
+        for th in self.threads:
+            th.join(1)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    ## output
+    def send(self, typ, cls, cmd, payload=b''):
+        pkt = pack('4B', typ, len(payload), cls, cmd) + payload
+        with self.lock:
+            try:
+                os.write(self.master, pkt)
+            except OSError:
+                self.running = False
+
+    def respond(self, cls, cmd, payload=b''):
+        self.send(0x00, cls, cmd, payload)
+
+    def event(self, cls, cmd, payload=b''):
+        self.send(0x80, cls, cmd, payload)
+
+    def notify(self, a, attr, val, typ=1):
+        self.event(4, 5, pack('BHBB', a.conn, attr, typ, len(val)) + val)
+
+    ## command handling
+    def serve_commands(self):
+        buf = b''
+        while self.running:
+            try:
+                data = os.read(self.master, 4096)
+            except OSError:
+                break
+            if not data:
+                break
+            buf += data
+            while len(buf) >= 4:
+                n = 4 + buf[1]
+                if len(buf) < n:
+                    break
+                self.command(buf[2], buf[3], buf[4:n])
+                buf = buf[n:]
+
+    def command(self, cls, cmd, payload):
+        if (cls, cmd) == (6, 4): ## end_scan
+            self.scanning = False
+            self.respond(6, 4, pack('H', 0))
+        elif (cls, cmd) == (6, 2): ## discover
+            self.respond(6, 2, pack('H', 0))
+            self.scanning = True
+        elif (cls, cmd) == (3, 0): ## disconnect
+            h, = struct.unpack('B', payload[:1])
+            a = self.by_conn(h)
+            self.respond(3, 0, pack('BH', h, 0 if a else 0x0186))
+            if a:
+                a.conn = None
+                a.emg_on = a.imu_on = a.arm_on = a.synced = False
+                self.event(3, 4, pack('BH', h, 0x0216))
+        elif (cls, cmd) == (6, 3): ## connect_direct
+            a = self.by_addr(payload[:6])
+            h = self.free_conn()
+            self.respond(6, 3, pack('HB', 0, h))
+            if a is not None:
+                a.conn = h
+                self.event(3, 0, pack('BB6sBHHHB', h, 5, a.addr, 0, 6, 64, 0, 0xff))
+        elif (cls, cmd) == (0, 6): ## get_connections
+            self.respond(0, 6, pack('B', 8))
+        elif (cls, cmd) == (4, 4): ## read_by_handle
+            h, attr = struct.unpack('<BH', payload[:3])
+            a = self.by_conn(h)
+            self.respond(4, 4, pack('BH', h, 0 if a else 0x0186))
+            if a:
+                self.notify(a, attr, a.attr(attr), typ=0)
+        elif (cls, cmd) == (4, 5): ## attribute_write
+            h, attr, n = struct.unpack('<BHB', payload[:4])
+            a = self.by_conn(h)
+            self.respond(4, 5, pack('BH', h, 0 if a else 0x0186))
+            if a:
+                a.write(attr, payload[4:4 + n])
+                self.event(4, 1, pack('BHH', h, 0, attr))
+        elif (cls, cmd) == (4, 6): ## write_command
+            h, attr, n = struct.unpack('<BHB', payload[:4])
+            a = self.by_conn(h)
+            self.respond(4, 6, pack('BH', h, 0 if a else 0x0186))
+            if a:
+                a.write(attr, payload[4:4 + n])
+        else:
+            self.respond(cls, cmd, pack('H', 0x0180))
+
+    def by_conn(self, h):
+        for a in self.armbands:
+            if a.conn == h:
+                return a
+        return None
+
+    def by_addr(self, addr):
+        for a in self.armbands:
+            if a.addr == bytes(addr):
+                return a
+        return None
+
+    def free_conn(self):
+        used = set(a.conn for a in self.armbands)
+        h = 0
+        while h in used:
+            h += 1
+        return h
+
+    ## streaming
+    def stream(self):
+        t0 = time.time()
+        next_adv = t0
+        next_emg = t0
+        next_imu = t0
+        while self.running:
+            now = time.time()
+
+            if self.scanning and now >= next_adv:
+                for a in self.armbands:
+                    if a.conn is None:
+                        rssi = pack('b', -40 - self.rand.randrange(20))
+                        self.event(6, 0, rssi + pack('B6sBBB', 0, a.addr, 1, 0xff, len(MYO_ADV)) + MYO_ADV)
+                        name = pack('BB', len(a.name) + 1, 0x09) + a.name
+                        self.event(6, 0, rssi + pack('B6sBBB', 4, a.addr, 1, 0xff, len(name)) + name)
+                next_adv = now + self.ADV_INTERVAL
+
+            if self.emg_hz and now >= next_emg:
+                for a in self.armbands:
+                    if a.conn is not None and a.emg_on and self.keep():
+                        self.notify(a, 0x27, pack('8HB', *(a.emg(now) + [0])))
+                        self.sent['emg'] += 1
+                next_emg += self.period(self.emg_hz)
+
+            if self.imu_hz and now >= next_imu:
+                for a in self.armbands:
+                    if a.conn is not None and a.imu_on and self.keep():
+                        self.notify(a, 0x1c, pack('10h', *a.imu(now)))
+                        self.sent['imu'] += 1
+                    if a.conn is not None and a.arm_on and not a.synced:
+                        ## arm synced (right arm, x toward wrist), then rest pose
+                        self.notify(a, 0x23, pack('3B', 1, 1, 1), typ=2)
+                        self.notify(a, 0x23, pack('3B', 3, 0, 0), typ=2)
+                        self.sent['arm'] += 2
+                        a.synced = True
+                next_imu += self.period(self.imu_hz)
+
+            ## catch up without a burst if we fell far behind
+            if next_emg < now - 1: next_emg = now
+            if next_imu < now - 1: next_imu = now
+
+            wait = min(next_adv if self.scanning else now + self.ADV_INTERVAL,
+                       next_emg if self.emg_hz else now + 1,
+                       next_imu if self.imu_hz else now + 1) - time.time()
+            if wait > 0:
+                time.sleep(wait)
+
+    def period(self, hz):
+        return 1. / hz + (self.rand.uniform(-self.jitter, self.jitter) if self.jitter else 0)
+
+    def keep(self):
+        if self.loss and self.rand.random() < self.loss:
+            self.lost += 1
+            return False
+        return True
+
+
+def measure_connect(dongle, profiles=None):
+    '''Connects a MyoRaw to the emulated dongle; returns (MyoRaw, seconds).'''
+    from myo_raw import MyoRaw
+
+    t0 = time.time()
+    m = MyoRaw(dongle.port)
+    m.connect(profiles=profiles)
+    return m, time.time() - t0
+
+
+def measure_rate(rate, duration=2.0, armbands=1, **kw):
+    '''Streams EMG at `rate` Hz from each of `armbands` Myos for `duration`
+    seconds and returns (frames sent, frames received, bytes still waiting
+    at the end). Other keywords (jitter, loss) go to EmulatedDongle; a
+    single Myo is read with MyoRaw, several with a MyoManager.'''
+    with EmulatedDongle(armbands=armbands, emg_hz=rate, imu_hz=0, **kw) as dongle:
+        received = [0]
+        def count(*args):
+            received[0] += 1
+        if armbands == 1:
+            m, _ = measure_connect(dongle)
+            bt = m.bt
+        else:
+            from myo_manager import MyoManager
+            m = MyoManager([dongle.port])
+            m.connect(count=armbands, timeout=10)
+            bt = m.dongles[0].bt
+        m.add_emg_handler(count)
+
+        sent0 = dongle.sent['emg']
+        got0 = received[0]
+        t0 = time.time()
+        while time.time() < t0 + duration:
+            m.run(.05)
+        sent = dongle.sent['emg'] - sent0
+        waiting = bt.ser.in_waiting
+        bt.close()
+    return sent, received[0] - got0, waiting
+
+
+def find_lag_rate(rates=(50, 100, 200, 400, 800, 1600, 3200, 6400, 12800, 25600, 51200), duration=2.0,
+                  tolerance=.05, armbands=1, jitter=0.0, loss=0.0):
+    '''Returns the first EMG rate (per armband) at which BT.recv_packet
+    falls behind: fewer than (1 - tolerance) of the frames sent arrive, or
+    the emulator itself can't reach the rate because the pty is full. None
+    if it never lags. armbands, jitter and loss set up the emulated dongle
+    as for the rest of the load test.'''
+    for rate in rates:
+        sent, got, waiting = measure_rate(rate, duration, armbands, jitter=jitter, loss=loss)
+        print('%6d Hz: sent %6d received %6d (%.0f/s) waiting %d bytes' %
+              (rate, sent, got, got / duration, waiting))
+        ## frames the emulator should manage to send, less those it drops
+        expected = rate * duration * armbands * (1 - loss)
+        if got < (1 - tolerance) * sent or sent < (1 - tolerance) * expected:
+            return rate
+    return None
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Emulated Myo dongle on a pty.')
+    parser.add_argument('mode', nargs='?', default='serve', choices=['serve', 'loadtest'])
+    parser.add_argument('--dongles', type=int, default=1)
+    parser.add_argument('--armbands', type=int, default=1, help='virtual Myos per dongle')
+    parser.add_argument('--emg-hz', type=float, default=50)
+    parser.add_argument('--imu-hz', type=float, default=50)
+    parser.add_argument('--jitter', type=float, default=0.0, help='max timing jitter in seconds')
+    parser.add_argument('--loss', type=float, default=0.0, help='frame loss probability')
+    parser.add_argument('--duration', type=float, default=2.0)
+    parser.add_argument('--rates', default='50,100,200,400,800,1600,3200,6400,12800,25600,51200')
+    args = parser.parse_args(argv[1:])
+
+    if args.mode == 'loadtest':
+        with EmulatedDongle(armbands=args.armbands, emg_hz=args.emg_hz, imu_hz=args.imu_hz,
+                            jitter=args.jitter, loss=args.loss) as dongle:
+            import tempfile
+            from myo_profile import Profiles
+            profiles = Profiles(os.path.join(tempfile.mkdtemp(), 'profiles.json'))
+            m, dt = measure_connect(dongle, profiles)
+            print('connect: %.3f s' % dt)
+            m.disconnect()
+            m.bt.close()
+            m, dt = measure_connect(dongle, profiles)
+            print('cached reconnect: %.3f s' % dt)
+            m.bt.close()
+        lag = find_lag_rate([int(r) for r in args.rates.split(',')], args.duration,
+                            armbands=args.armbands, jitter=args.jitter, loss=args.loss)
+        print('lags at: %s' % ('%d Hz' % lag if lag else 'never'))
+        return 0
+
+    dongles = [EmulatedDongle(args.armbands, args.emg_hz, args.imu_hz, args.jitter, args.loss).start()
+               for _ in range(args.dongles)]
+    for d in dongles:
+        print('emulated dongle on %s with %d armband(s)' % (d.port, len(d.armbands)))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for d in dongles:
+            d.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,345 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Several Myos at once, over one or more dongles.
+
+A dongle (BLED112) holds up to 8 connections. MyoManager scans for Myos,
+optionally only those with given addresses or names, spreads them over the
+attached dongles and connects them all. Each dongle has one BT and one
+packet handler that hands notifications to the right Device by connection
+handle; devices are configured in parallel, since attribute writes are
+queued per connection.
+
+Handlers added to the manager get the device id (its index in
+manager.devices) first:
+
+    mgr = MyoManager()
+    mgr.add_emg_handler(lambda dev, emg, moving: ...)
+    mgr.connect(count=2)
+    while True:
+        mgr.run(1)
+
+    python myo_manager.py [count] [address-or-name ...]
+'''
+
+from __future__ import print_function
+
+import sys
+import time
+
+from myo_raw import BT, MyoRaw, find_dongles, format_addr, is_myo, multiord, parse_addr
+from myo_reader import Reader
+
+## advertising data types carrying the device name
+AD_NAMES = (0x08, 0x09)
+## offset of the advertising data in a scan response event
+SCAN_DATA = 11
+
+
+def adv_name(data):
+    '''The device name in advertising data, or None.'''
+    data = bytes(data)
+    i = 0
+    while i + 1 < len(data):
+        n = data[i]
+        if n == 0:
+            break
+        if data[i + 1] in AD_NAMES:
+            return data[i + 2:i + 1 + n]
+        i += 1 + n
+    return None
+
+
+class Device(MyoRaw):
+    '''One Myo connected through a Dongle; its events also go to the
+    manager's handlers, tagged with `id`.'''
+
+    def __init__(self, dongle, id, manager=None):
+        MyoRaw.__init__(self, bt=dongle.bt)
+        self.dongle = dongle
+        self.id = id
+        self.manager = manager
+        self.name = None
+
+    def __repr__(self):
+        return 'Device(%d, %s, %r)' % (self.id, format_addr(self.addr or b''), self.name)
+
+    def on_emg(self, emg, moving):
+        MyoRaw.on_emg(self, emg, moving)
+        if self.manager is not None:
+            self.manager.on_emg(self.id, emg, moving)
+
+    def on_imu(self, quat, acc, gyro):
+        MyoRaw.on_imu(self, quat, acc, gyro)
+        if self.manager is not None:
+            self.manager.on_imu(self.id, quat, acc, gyro)
+
+    def on_pose(self, p):
+        MyoRaw.on_pose(self, p)
+        if self.manager is not None:
+            self.manager.on_pose(self.id, p)
+
+    def on_arm(self, arm, xdir):
+        MyoRaw.on_arm(self, arm, xdir)
+        if self.manager is not None:
+            self.manager.on_arm(self.id, arm, xdir)
+
+
+class Dongle(object):
+    '''One dongle and the devices connected through it.'''
+
+    def __init__(self, tty, capture=None):
+        self.tty = tty
+        self.bt = BT(tty, capture)
+        ## connection handle -> Device
+        self.devices = {}
+        self.max_connections = 3
+        self.reader = None
+        self.bt.add_handler(self.handle_packet)
+
+    def handle_packet(self, p):
+        if p.cls == 4:
+            if len(p.payload):
+                dev = self.devices.get(p.payload[0])
+                if dev is not None:
+                    dev.handle_data(p)
+        elif p.cls == 3 and p.cmd == 4:
+            ## disconnected
+            dev = self.devices.pop(p.payload[0], None)
+            if dev is not None:
+                print('%r disconnected' % dev)
+                dev.conn = None
+
+    def reset(self):
+        '''Ends any scan and every connection left over from before.'''
+        self.bt.end_scan()
+        res = self.bt.get_connections()
+        if res is not None and len(res.payload):
+            self.max_connections = res.payload[0]
+        for c in range(self.max_connections):
+            self.bt.disconnect(c)
+        self.devices = {}
+
+    def scan(self, count=1, addrs=None, names=None, timeout=None, exclude=()):
+        '''Scans for Myos and returns [(addr, name)] in the order found:
+        count of them, or all found before timeout with count=None.
+        addrs and names, if given, restrict which are accepted; the name
+        is only known once the scan response arrives, so filtering by
+        name can take a little longer.'''
+        if count is None and timeout is None:
+            raise ValueError('scanning for all Myos needs a timeout')
+        addrs = set(parse_addr(a) for a in addrs) if addrs else None
+        names = set(n if isinstance(n, bytes) else n.encode('utf-8') for n in names) if names else None
+        exclude = set(parse_addr(a) for a in exclude)
+
+        ## addr -> [is a Myo, name]
+        seen = {}
+        found = []
+        t0 = time.time()
+        self.bt.discover()
+        while count is None or len(found) < count:
+            remaining = None
+            if timeout is not None:
+                remaining = t0 + timeout - time.time()
+                if remaining <= 0:
+                    break
+            p = self.bt.recv_packet(remaining)
+            if p is None:
+                break
+            if p.cls != 6 or p.cmd != 0:
+                continue
+
+            addr = bytes(p.payload[2:8])
+            if addr in exclude or (addrs is not None and addr not in addrs):
+                continue
+            s = seen.setdefault(addr, [False, None])
+            s[0] = s[0] or is_myo(p)
+            s[1] = adv_name(p.payload[SCAN_DATA:]) or s[1]
+            if s[0] and (names is None or s[1] in names):
+                found.append(addr)
+                exclude.add(addr)
+        self.bt.end_scan()
+        return [(addr, seen[addr][1]) for addr in found]
+
+    def connect(self, addr, name=None, id=None, manager=None, timeout=None):
+        '''Connects to addr; returns the Device, not yet configured, or None
+        if timeout passed first.'''
+        dev = Device(self, id, manager)
+        dev.name = name
+        if dev.connect_to(list(multiord(addr)), timeout) is None:
+            return None
+        dev.reader = self.reader
+        self.devices[dev.conn] = dev
+        return dev
+
+    def start_reader(self, maxlen=1024, overflow='drop_oldest'):
+        if self.reader is None:
+            self.reader = Reader(self, maxlen, overflow)
+            for dev in self.devices.values():
+                dev.reader = self.reader
+            self.reader.start()
+        return self.reader
+
+    def stop_reader(self):
+        if self.reader is not None:
+            self.reader.stop()
+            self.reader = None
+            for dev in self.devices.values():
+                dev.reader = None
+            self.bt.notify_waiters()
+
+    def close(self):
+        self.stop_reader()
+        self.bt.close()
+
+
+class MyoManager(object):
+    '''Finds every dongle (or uses the given ttys) and manages the Myos
+    connected through them.'''
+
+    ## seconds to wait for each connection to be established
+    CONNECT_TIMEOUT = 5
+
+    def __init__(self, ttys=None, capture=None):
+        if ttys is None:
+            ttys = find_dongles()
+        if not ttys:
+            raise ValueError('Myo dongle not found!')
+        ## a capture file records the first dongle only
+        self.dongles = [Dongle(tty, capture if i == 0 else None) for i, tty in enumerate(ttys)]
+        self.devices = []
+        self.emg_handlers = []
+        self.imu_handlers = []
+        self.arm_handlers = []
+        self.pose_handlers = []
+
+    def connect(self, count=1, addrs=None, names=None, timeout=None):
+        '''Scans for count Myos (all found within timeout with count=None)
+        matching addrs/names, connects them round-robin over the dongles and
+        starts streaming. Can be called again to add more. Returns the new
+        Devices.'''
+        reading = any(d.reader is not None for d in self.dongles)
+        self.stop_reader()
+        if not self.devices:
+            for d in self.dongles:
+                d.reset()
+
+        print('scanning...')
+        exclude = [dev.addr for dev in self.devices]
+        found = self.dongles[0].scan(count, addrs, names, timeout, exclude)
+        print('found %d Myo(s)' % len(found))
+
+        new = []
+        for addr, name in found:
+            ## fill the dongle with the fewest connections first, skipping
+            ## full ones, which would only refuse after CONNECT_TIMEOUT
+            free = [d for d in self.dongles if len(d.devices) < d.max_connections]
+            if not free:
+                print('no free connection for %s' % format_addr(addr))
+                continue
+            dongle = min(free, key=lambda d: len(d.devices))
+            dev = dongle.connect(addr, name, len(self.devices), self, self.CONNECT_TIMEOUT)
+            if dev is None:
+                print('could not connect to %s' % format_addr(addr))
+                continue
+            self.devices.append(dev)
+            new.append(dev)
+            print('connected %r on %s' % (dev, dongle.tty))
+
+        self.configure(new)
+        if reading:
+            self.start_reader()
+        return new
+
+    def configure(self, devices):
+        '''Reads firmware versions and sends the setup writes of every device
+        at once, then waits for all of them.'''
+        reads = [dev.bt.read_attr_async(dev.conn, 0x17) for dev in devices]
+        for dev, f in zip(devices, reads):
+            dev.set_firmware(f.result())
+        last = []
+        for dev in devices:
+            f = None
+            for attr, val in dev.config_writes():
+                f = dev.write_attr_async(attr, val, coalesce=False) or f
+            last.append(f)
+        for f in last:
+            if f is not None:
+                f.result()
+
+    def run(self, timeout=None):
+        '''Handles packets for up to timeout seconds. With a single dongle
+        this reads it directly; with several, each gets a reader thread
+        (started on the first call) and this just waits.'''
+        if len(self.dongles) == 1 and self.dongles[0].reader is None:
+            return self.dongles[0].bt.recv_packet(timeout)
+        self.start_reader()
+        return self.dongles[0].bt.wait_packet(timeout)
+
+    def start_reader(self, maxlen=1024, overflow='drop_oldest'):
+        for d in self.dongles:
+            d.start_reader(maxlen, overflow)
+
+    def stop_reader(self):
+        for d in self.dongles:
+            d.stop_reader()
+
+    @property
+    def dropped(self):
+        '''Frames dropped by the reader queues, per dongle.'''
+        return [d.reader.dropped if d.reader else None for d in self.dongles]
+
+    def disconnect(self):
+        for dev in self.devices:
+            if dev.conn is not None:
+                dev.disconnect()
+
+    def close(self):
+        self.disconnect()
+        for d in self.dongles:
+            d.close()
+
+    def add_emg_handler(self, h):
+        self.emg_handlers.append(h)
+
+    def add_imu_handler(self, h):
+        self.imu_handlers.append(h)
+
+    def add_pose_handler(self, h):
+        self.pose_handlers.append(h)
+
+    def add_arm_handler(self, h):
+        self.arm_handlers.append(h)
+
+    def on_emg(self, id, emg, moving):
+        for h in self.emg_handlers:
+            h(id, emg, moving)
+
+    def on_imu(self, id, quat, acc, gyro):
+        for h in self.imu_handlers:
+            h(id, quat, acc, gyro)
+
+    def on_pose(self, id, p):
+        for h in self.pose_handlers:
+            h(id, p)
+
+    def on_arm(self, id, arm, xdir):
+        for h in self.arm_handlers:
+            h(id, arm, xdir)
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) >= 2 else 2
+    filters = sys.argv[2:]
+    addrs = [f for f in filters if f.count(':') == 5] or None
+    names = [f for f in filters if f.count(':') != 5] or None
+
+    mgr = MyoManager()
+    mgr.add_emg_handler(lambda dev, emg, moving: print(dev, emg))
+    mgr.connect(count, addrs, names, timeout=10)
+    try:
+        while True:
+            mgr.run(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mgr.close()
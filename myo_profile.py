@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Profiles of the Myos connected before, for fast reconnects.
+
+A profile holds what MyoRaw.connect learns about a Myo: its address,
+firmware version and name. Passed to connect, the cache lets it try the
+last Myo (or the one asked for) with a direct connect instead of a scan,
+and skip reading the firmware version and name again. The streaming
+setup is still written on every connect, since the Myo forgets it when
+disconnected; it follows from the firmware version, so nothing else
+needs to be kept.
+
+Profiles are kept as JSON in ~/.myo_profiles.json:
+
+    m.connect(profiles=Profiles())
+
+    python myo_profile.py [path]       # list the cached profiles
+    python myo_profile.py clear [path] # forget them
+'''
+
+from __future__ import print_function
+
+import json
+import os
+import sys
+import time
+
+from myo_raw import format_addr, parse_addr
+
+PATH = os.path.join(os.path.expanduser('~'), '.myo_profiles.json')
+
+
+class Profile(object):
+    '''What is known about one Myo; addr is in bytes, as sent.'''
+
+    def __init__(self, addr, firmware=None, name=None, seen=None):
+        self.addr = parse_addr(addr)
+        self.firmware = tuple(firmware) if firmware else None
+        self.name = name
+        ## time of the last connection
+        self.seen = seen
+
+    def __repr__(self):
+        return 'Profile(%s, %r, %r)' % (format_addr(self.addr), self.firmware, self.name)
+
+    def to_json(self):
+        return {
+            'addr': format_addr(self.addr),
+            'firmware': list(self.firmware) if self.firmware else None,
+            'name': self.name,
+            'seen': self.seen,
+        }
+
+
+class Profiles(object):
+    '''The profiles saved in `path`; put() saves them again.'''
+
+    def __init__(self, path=PATH):
+        self.path = path
+        ## formatted address -> Profile
+        self.profiles = {}
+        self.last = None
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            for d in data.get('profiles', ()):
+                p = Profile(**d)
+                self.profiles[format_addr(p.addr)] = p
+            self.last = data.get('last')
+        except (IOError, OSError, ValueError, TypeError, KeyError):
+            ## missing or damaged: start over
+            self.profiles = {}
+            self.last = None
+
+    def save(self):
+        data = {
+            'last': self.last,
+            'profiles': [p.to_json() for p in self.profiles.values()],
+        }
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        ## replace in one step, so a crash leaves the old file intact
+        getattr(os, 'replace', os.rename)(tmp, self.path)
+
+    def get(self, addr=None):
+        '''The profile of addr (bytes or aa:bb:...), or of the Myo used last
+        if None; None if unknown.'''
+        key = self.last if addr is None else format_addr(parse_addr(addr))
+        return self.profiles.get(key) if key else None
+
+    def put(self, addr, firmware=None, name=None):
+        '''Records a connection to addr and saves.'''
+        p = self.get(addr) or Profile(addr)
+        p.firmware = tuple(firmware) if firmware else p.firmware
+        p.name = name if name is not None else p.name
+        p.seen = time.time()
+        key = format_addr(p.addr)
+        self.profiles[key] = p
+        self.last = key
+        self.save()
+        return p
+
+    def forget(self, addr=None):
+        '''Drops the profile of addr, or every profile if None.'''
+        if addr is None:
+            self.profiles = {}
+            self.last = None
+        else:
+            key = format_addr(parse_addr(addr))
+            self.profiles.pop(key, None)
+            if self.last == key:
+                self.last = None
+        self.save()
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    clear = args[:1] == ['clear']
+    if clear:
+        args = args[1:]
+    profiles = Profiles(args[0] if args else PATH)
+    if clear:
+        profiles.forget()
+    for key, p in sorted(profiles.profiles.items()):
+        print('%s %s %-12s firmware %s' % ('*' if key == profiles.last else ' ', key, p.name,
+                                           '.'.join(map(str, p.firmware)) if p.firmware else '?'))
@@ -3,6 +3,7 @@
 
 from __future__ import print_function
 
+from collections import Counter, deque
 import enum
 import re
 import struct
@@ -12,6 +13,8 @@ import time
 import serial
 from serial.tools.list_ports import comports
 from common import *
+from instrument import Stats, monotonic
+from myo_reader import Reader
 
 def multichr(ords):
     if sys.version_info[0] >= 3:
@@ -25,6 +28,19 @@ def multiord(b):
     else:
         return map(ord, b)
 
+def format_addr(addr):
+    '''Address bytes (least significant first, as sent) as aa:bb:...'''
+    return ':'.join('%02x' % b for b in reversed(multiord(addr)))
+
+def parse_addr(s):
+    '''Inverse of format_addr; bytes are passed through, and lists of byte
+    values (as MyoRaw.scan returns) converted.'''
+    if isinstance(s, bytes):
+        return s
+    if not isinstance(s, str):
+        return bytes(bytearray(s))
+    return bytes(bytearray(int(x, 16) for x in reversed(s.split(':'))))
+
 class Arm(enum.Enum):
     UNKNOWN = 0
     RIGHT = 1
@@ -44,13 +60,44 @@ class Pose(enum.Enum):
     THUMB_TO_PINKY = 5
     UNKNOWN = 255
 
+## value -> member tables, so decoding never has to catch the ValueError that
+## the enum constructors raise for unexpected values
+ARMS = dict((a.value, a) for a in Arm)
+XDIRECTIONS = dict((x.value, x) for x in XDirection)
+POSES = dict((p.value, p) for p in Pose)
+
+## attclient attribute_value header: connection, attribute, type, value length
+ATTR_HEADER = struct.Struct('<BHBB')
+EMG_STRUCT = struct.Struct('<8HB')
+IMU_STRUCT = struct.Struct('<10h')
+ARM_STRUCT = struct.Struct('<3B')
+
+## stream names used by the instrumentation
+STREAMS = {0x27: 'emg', 0x1c: 'imu', 0x23: 'arm'}
+
+## the writes start_raw() sends
+START_RAW = [
+    (0x28, b'\x01\x00'),
+    (0x19, b'\x01\x03\x01\x01\x00'),
+    (0x19, b'\x01\x03\x01\x01\x01'),
+]
+
+## the end of a Myo's scan response: its service UUID in the advertisement
+MYO_SCAN_SUFFIX = b'\x06\x42\x48\x12\x4A\x7F\x2C\x48\x47\xB9\xDE\x04\xA9\x01\x00\x06\xD5'
+
 
 class Packet(object):
-    def __init__(self, ords):
-        self.typ = ords[0]
-        self.cls = ords[2]
-        self.cmd = ords[3]
-        self.payload = multichr(ords[4:])
+    __slots__ = ('typ', 'cls', 'cmd', 'payload', 't_recv')
+
+    def __init__(self, typ, cls, cmd, payload, t_recv=None):
+        self.typ = typ
+        self.cls = cls
+        self.cmd = cmd
+        ## memoryview into the chunk the packet was read from; call bytes() on
+        ## it if it needs to outlive the packet
+        self.payload = payload
+        ## monotonic time of the read that completed the packet
+        self.t_recv = t_recv
 
     def __repr__(self):
         return 'Packet(%02X, %02X, %02X, [%s])' % \
@@ -58,28 +105,140 @@ class Packet(object):
              ' '.join('%02X' % b for b in multiord(self.payload)))
 
 
+class CommandFuture(object):
+    '''Completion of a queued BGAPI command or attribute procedure.
+
+    result() returns the packet that completed it: the command response, the
+    attribute value event for reads, or the procedure completed event for
+    acknowledged writes (which also reports failures). While waiting it
+    reads from the port itself, unless a reader thread owns it.'''
+
+    def __init__(self, bt):
+        self.bt = bt
+        self.packet = None
+        self.callbacks = []
+        self.handler = None
+        self.event = threading.Event()
+        ## makes completing and adding callbacks atomic, as they may happen
+        ## on different threads (e.g. a myo_reader thread completes it)
+        self.lock = threading.Lock()
+
+    def done(self):
+        return self.event.is_set()
+
+    def set_result(self, p):
+        '''Completes the future with p, once; later results are ignored.'''
+        with self.lock:
+            if self.event.is_set():
+                return
+            self.packet = p
+            self.event.set()
+            callbacks, self.callbacks = self.callbacks, []
+        for cb in callbacks:
+            cb(self)
+
+    def add_done_callback(self, cb):
+        '''Calls cb(self) when completed; at once, here, if it already is.'''
+        with self.lock:
+            if not self.event.is_set():
+                self.callbacks.append(cb)
+                return
+        cb(self)
+
+    def result(self, timeout=None):
+        '''The completing packet, or None if timeout passed first.'''
+        self.bt.wait_until(self.done, timeout)
+        return self.packet
+
+
+class AttrOp(object):
+    '''A queued attribute read, acknowledged write or unacknowledged write
+    command on one connection.'''
+
+    __slots__ = ('kind', 'con', 'attr', 'val', 'future')
+
+    def __init__(self, kind, con, attr, val, future):
+        self.kind = kind
+        self.con = con
+        self.attr = attr
+        self.val = val
+        self.future = future
+
+
 class BT(object):
-    '''Implements the non-Myo-specific details of the Bluetooth protocol.'''
-    def __init__(self, tty):
-        self.ser = serial.Serial(port=tty, baudrate=9600, dsrdtr=1)
-        self.buf = []
+    '''Implements the non-Myo-specific details of the Bluetooth protocol.
+
+    Commands can be pipelined: send_command_async writes a command and
+    returns a CommandFuture that is completed when the dongle's response
+    arrives; responses are matched to commands in order, per command class
+    and id. Attribute reads and writes go through a queue per connection,
+    because the dongle runs only one GATT procedure per connection at a
+    time; each is started as soon as the previous one completes, without
+    the caller waiting in between.
+
+    Normally whichever thread waits reads the port. While a reader thread
+    owns it (see myo_reader), waiting threads sleep until the reader has
+    handled the packet they need instead.'''
+    ## largest single read; anything beyond this stays in the OS buffer until
+    ## the framer has caught up
+    READ_MAX = 4096
+
+    def __init__(self, tty, capture=None):
+        ## tty may also be an already open serial-like object, e.g. a
+        ## myo_capture.ReplaySerial
+        if hasattr(tty, 'read'):
+            self.ser = tty
+        else:
+            self.ser = serial.Serial(port=tty, baudrate=9600, dsrdtr=1)
+
+        ## every byte read from the port is teed into the capture, if any
+        if capture is not None and not hasattr(capture, 'write'):
+            from myo_capture import CaptureWriter
+            capture = CaptureWriter(capture)
+        self.capture = capture
+
+        self.buf = b''
+        self.view = memoryview(self.buf)
+        self.pos = 0
+        self.t_read = None
+        ## bytes skipped to get back in sync with the packet stream
+        self.skipped = 0
+        ## instrument.Stats, while enabled
+        self.stats = None
         self.lock = threading.Lock()
         self.handlers = []
 
+        ## (cls, cmd) -> futures waiting for a response, oldest first
+        self.outstanding = {}
+        ## connection -> queued AttrOps, and the AttrOp currently running
+        self.att_queue = {}
+        self.att_busy = {}
+
+        ## set while a myo_reader.Reader thread owns the port; other threads
+        ## wait on packet_cond, which it notifies after each packet
+        self.reader = None
+        self.packet_cond = threading.Condition(threading.Lock())
+        self.waiters = 0
+        self.seq = 0
+        self.last_packet = None
+
     ## internal data-handling methods
     def recv_packet(self, timeout=None):
         t0 = time.time()
-        self.ser.timeout = None
-        while timeout is None or time.time() < t0 + timeout:
-            if timeout is not None: self.ser.timeout = t0 + timeout - time.time()
-            c = self.ser.read()
-            if not c: return None
-
-            ret = self.proc_byte(ord(c))
-            if ret:
-                if ret.typ == 0x80:
-                    self.handle_event(ret)
-                return ret
+        while True:
+            p = self.next_packet()
+            if p is not None:
+                self.dispatch(p)
+                return p
+
+            if timeout is None:
+                self.set_timeout(None)
+            else:
+                remaining = t0 + timeout - time.time()
+                if remaining <= 0: return None
+                self.set_timeout(remaining)
+
+            if not self.fill(): return None
 
     def recv_packets(self, timeout=.5):
         res = []
@@ -90,158 +249,527 @@ class BT(object):
             res.append(p)
         return res
 
-    def proc_byte(self, c):
-        if not self.buf:
-            if c in [0x00, 0x80, 0x08, 0x88]:
-                self.buf.append(c)
-            return None
-        elif len(self.buf) == 1:
-            self.buf.append(c)
-            self.packet_len = 4 + (self.buf[0] & 0x07) + self.buf[1]
-            return None
+    def set_timeout(self, timeout):
+        ## changing the timeout reconfigures the port, so only do it when needed
+        if self.ser.timeout != timeout:
+            self.ser.timeout = timeout
+
+    def fill(self):
+        '''Reads everything waiting on the port (blocking for at least one byte,
+        subject to the port timeout) and appends it to the framing buffer.
+        Returns the number of bytes read.'''
+        n = min(max(getattr(self.ser, 'in_waiting', 0), 1), self.READ_MAX)
+        data = self.ser.read(n)
+        if data:
+            self.t_read = monotonic()
+            if self.capture is not None:
+                self.capture.write(data)
+            self.feed(data)
+        return len(data)
+
+    def close(self):
+        if self.capture is not None:
+            self.capture.close()
+            self.capture = None
+        self.ser.close()
+
+    def feed(self, data):
+        '''Appends raw bytes to the framing buffer. Only the unframed tail of
+        the previous chunk is copied; complete packets are later handed out as
+        views into the chunk.'''
+        if self.pos < len(self.buf):
+            self.buf = self.buf[self.pos:] + bytes(data)
         else:
-            self.buf.append(c)
-
-        if self.packet_len and len(self.buf) == self.packet_len:
-            p = Packet(self.buf)
-            self.buf = []
-            return p
+            self.buf = bytes(data)
+        self.pos = 0
+        self.view = memoryview(self.buf)
+
+    def next_packet(self):
+        '''Frames the next complete BGAPI packet out of the buffer, or returns
+        None if more bytes are needed.'''
+        if self.stats is None:
+            return self.frame()
+        t = monotonic()
+        p = self.frame()
+        if p is not None:
+            self.stats.timer('framing').record(monotonic() - t)
+        return p
+
+    def frame(self):
+        buf = self.buf
+        pos = self.pos
+        end = len(buf)
+        while pos < end:
+            typ = buf[pos]
+            if typ not in (0x00, 0x80, 0x08, 0x88):
+                ## out of sync; skip to the next plausible header byte
+                pos += 1
+                self.skipped += 1
+                continue
+            if end - pos < 4:
+                break
+            n = 4 + (typ & 0x07) + buf[pos + 1]
+            if end - pos < n:
+                break
+            self.pos = pos + n
+            return Packet(typ, buf[pos + 2], buf[pos + 3], self.view[pos + 4:pos + n], self.t_read)
+        self.pos = pos
         return None
 
+    def proc_byte(self, c):
+        self.feed(multichr([c]))
+        return self.next_packet()
+
+    def dispatch(self, p):
+        if p.typ == 0x80:
+            self.handle_event(p)
+        elif p.typ == 0x00:
+            self.handle_response(p)
+
     def handle_event(self, p):
+        if p.cls == 4 and self.att_busy:
+            self.handle_att_event(p)
+        elif p.cls == 3 and p.cmd == 4 and len(p.payload):
+            ## disconnected
+            self.drop_attr_ops(p.payload[0])
         for h in self.handlers:
             h(p)
 
+    def handle_response(self, p):
+        q = self.outstanding.get((p.cls, p.cmd))
+        if q:
+            q.popleft().set_result(p)
+
+    ## the list is replaced rather than changed, so handlers can remove
+    ## themselves (or be added from another thread) during dispatch
     def add_handler(self, h):
-        self.handlers.append(h)
+        self.handlers = self.handlers + [h]
 
     def remove_handler(self, h):
-        try: self.handlers.remove(h)
-        except ValueError: pass
+        self.handlers = [x for x in self.handlers if x != h]
 
-    def wait_event(self, cls, cmd):
-        res = [None]
+    def wait_until(self, cond, timeout=None):
+        '''Reads packets until cond() is true; False if timeout passed or the
+        port ran dry first.'''
+        t0 = time.time()
+        while not cond():
+            remaining = None
+            if timeout is not None:
+                remaining = t0 + timeout - time.time()
+                if remaining <= 0: return False
+            if self.reading_elsewhere():
+                self.wait_reader(cond, remaining)
+            elif self.recv_packet(remaining) is None and timeout is None:
+                return False
+        return True
+
+    def reading_elsewhere(self):
+        reader = self.reader
+        return reader is not None and reader is not threading.current_thread()
+
+    def wait_reader(self, cond, timeout=None):
+        '''Sleeps until the reader thread has made cond() true, timeout has
+        passed or the reader has stopped.'''
+        t0 = time.time()
+        with self.packet_cond:
+            self.waiters += 1
+            try:
+                while not cond() and self.reader is not None:
+                    if timeout is None:
+                        self.packet_cond.wait()
+                    else:
+                        remaining = t0 + timeout - time.time()
+                        if remaining <= 0: break
+                        self.packet_cond.wait(remaining)
+            finally:
+                self.waiters -= 1
+
+    def notify_waiters(self, p=None):
+        '''Called by the reader thread after handling each packet.'''
+        if self.waiters or p is None:
+            with self.packet_cond:
+                self.seq += 1
+                self.last_packet = p
+                self.packet_cond.notify_all()
+
+    def wait_packet(self, timeout=None):
+        '''Waits for the reader thread to handle the next packet and returns
+        it, or None on timeout.'''
+        with self.packet_cond:
+            seq = self.seq
+        self.wait_reader(lambda: self.seq != seq, timeout)
+        return self.last_packet if self.seq != seq else None
+
+    def wait_event(self, cls, cmd, timeout=None, cond=None):
+        f = self.wait_event_async(cls, cmd, cond)
+        try:
+            return f.result(timeout)
+        finally:
+            self.remove_handler(f.handler)
+
+    def wait_event_async(self, cls, cmd, cond=None):
+        '''CommandFuture for the next event (cls, cmd) for which cond(p)
+        holds. Call it before sending the command that causes the event.'''
+        f = CommandFuture(self)
         def h(p):
-            if p.cls == cls and p.cmd == cmd:
-                res[0] = p
+            if p.cls == cls and p.cmd == cmd and (cond is None or cond(p)) and not f.done():
+                self.remove_handler(h)
+                f.set_result(p)
+        f.handler = h
         self.add_handler(h)
-        while res[0] is None:
-            self.recv_packet()
-        self.remove_handler(h)
-        return res[0]
-
-    ## specific BLE commands
-    def connect(self, addr):
-        return self.send_command(6, 3, pack('6sBHHHH', multichr(addr), 0, 6, 6, 64, 0))
-
-    def get_connections(self):
-        return self.send_command(0, 6)
-
-    def discover(self):
-        return self.send_command(6, 2, b'\x01')
-
-    def end_scan(self):
-        return self.send_command(6, 4)
-
-    def disconnect(self, h):
-        return self.send_command(3, 0, pack('B', h))
-
-    def read_attr(self, con, attr):
-        self.send_command(4, 4, pack('BH', con, attr))
-        return self.wait_event(4, 5)
-
-    def write_attr(self, con, attr, val):
-        self.send_command(4, 5, pack('BHB', con, attr, len(val)) + val)
-        return self.wait_event(4, 1)
+        return f
+
+    ## specific BLE commands; with wait_resp=False they return a CommandFuture
+    def connect(self, addr, wait_resp=True):
+        return self.send_command(6, 3, pack('6sBHHHH', multichr(addr), 0, 6, 6, 64, 0), wait_resp)
+
+    def get_connections(self, wait_resp=True):
+        return self.send_command(0, 6, wait_resp=wait_resp)
+
+    def discover(self, wait_resp=True):
+        return self.send_command(6, 2, b'\x01', wait_resp)
+
+    def end_scan(self, wait_resp=True):
+        return self.send_command(6, 4, wait_resp=wait_resp)
+
+    def disconnect(self, h, wait_resp=True):
+        self.drop_attr_ops(h)
+        return self.send_command(3, 0, pack('B', h), wait_resp)
+
+    def read_attr(self, con, attr, timeout=None):
+        return self.read_attr_async(con, attr).result(timeout)
+
+    def write_attr(self, con, attr, val, timeout=None):
+        return self.write_attr_async(con, attr, val, coalesce=False).result(timeout)
+
+    def read_attr_async(self, con, attr):
+        return self.queue_attr_op(AttrOp('read', con, attr, None, CommandFuture(self)))
+
+    def write_attr_async(self, con, attr, val, coalesce=True, ack=True):
+        '''Queues a write of val to attr. With coalesce, a write identical to
+        the last op still queued on the connection isn't queued again; its
+        future is returned instead. ack=False sends a write command, which
+        the dongle confirms without waiting for the device.'''
+        op = AttrOp('write' if ack else 'command', con, attr, bytes(val), CommandFuture(self))
+        return self.queue_attr_op(op, coalesce)
+
+    def queue_attr_op(self, op, coalesce=False):
+        with self.lock:
+            q = self.att_queue.setdefault(op.con, deque())
+            last = q[-1] if q else None
+            if coalesce and last is not None and (last.kind, last.attr, last.val) == (op.kind, op.attr, op.val):
+                return last.future
+            q.append(op)
+        self.start_attr_op(op.con)
+        return op.future
+
+    def start_attr_op(self, con):
+        with self.lock:
+            q = self.att_queue.get(con)
+            if con in self.att_busy or not q:
+                return
+            op = q.popleft()
+            self.att_busy[con] = op
+
+        if op.kind == 'read':
+            f = self.send_command_async(4, 4, pack('BH', con, op.attr))
+        elif op.kind == 'write':
+            f = self.send_command_async(4, 5, pack('BHB', con, op.attr, len(op.val)) + op.val)
+        else:
+            f = self.send_command_async(4, 6, pack('BHB', con, op.attr, len(op.val)) + op.val)
+
+        def responded(f):
+            ## a failed command never starts a procedure, and a write command
+            ## is done as soon as the dongle accepts it
+            result = unpack('H', f.packet.payload[1:3])
+            if op.kind == 'command' or (result is not None and result[0] != 0):
+                self.finish_attr_op(op, f.packet)
+        f.add_done_callback(responded)
+
+    def finish_attr_op(self, op, p):
+        with self.lock:
+            if self.att_busy.get(op.con) is not op:
+                return
+            del self.att_busy[op.con]
+        op.future.set_result(p)
+        self.start_attr_op(op.con)
+
+    def drop_attr_ops(self, con):
+        '''Forgets the running and queued attribute ops of connection con,
+        which has gone, so they can't reach the next connection to get its
+        handle; their futures complete with None.'''
+        with self.lock:
+            busy = self.att_busy.pop(con, None)
+            queued = self.att_queue.pop(con, ())
+        for op in ([busy] if busy is not None else []) + list(queued):
+            op.future.set_result(None)
+
+    def handle_att_event(self, p):
+        op = self.att_busy.get(p.payload[0]) if len(p.payload) >= 3 else None
+        if op is None:
+            return
+        if p.cmd == 1:
+            ## procedure completed: ends writes, and reads that failed
+            self.finish_attr_op(op, p)
+        elif p.cmd == 5 and op.kind == 'read' and len(p.payload) >= 4 and \
+             (p.payload[1] | p.payload[2] << 8) == op.attr and p.payload[3] == 0:
+            self.finish_attr_op(op, p)
+
+    def send_command_async(self, cls, cmd, payload=b''):
+        s = pack('4B', 0, len(payload), cls, cmd) + payload
+        f = CommandFuture(self)
+        with self.lock:
+            self.outstanding.setdefault((cls, cmd), deque()).append(f)
+            self.ser.write(s)
+        return f
 
     def send_command(self, cls, cmd, payload=b'', wait_resp=True):
-        s = pack('4B', 0, len(payload), cls, cmd) + payload
-        self.ser.write(s)
+        f = self.send_command_async(cls, cmd, payload)
+        if not wait_resp:
+            return f
+        return f.result()
 
-        while True:
-            p = self.recv_packet()
 
-            ## no timeout, so p won't be None
-            if p.typ == 0: return p
+def is_myo(p):
+    '''Whether p is a scan response from a Myo.'''
+    return p.cls == 6 and p.cmd == 0 and p.payload[-17:] == MYO_SCAN_SUFFIX
 
-            ## not a response: must be an event
-            self.handle_event(p)
+
+def find_dongles():
+    '''The ports of every attached BLED112 dongle.'''
+    return [p[0] for p in comports() if re.search(r'PID=2458:0*1', p[2])]
 
 
 class MyoRaw(object):
     '''Implements the Myo-specific communication protocol.'''
 
-    def __init__(self, tty=None):
-        if tty is None:
-            tty = self.detect_tty()
-        if tty is None:
-            raise ValueError('Myo dongle not found!')
+    ## seconds to wait for each connection attempt, and attempts per address
+    CONNECT_TIMEOUT = 5
+    CONNECT_RETRIES = 2
+
+    def __init__(self, tty=None, capture=None, bt=None):
+        ## bt lets several MyoRaws share one dongle (see myo_manager)
+        if bt is None:
+            if tty is None:
+                tty = self.detect_tty()
+            if tty is None:
+                raise ValueError('Myo dongle not found!')
+            bt = BT(tty, capture)
 
-        self.bt = BT(tty)
+        self.bt = bt
         self.conn = None
+        self.addr = None
+        self.name = None
+        self.firmware = None
+        ## seconds from the start of connect() to being connected, and to
+        ## the first EMG frame
+        self.t_connect = None
+        self.connect_time = None
+        self.first_emg_time = None
         self.emg_handlers = []
         self.imu_handlers = []
         self.arm_handlers = []
         self.pose_handlers = []
-        
+
         self.emg = []
+        self.reader = None
+        self.stats = None
+        ## attr -> t_recv of the packet whose handlers are running
+        self.t_recv = {}
+
+        ## (cls, cmd, attr) -> (payload size, unpack_from, handler)
+        self.attr_handlers = {}
+        self.attr_cmds = set()
+        self.decode_errors = Counter()
+        self.unknown_attrs = Counter()
+
+        self.register_attr(0x27, EMG_STRUCT, self.decode_emg)
+        ## the EMG entry decode_first_emg stands in for
+        self.emg_entry = None
+        self.register_attr(0x1c, IMU_STRUCT, self.decode_imu)
+        self.register_attr(0x23, ARM_STRUCT, self.decode_arm)
 
     def detect_tty(self):
-        for p in comports():
-            if re.search(r'PID=2458:0*1', p[2]):
-                print('using device:', p[0])
-                return p[0]
+        for tty in find_dongles():
+            print('using device:', tty)
+            return tty
 
         return None
 
     def run(self, timeout=None):
-        self.bt.recv_packet(timeout)
-
-    def connect(self):
+        if self.reader is not None:
+            ## the reader thread is doing the work; just wait for a packet
+            return self.bt.wait_packet(timeout)
+        return self.bt.recv_packet(timeout)
+
+    def start_reader(self, maxlen=1024, overflow='drop_oldest'):
+        '''Hands the port to a background reader thread; from now on
+        handlers run on one consumer thread per attribute (see myo_reader).
+        Returns the Reader, whose dropped counts show any overflow.'''
+        if self.reader is None:
+            self.reader = Reader(self, maxlen, overflow)
+            self.reader.start()
+        return self.reader
+
+    def stop_reader(self):
+        '''Stops the reader thread once the queued values are handled;
+        run() reads the port itself again.'''
+        reader = self.reader
+        if reader is not None:
+            reader.stop()
+            self.reader = None
+            self.bt.notify_waiters()
+
+    def connect(self, addr=None, profiles=None, timeout=None):
+        '''Connects to the Myo at addr (6 address bytes, as in scan
+        responses), or to the first one found, and starts streaming.
+
+        With profiles (a myo_profile.Profiles), the Myo connected last, or
+        addr's profile, is first tried directly without scanning, and its
+        cached firmware version and name aren't read again; the profile is
+        saved once connected. timeout bounds the scan (None scans until a
+        Myo turns up). Raises ValueError if no Myo could be connected.'''
+        t0 = time.time()
+        self.t_connect = t0
+        self.first_emg_time = None
+        self.name = None
+        self.reset()
+        if addr is not None:
+            addr = parse_addr(addr)
+
+        profile = profiles.get(addr) if profiles is not None else None
+        if profile is not None and not self.connect_retry(list(multiord(profile.addr))):
+            if addr is not None:
+                raise ValueError('Myo not found!')
+            print('last Myo not reachable')
+            profile = None
+        if self.conn is None:
+            if addr is None:
+                addr = self.scan(timeout)
+            if addr is None or not self.connect_retry(list(multiord(addr))):
+                raise ValueError('Myo not found!')
+        self.connect_time = time.time() - t0
+
+        self.configure(profile)
+        if profiles is not None:
+            profiles.put(self.addr, self.firmware, self.name)
+
+        ## report the first EMG frame, then decode with whatever is
+        ## registered for it
+        entry = self.attr_handlers.get((4, 5, 0x27))
+        if entry is not None and entry[2] != self.decode_first_emg:
+            self.emg_entry = entry
+            self.attr_handlers[(4, 5, 0x27)] = entry[:2] + (self.decode_first_emg,)
+        ## add data handlers, once however often this is called
+        self.bt.remove_handler(self.handle_data)
+        self.bt.add_handler(self.handle_data)
+        print('connected in %.3f s' % self.connect_time)
+
+    def connect_retry(self, addr):
+        '''connect_to addr up to CONNECT_RETRIES times; whether it worked.'''
+        for i in range(self.CONNECT_RETRIES):
+            if self.connect_to(addr, self.CONNECT_TIMEOUT) is not None:
+                return True
+        return False
+
+    def reset(self):
         ## stop everything from before
         self.bt.end_scan()
         self.bt.disconnect(0)
         self.bt.disconnect(1)
         self.bt.disconnect(2)
+        self.conn = None
 
-        ## start scanning
+    def scan(self, timeout=None):
+        '''Scans until a Myo advertises; returns its address, or None if
+        timeout passes first.'''
         print('scanning...')
+        addr = None
+        t0 = time.time()
         self.bt.discover()
         while True:
-            p = self.bt.recv_packet()
+            remaining = None
+            if timeout is not None:
+                remaining = t0 + timeout - time.time()
+                if remaining <= 0:
+                    break
+            p = self.bt.recv_packet(remaining)
             #print('scan response:', p)
 
-            if p.payload.endswith(b'\x06\x42\x48\x12\x4A\x7F\x2C\x48\x47\xB9\xDE\x04\xA9\x01\x00\x06\xD5'):
+            if p is not None and is_myo(p):
                 addr = list(multiord(p.payload[2:8]))
                 break
         print("Scan complete")
         self.bt.end_scan()
-        
-        ## connect and wait for status event
-        conn_pkt = self.bt.connect(addr)
-        self.conn = multiord(conn_pkt.payload)[-1]
-        self.bt.wait_event(3, 0)
-
-        ## get firmware version
-        fw = self.read_attr(0x17)
-        _, _, _, _, v0, v1, v2, v3 = unpack('BHBBHHHH', fw.payload)
-        print('firmware version: %d.%d.%d.%d' % (v0, v1, v2, v3))
-
-        self.old = (v0 == 0)
+        return addr
 
+    def connect_to(self, addr, timeout=None):
+        '''Connects to addr; returns the connection status event, or None
+        (and cancels the attempt) if timeout passes first.'''
+        ## connect and wait for status event
+        status = self.bt.wait_event_async(3, 0, lambda p: p.payload[0] == self.conn)
+        f = self.bt.connect(addr, wait_resp=False)
+        ## set from the response itself, in case a reader thread handles the
+        ## status event before result() returns here
+        f.add_done_callback(lambda f: setattr(self, 'conn', multiord(f.packet.payload)[-1]))
+        f.result()
+        self.addr = bytes(multichr(addr))
+        if status.result(timeout) is None:
+            self.bt.remove_handler(status.handler)
+            ## end_procedure, which shares its id with end_scan
+            self.bt.end_scan()
+            self.conn = None
+            return None
+        return status.packet
+
+    def configure(self, profile=None):
+        '''Sets up streaming; the firmware version and name come from
+        profile if it has them, and are read otherwise.'''
+        if profile is not None and profile.firmware:
+            self.set_firmware(profile.firmware)
+            self.name = profile.name
+        else:
+            ## get firmware version
+            fw = self.read_attr(0x17)
+            self.set_firmware(fw)
+
+            if not self.old:
+                name = self.read_attr(0x03)
+                if name is not None:
+                    self.name = bytes(name.payload[ATTR_HEADER.size:]).decode('utf-8', 'replace')
+        if self.name is not None:
+            print('device name: %s' % self.name)
+
+        self.write_attrs(self.config_writes(), coalesce=False)
+
+    def set_firmware(self, fw):
+        '''Takes the firmware version from the result of reading 0x17, or
+        from a (major, minor, patch, build) tuple.'''
+        if isinstance(fw, Packet):
+            fw = unpack('HHHH', fw.payload[ATTR_HEADER.size:])
+        if fw is None:
+            raise ValueError('could not read the firmware version')
+        self.firmware = tuple(fw)
+        print('firmware version: %d.%d.%d.%d' % self.firmware)
+        self.old = (self.firmware[0] == 0)
+
+    def config_writes(self):
+        '''The (attr, val) writes that set up streaming after connecting.'''
         if self.old:
             ## don't know what these do; Myo Connect sends them, though we get data
             ## fine without them
-            self.write_attr(0x19, b'\x01\x02\x00\x00')
-            self.write_attr(0x2f, b'\x01\x00')
-            self.write_attr(0x2c, b'\x01\x00')
-            self.write_attr(0x32, b'\x01\x00')
-            self.write_attr(0x35, b'\x01\x00')
+            writes = [
+                (0x19, b'\x01\x02\x00\x00'),
+                (0x2f, b'\x01\x00'),
+                (0x2c, b'\x01\x00'),
+                (0x32, b'\x01\x00'),
+                (0x35, b'\x01\x00'),
+            ]
 
             ## enable EMG data
-            self.write_attr(0x28, b'\x01\x00')
+            writes.append((0x28, b'\x01\x00'))
             ## enable IMU data
-            self.write_attr(0x1d, b'\x01\x00')
+            writes.append((0x1d, b'\x01\x00'))
 
             ## Sampling rate of the underlying EMG sensor, capped to 1000. If it's
             ## less than 1000, emg_hz is correct. If it is greater, the actual
@@ -256,64 +784,163 @@ class MyoRaw(object):
             imu_hz = 50
 
             ## send sensor parameters, or we don't get any data
-            self.write_attr(0x19, pack('BBBBHBBBBB', 2, 9, 2, 1, C, emg_smooth, C // emg_hz, imu_hz, 0, 0))
-
-        else:
-            name = self.read_attr(0x03)
-            print('device name: %s' % name.payload)
+            writes.append((0x19, pack('BBBBHBBBBB', 2, 9, 2, 1, C, emg_smooth, C // emg_hz, imu_hz, 0, 0)))
+            return writes
 
+        return [
             ## enable IMU data
-            self.write_attr(0x1d, b'\x01\x00')
+            (0x1d, b'\x01\x00'),
             ## enable on/off arm notifications
-            self.write_attr(0x24, b'\x02\x00')
-
-            # self.write_attr(0x19, b'\x01\x03\x00\x01\x01')
-            self.start_raw()
-
-        ## add data handlers
-        def handle_data(p):
-            if (p.cls, p.cmd) != (4, 5): return
-
-            c, attr, typ = unpack('BHB', p.payload[:4])
-            pay = p.payload[5:]
-
-            if attr == 0x27:
-                vals = unpack('8HB', pay)
-                ## not entirely sure what the last byte is, but it's a bitmask that
-                ## seems to indicate which sensors think they're being moved around or
-                ## something
-                emg = vals[:8]
-                self.emg = vals[:8]
-                moving = vals[8]
-                self.on_emg(emg, moving)
-            elif attr == 0x1c:
-                vals = unpack('10h', pay)
-                quat = vals[:4]
-                acc = vals[4:7]
-                gyro = vals[7:10]
-                self.on_imu(quat, acc, gyro)
-            elif attr == 0x23:
-            	try:
-                    typ, val, xdir = unpack('3B', pay)
-                    if typ == 1: # on arm
-                        self.on_arm(Arm(val), XDirection(xdir))
-                    elif typ == 2: # removed from arm
-                        self.on_arm(Arm.UNKNOWN, XDirection.UNKNOWN)
-                    elif typ == 3: # pose
-                        self.on_pose(Pose(val))
-                except:
-                    print("None")
-                    return
-            else:
-                print('data with unknown attr: %02X %s' % (attr, p))
+            (0x24, b'\x02\x00'),
+            # (0x19, b'\x01\x03\x00\x01\x01'),
+        ] + START_RAW
+
+    def register_attr(self, attr, fmt, h, cls=4, cmd=5):
+        '''Registers h to be called with the unpacked value of every
+        notification for attr. fmt is a struct.Struct or a little-endian
+        struct format string; values whose length doesn't match it are counted
+        in decode_errors instead of reaching h.'''
+        if not isinstance(fmt, struct.Struct):
+            fmt = struct.Struct('<' + fmt)
+        self.attr_handlers[(cls, cmd, attr)] = (fmt.size, fmt.unpack_from, h)
+        self.attr_cmds.add((cls, cmd))
+
+    def unregister_attr(self, attr, cls=4, cmd=5):
+        self.attr_handlers.pop((cls, cmd, attr), None)
+
+    def handle_data(self, p):
+        if (p.cls, p.cmd) not in self.attr_cmds: return
+
+        pay = p.payload
+        if len(pay) < ATTR_HEADER.size:
+            self.decode_errors[None] += 1
+            return
+
+        attr = pay[1] | pay[2] << 8
+        entry = self.attr_handlers.get((p.cls, p.cmd, attr))
+        if entry is None:
+            self.unknown_attrs[attr] += 1
+            return
 
-        self.bt.add_handler(handle_data)
+        size, unpack_from, h = entry
+        if len(pay) - ATTR_HEADER.size != size:
+            self.decode_errors[attr] += 1
+            return
+        if self.stats is not None:
+            self.handle_data_timed(p, attr, unpack_from, h)
+        elif self.reader is None:
+            h(unpack_from(pay, ATTR_HEADER.size))
+        else:
+            self.reader.dispatch(attr, h, unpack_from(pay, ATTR_HEADER.size))
+
+    def handle_data_timed(self, p, attr, unpack_from, h):
+        stats = self.stats
+        t = monotonic()
+        vals = unpack_from(p.payload, ATTR_HEADER.size)
+        stats.timer('decode').record(monotonic() - t)
+        stats.rate(STREAMS.get(attr, '%#x' % attr)).tick(p.t_recv)
+        if self.reader is None:
+            self.t_recv[attr] = p.t_recv
+            h(vals)
+        else:
+            self.reader.dispatch(attr, self.call_timed, (attr, h, vals, p.t_recv))
+
+    def call_timed(self, args):
+        ## on a reader consumer thread; there is one per attribute
+        attr, h, vals, t_recv = args
+        self.t_recv[attr] = t_recv
+        h(vals)
+
+    def enable_stats(self, stats=None):
+        '''Starts collecting hot-path timings (see instrument); returns the
+        Stats.'''
+        if stats is None:
+            stats = Stats()
+        stats.add_source('myo', self.counters)
+        self.stats = self.bt.stats = stats
+        return stats
+
+    def disable_stats(self):
+        self.stats = self.bt.stats = None
+
+    def counters(self):
+        res = {
+            'decode_errors': sum(self.decode_errors.values()),
+            'unknown_attrs': sum(self.unknown_attrs.values()),
+            'skipped_bytes': self.bt.skipped,
+        }
+        if self.reader is not None:
+            res['dropped'] = sum(self.reader.dropped.values())
+        return res
 
+    def call_handlers(self, stream, attr, handlers, args):
+        '''Runs handlers with timing, then records the latency since the
+        packet that triggered them was read.'''
+        stats = self.stats
+        stats.call_handlers(stream, handlers, args)
+        t_recv = self.t_recv.get(attr)
+        if t_recv is not None:
+            stats.timer('latency.%s' % stream).record(monotonic() - t_recv)
+
+    def decode_emg(self, vals):
+        ## not entirely sure what the last byte is, but it's a bitmask that
+        ## seems to indicate which sensors think they're being moved around or
+        ## something
+        emg = vals[:8]
+        self.emg = emg
+        self.on_emg(emg, vals[8])
+
+    def decode_first_emg(self, vals):
+        ## stands in for the registered EMG handler until the first frame
+        self.first_emg_time = time.time() - self.t_connect
+        print('first EMG frame after %.3f s' % self.first_emg_time)
+        self.attr_handlers[(4, 5, 0x27)] = self.emg_entry
+        self.emg_entry[2](vals)
+
+    def decode_imu(self, vals):
+        self.on_imu(vals[:4], vals[4:7], vals[7:10])
+
+    def decode_arm(self, vals):
+        typ, val, xdir = vals
+        if typ == 1: # on arm
+            arm = ARMS.get(val)
+            xd = XDIRECTIONS.get(xdir)
+            if arm is None or xd is None:
+                self.decode_errors[0x23] += 1
+                return
+            self.on_arm(arm, xd)
+        elif typ == 2: # removed from arm
+            self.on_arm(Arm.UNKNOWN, XDirection.UNKNOWN)
+        elif typ == 3: # pose
+            pose = POSES.get(val)
+            if pose is None:
+                self.decode_errors[0x23] += 1
+                return
+            self.on_pose(pose)
 
     def write_attr(self, attr, val):
         if self.conn is not None:
             self.bt.write_attr(self.conn, attr, val)
 
+    def write_attr_async(self, attr, val, coalesce=True, ack=True):
+        '''Queues a write without waiting for it; returns a CommandFuture (see
+        BT.write_attr_async), or None if not connected.'''
+        if self.conn is not None:
+            return self.bt.write_attr_async(self.conn, attr, val, coalesce, ack)
+        return None
+
+    def write_attrs(self, writes, timeout=None, coalesce=True):
+        '''Queues a sequence of (attr, val) writes as one pipelined batch and
+        waits until the last has completed. With coalesce, a write identical
+        to the one queued just before it is sent once; protocol sequences
+        that repeat writes on purpose pass coalesce=False.'''
+        f = None
+        for attr, val in writes:
+            f = self.write_attr_async(attr, val, coalesce) or f
+        if f is not None:
+            return f.result(timeout)
+        return None
+
     def read_attr(self, attr):
         if self.conn is not None:
             return self.bt.read_attr(self.conn, attr)
@@ -322,15 +949,14 @@ class MyoRaw(object):
     def disconnect(self):
         if self.conn is not None:
             self.bt.disconnect(self.conn)
+            self.conn = None
 
     def start_raw(self):
         '''Sending this sequence for v1.0 firmware seems to enable both raw data and
         pose notifications.
         '''
 
-        self.write_attr(0x28, b'\x01\x00')
-        self.write_attr(0x19, b'\x01\x03\x01\x01\x00')
-        self.write_attr(0x19, b'\x01\x03\x01\x01\x01')
+        self.write_attrs(START_RAW, coalesce=False)
 
     def mc_start_collection(self):
         '''Myo Connect sends this sequence (or a reordering) when starting data
@@ -338,18 +964,20 @@ class MyoRaw(object):
         pose notifications.
         '''
 
-        self.write_attr(0x28, b'\x01\x00')
-        self.write_attr(0x1d, b'\x01\x00')
-        self.write_attr(0x24, b'\x02\x00')
-        self.write_attr(0x19, b'\x01\x03\x01\x01\x01')
-        self.write_attr(0x28, b'\x01\x00')
-        self.write_attr(0x1d, b'\x01\x00')
-        self.write_attr(0x19, b'\x09\x01\x01\x00\x00')
-        self.write_attr(0x1d, b'\x01\x00')
-        self.write_attr(0x19, b'\x01\x03\x00\x01\x00')
-        self.write_attr(0x28, b'\x01\x00')
-        self.write_attr(0x1d, b'\x01\x00')
-        self.write_attr(0x19, b'\x01\x03\x01\x01\x00')
+        self.write_attrs([
+            (0x28, b'\x01\x00'),
+            (0x1d, b'\x01\x00'),
+            (0x24, b'\x02\x00'),
+            (0x19, b'\x01\x03\x01\x01\x01'),
+            (0x28, b'\x01\x00'),
+            (0x1d, b'\x01\x00'),
+            (0x19, b'\x09\x01\x01\x00\x00'),
+            (0x1d, b'\x01\x00'),
+            (0x19, b'\x01\x03\x00\x01\x00'),
+            (0x28, b'\x01\x00'),
+            (0x1d, b'\x01\x00'),
+            (0x19, b'\x01\x03\x01\x01\x00'),
+        ], coalesce=False)
 
     def mc_end_collection(self):
         '''Myo Connect sends this sequence (or a reordering) when ending data collection
@@ -357,18 +985,20 @@ class MyoRaw(object):
         doesn't disable raw data.
         '''
 
-        self.write_attr(0x28, b'\x01\x00')
-        self.write_attr(0x1d, b'\x01\x00')
-        self.write_attr(0x24, b'\x02\x00')
-        self.write_attr(0x19, b'\x01\x03\x01\x01\x01')
-        self.write_attr(0x19, b'\x09\x01\x00\x00\x00')
-        self.write_attr(0x1d, b'\x01\x00')
-        self.write_attr(0x24, b'\x02\x00')
-        self.write_attr(0x19, b'\x01\x03\x00\x01\x01')
-        self.write_attr(0x28, b'\x01\x00')
-        self.write_attr(0x1d, b'\x01\x00')
-        self.write_attr(0x24, b'\x02\x00')
-        self.write_attr(0x19, b'\x01\x03\x01\x01\x01')
+        self.write_attrs([
+            (0x28, b'\x01\x00'),
+            (0x1d, b'\x01\x00'),
+            (0x24, b'\x02\x00'),
+            (0x19, b'\x01\x03\x01\x01\x01'),
+            (0x19, b'\x09\x01\x00\x00\x00'),
+            (0x1d, b'\x01\x00'),
+            (0x24, b'\x02\x00'),
+            (0x19, b'\x01\x03\x00\x01\x01'),
+            (0x28, b'\x01\x00'),
+            (0x1d, b'\x01\x00'),
+            (0x24, b'\x02\x00'),
+            (0x19, b'\x01\x03\x01\x01\x01'),
+        ], coalesce=False)
 
     def vibrate(self, length):
         if length in xrange(1, 4):
@@ -390,18 +1020,26 @@ class MyoRaw(object):
         self.arm_handlers.append(h)
 
     def on_emg(self, emg, moving):
+        if self.stats is not None:
+            return self.call_handlers('emg', 0x27, self.emg_handlers, (emg, moving))
         for h in self.emg_handlers:
             h(emg, moving)
 
     def on_imu(self, quat, acc, gyro):
+        if self.stats is not None:
+            return self.call_handlers('imu', 0x1c, self.imu_handlers, (quat, acc, gyro))
         for h in self.imu_handlers:
             h(quat, acc, gyro)
 
     def on_pose(self, p):
+        if self.stats is not None:
+            return self.call_handlers('pose', 0x23, self.pose_handlers, (p,))
         for h in self.pose_handlers:
             h(p)
 
     def on_arm(self, arm, xdir):
+        if self.stats is not None:
+            return self.call_handlers('arm', 0x23, self.arm_handlers, (arm, xdir))
         for h in self.arm_handlers:
             h(arm, xdir)
     
@@ -2,24 +2,39 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import print_function
+import atexit
 import sys
 import time
 import numpy as np
-from matplotlib import pyplot as plt
 
+from emg_recorder import Recorder
+from instrument import RateMeter
+from live_plot import CHANNEL_COLORS, CHANNEL_LABELS, LivePlot
 from myo_raw import MyoRaw
-from kbhit import *
+from myo_profile import Profiles
+from session_writer import SessionWriter, SUFFIX, write_csv
 
 class OutputUnit:
-    def __init__(self, saving_path):
+    def __init__(self, saving_path, retention=None):
         self.saving_path = saving_path
+        # [EMG0, EMG1, EMG2, EMG3, EMG4, EMG5, EMG6, EMG7, TIME, STATUS]
+        self.recorder = Recorder(10, retention=retention)
         self.tytle_dic = {"DATA"   : [["EMG0", "EMG1", "EMG2", "EMG3",
                                        "EMG4", "EMG5", "EMG6", "EMG7", "TIME", "STATUS"]],
                           "STATUS" : [["ROCK", "SCISSOR", "PAPER"]]
                           }
         self.plt_graph = True
-        self.save_csv  = True
-        self.byn_np    = True
+        # also write <saving_path>.csv / .npy at exit; off by default, the
+        # session is streamed to the .rec file and exported on demand
+        # (export(), or session_writer.py export)
+        self.save_csv  = False
+        self.byn_np    = False
+        # stream the session to <saving_path>.rec while recording
+        self.stream_session = True
+        # reconnect straight to the last Myo, skipping the scan
+        self.use_profiles = True
+        # plot EMG live while recording (reads on a background thread)
+        self.live_plot = False
         
         self.black_myo = False
         self.white_myo = True
@@ -29,40 +44,19 @@ class OutputUnit:
         
         self._time = 0
         self.count = 0
+        self.emg_rate = RateMeter()
         
+    def myo_type(self):
+        return 'black' if self.black_myo and not self.white_myo else 'white'
+
     def data_plot(self, data):
-        data = data[1:]
-        x0 = data[:,0]
-        x1 = data[:,1]
-        x2 = data[:,2]
-        x3 = data[:,3]
-        x4 = data[:,4]
-        x5 = data[:,5]
-        x6 = data[:,6]
-        x7 = data[:,7]
+        from matplotlib import pyplot as plt
         t  = data[:,8]
                     
-        #Black Myo
-        if self.black_myo:
-            plt.plot(t, x0, label="EMG D", color='black')
-            plt.plot(t, x1, label="EMG E", color='red')
-            plt.plot(t, x2, label="EMG F", color='green')
-            plt.plot(t, x3, label="EMG G", color='blue')
-            plt.plot(t, x4, label="EMG H", color='sienna')
-            plt.plot(t, x5, label="EMG A", color='greenyellow')
-            plt.plot(t, x6, label="EMG B", color='lightsalmon')
-            plt.plot(t, x7, label="EMG C", color='lightpink')
-        
-        #White Myo
-        if self.white_myo:
-            plt.plot(t, x0, label="EMG F", color='black')
-            plt.plot(t, x1, label="EMG G", color='red')
-            plt.plot(t, x2, label="EMG H", color='green')
-            plt.plot(t, x3, label="EMG A", color='blue')
-            plt.plot(t, x4, label="EMG B", color='sienna')
-            plt.plot(t, x5, label="EMG C", color='greenyellow')
-            plt.plot(t, x6, label="EMG D", color='lightsalmon')
-            plt.plot(t, x7, label="EMG E", color='lightpink')
+        for myo, on in (('black', self.black_myo), ('white', self.white_myo)):
+            if not on: continue
+            for i in range(8):
+                plt.plot(t, data[:,i], label=CHANNEL_LABELS[myo][i], color=CHANNEL_COLORS[i])
             
         plt.xlabel("Time[sec]", fontsize=16)
         plt.ylabel("EMG", fontsize=16)
@@ -72,42 +66,57 @@ class OutputUnit:
         plt.show()
         
     def save_data(self, saving_path, data):
-        data = data[1:]
         if self.tytle_flag is True:
             with open(saving_path, 'w') as f_handle:
                 np.savetxt(f_handle, self.tytle_dic["DATA"], delimiter=",", fmt="%s")
             self.tytle_flag = False
             
         with open(saving_path, 'a') as f_handle:
-            np.savetxt(f_handle, data, delimiter=",", fmt="%.5f")
+            write_csv(f_handle, data, fmt="%.5f", delimiter=",")
     
-    def proc_emg(self, emg, moving, times=[]):
-        times.append(time.time())
-        if len(times) > 20:
-            #print((len(times) - 1) / (times[-1] - times[0]))
-            times.pop(0)
+    def export(self, csv=True, npy=True):
+        # writes what the recorder holds to <saving_path>.csv / .npy
+        data = self.recorder.data
+        if csv: self.save_data(self.saving_path + ".csv", data)
+        if npy: np.save(self.saving_path, data)
+
+    def proc_emg(self, emg, moving):
+        self.emg_rate.tick()
+        #print(self.emg_rate.rate)
 
-    def myo_main(self):
+    def myo_main(self, tty=None):
+        # the terminal is only switched to unbuffered input here
+        from kbhit import set_normal_term, set_curses_term, kbhit, getch
         atexit.register(set_normal_term)
         set_curses_term()
         
-        m = MyoRaw(None)
+        m = MyoRaw(tty)
         m.add_emg_handler(self.proc_emg)
-        m.connect()
+        plot = None
+        if self.live_plot:
+            plot = LivePlot(myo=self.myo_type())
+            plot.attach(m)
+        m.connect(profiles=Profiles() if self.use_profiles else None)
+        if plot is not None:
+            m.start_reader()
+            plot.open()
 
         m.add_arm_handler(lambda arm, xdir: print('arm', arm, 'xdir', xdir))
         m.add_pose_handler(lambda p: print('pose', p))
         
         # [EMG0, EMG1, EMG2, EMG3, EMG4, EMG5, EMG6, EMG7, TIME, STATUS]
         dim_data = np.array([0, 0, 0, 0, 0, 0, 0, 0, 0, 0], dtype=float)
-        data = np.array([[0, 0, 0, 0, 0, 0, 0, 0, 0, 0]], dtype=float)
+        writer = None
+        if self.stream_session:
+            writer = SessionWriter(self.saving_path + SUFFIX, 10, self.tytle_dic["DATA"][0])
         
         try:
             t_start = time.time()
             while True:
                 m.run(1)
-                #stop vibration ever
-                m.write_attr(0x19, b'\x03\x01\x00')
+                if plot is not None: plot.poll()
+                #stop vibration ever (queued; repeats are coalesced while one is pending)
+                m.write_attr_async(0x19, b'\x03\x01\x00')
                 emg, self._time = m.plot_emg(t_start)
                 
                 if kbhit():
@@ -131,18 +140,22 @@ class OutputUnit:
                 dim_data[:9] = np.append(emg, self._time)
                 if self._time > 1.:
                     if len(dim_data) == 10:
-                        dim2_data = np.expand_dims(dim_data, axis=0)
-                        data = np.append(data, dim2_data, axis=0)
+                        self.recorder.append(dim_data)
+                        if writer is not None: writer.append(dim_data)
                 self.count += 1
                 
         except KeyboardInterrupt:
             pass
         finally:
             m.disconnect()
-            if self.save_csv: self.save_data(self.saving_path + ".csv", data[1:])
-            if self.byn_np: np.save(self.saving_path, data[1:])
-            if self.plt_graph: self.data_plot(data)
+            m.stop_reader()
             print("")
+            if writer is not None:
+                writer.close()
+                print("saved %s%s; export with: python session_writer.py export %s%s" %
+                      (self.saving_path, SUFFIX, self.saving_path, SUFFIX))
+            if self.save_csv or self.byn_np: self.export(self.save_csv, self.byn_np)
+            if self.plt_graph: self.data_plot(self.recorder.data)
 
 if __name__=='__main__':
     saving_path = 'data/temp/sample_EMGdata'
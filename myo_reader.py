@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Background reading for MyoRaw.
+
+A Reader thread owns the serial port: it reads, frames, completes command
+futures and decodes notifications, then hands each decoded value to a
+bounded queue instead of calling the handlers itself. Every attribute
+stream (EMG, IMU, arm/pose) has its own queue and consumer thread, so
+handlers for one stream run in order, and a slow handler only ever delays
+its own stream, never the port.
+
+When a queue is full, overflow='drop_oldest' discards its oldest value
+(counted in Reader.dropped) and overflow='block' makes the reader wait for
+room, which leaves the backlog in the OS buffer instead.
+
+    m.connect()
+    m.start_reader(maxlen=256)
+    ...
+    m.stop_reader()
+'''
+
+from __future__ import print_function
+
+from collections import Counter, deque
+import threading
+import time
+import traceback
+
+OVERFLOW = ('drop_oldest', 'block')
+
+
+class Closed(Exception):
+    pass
+
+
+class BoundedQueue(object):
+    '''Lock-protected FIFO of at most maxlen items.'''
+
+    def __init__(self, maxlen=1024, overflow='drop_oldest'):
+        if overflow not in OVERFLOW:
+            raise ValueError('overflow must be one of %s' % (OVERFLOW,))
+        self.maxlen = maxlen
+        self.overflow = overflow
+        self.items = deque()
+        self.cond = threading.Condition(threading.Lock())
+        self.closed = False
+        self.dropped = 0
+        self.high_water = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def put(self, item):
+        '''Adds item; returns False if the queue is closed.'''
+        with self.cond:
+            if len(self.items) >= self.maxlen:
+                if self.overflow == 'block':
+                    while len(self.items) >= self.maxlen and not self.closed:
+                        self.cond.wait()
+                else:
+                    self.items.popleft()
+                    self.dropped += 1
+            if self.closed:
+                return False
+            self.items.append(item)
+            self.high_water = max(self.high_water, len(self.items))
+            self.cond.notify_all()
+            return True
+
+    def get(self, timeout=None):
+        '''Removes and returns the oldest item. Raises Closed once the queue
+        is closed and empty; returns None if timeout passes first.'''
+        with self.cond:
+            t0 = time.time()
+            while not self.items:
+                if self.closed:
+                    raise Closed()
+                if timeout is None:
+                    self.cond.wait()
+                else:
+                    remaining = t0 + timeout - time.time()
+                    if remaining <= 0:
+                        return None
+                    self.cond.wait(remaining)
+            item = self.items.popleft()
+            self.cond.notify_all()
+            return item
+
+    def close(self):
+        '''Wakes everyone up; items already queued can still be taken.'''
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+class Reader(object):
+    '''Reads and decodes on a background thread for a MyoRaw (see the
+    module docstring). poll is the port timeout, which bounds how long
+    stop() takes.'''
+
+    def __init__(self, myo, maxlen=1024, overflow='drop_oldest', poll=0.05):
+        if overflow not in OVERFLOW:
+            raise ValueError('overflow must be one of %s' % (OVERFLOW,))
+        self.myo = myo
+        self.bt = myo.bt
+        self.maxlen = maxlen
+        self.overflow = overflow
+        self.poll = poll
+
+        ## attribute -> BoundedQueue of (handler, decoded value)
+        self.queues = {}
+        self.consumers = []
+        self.errors = Counter()
+        self.lock = threading.Lock()
+        self.stopping = False
+        self.thread = None
+
+    @property
+    def dropped(self):
+        '''Values discarded so far, per attribute.'''
+        return Counter(dict((attr, q.dropped) for attr, q in self.queues.items()))
+
+    def start(self):
+        self.stopping = False
+        self.thread = threading.Thread(target=self.read_loop, name='myo-reader')
+        self.thread.daemon = True
+        self.bt.reader = self.thread
+        self.thread.start()
+
+    def stop(self):
+        '''Stops reading, lets the consumers finish what is queued and
+        returns the port to the calling thread.'''
+        self.stopping = True
+        for q in list(self.queues.values()):
+            if q.overflow == 'block':
+                ## a full queue mustn't keep the reader from seeing stopping
+                q.close()
+        if self.thread is not None:
+            self.thread.join()
+        self.bt.reader = None
+        for q in list(self.queues.values()):
+            q.close()
+        for t in self.consumers:
+            t.join()
+        self.consumers = []
+        self.thread = None
+
+    def read_loop(self):
+        bt = self.bt
+        bt.set_timeout(self.poll)
+        while not self.stopping:
+            t0 = time.time()
+            if not bt.fill():
+                ## ports that return at once at EOF (e.g. a finished replay)
+                ## would otherwise spin
+                if time.time() - t0 < self.poll / 2:
+                    time.sleep(self.poll)
+                continue
+            while True:
+                p = bt.next_packet()
+                if p is None:
+                    break
+                bt.dispatch(p)
+                bt.notify_waiters(p)
+
+    def dispatch(self, attr, h, vals):
+        '''Called by MyoRaw.handle_data on the reader thread.'''
+        q = self.queues.get(attr)
+        if q is None:
+            q = self.add_queue(attr)
+        q.put((h, vals))
+
+    def add_queue(self, attr):
+        with self.lock:
+            q = self.queues.get(attr)
+            if q is not None:
+                return q
+            q = BoundedQueue(self.maxlen, self.overflow)
+            t = threading.Thread(target=self.consume, args=(attr, q), name='myo-consumer-%#x' % attr)
+            t.daemon = True
+            t.start()
+            self.consumers.append(t)
+            self.queues[attr] = q
+            return q
+
+    def consume(self, attr, q):
+        while True:
+            try:
+                h, vals = q.get()
+            except Closed:
+                return
+            try:
+                h(vals)
+            except Exception:
+                ## a failing handler shouldn't silently stop its stream
+                self.errors[attr] += 1
+                traceback.print_exc()
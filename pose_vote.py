@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Pose voting: the smoothing Myo applies to per-frame classifications.
+
+The last hist_len labels vote (starting from hist_len zeros); the pose
+switches to the most common one r when it has more than margin votes over
+the current pose and more than half the window. Ties between labels go to
+the one that appeared first, as with Counter.most_common.
+
+PoseVoter does this frame by frame for Myo. replay() computes the same
+switches for a whole recorded array of labels at once: the window counts
+of every label come from cumulative sums, and for each label the frames
+where a switch away from it would happen are precomputed, so only the
+switches themselves are stepped through. evaluate() scores the switches
+against the true labels, and sweep() does that for a grid of settings,
+one process per window length.
+
+    python pose_vote.py PRED.npy [TRUE.npy] [--hist 5,10,25,50] [--margin 0,5,10] [--hz 50]
+'''
+
+from __future__ import print_function
+
+from collections import Counter, deque
+import sys
+
+import numpy as np
+
+HIST_LEN = 25
+MARGIN = 5
+
+
+class PoseVoter(object):
+    '''The live voter; history and counts are the window and its label
+    counts.'''
+
+    def __init__(self, hist_len=HIST_LEN, margin=MARGIN):
+        self.hist_len = hist_len
+        self.margin = margin
+        self.history = deque([0] * hist_len, hist_len)
+        self.counts = Counter(self.history)
+        self.last = None
+
+    def vote(self, y):
+        '''Adds label y; returns the new pose if this switches it, else None.'''
+        self.counts[self.history[0]] -= 1
+        self.counts[y] += 1
+        self.history.append(y)
+
+        r, n = self.counts.most_common(1)[0]
+        if self.last is None or (n > self.counts[self.last] + self.margin and n > self.hist_len / 2):
+            self.last = r
+            return r
+        return None
+
+
+def window_counts(y, hist_len):
+    '''(frames, labels) counts of each label in the window after each frame,
+    with labels reordered by first appearance (0 first); returns (counts,
+    labels in that order).'''
+    y = np.asarray(y).astype(np.intp)
+    ## first appearance, as Counter's key order: 0 is there from the start
+    seq = np.concatenate([[0], y])
+    _, first = np.unique(seq, return_index=True)
+    labels = seq[np.sort(first)]
+    col = np.zeros(int(labels.max()) + 1, np.intp)
+    col[labels] = np.arange(len(labels))
+
+    onehot = np.zeros((hist_len + len(y), len(labels)), np.int32)
+    onehot[:hist_len, col[0]] = 1
+    onehot[np.arange(hist_len, hist_len + len(y)), col[y]] = 1
+    c = np.zeros((len(onehot) + 1, len(labels)), np.int32)
+    np.cumsum(onehot, axis=0, out=c[1:])
+    return c[hist_len + 1:] - c[1:len(y) + 1], labels
+
+
+def replay(y, hist_len=HIST_LEN, margin=MARGIN, counts=None):
+    '''The switches PoseVoter makes over labels y, as (frame indices, poses).
+    counts is window_counts(y, hist_len), if already computed.'''
+    if len(y) == 0:
+        return np.zeros(0, np.intp), np.zeros(0, np.intp)
+    counts, labels = counts if counts is not None else window_counts(y, hist_len)
+    n = counts.max(1)
+    ## argmax takes the first maximum, i.e. the label that appeared first
+    r = counts.argmax(1)
+    ## for each current pose p, the frames where the vote would leave it
+    leave = (n[:, None] > counts + margin) & (n[:, None] > hist_len / 2.)
+    ## next_leave[t, p]: first frame >= t where it would, len(y) if none
+    idx = np.where(leave, np.arange(len(y))[:, None], len(y))
+    next_leave = np.minimum.accumulate(idx[::-1], axis=0)[::-1]
+
+    times, poses = [0], [r[0]]
+    t = 0
+    while True:
+        t = next_leave[t + 1, poses[-1]] if t + 1 < len(y) else len(y)
+        if t >= len(y):
+            break
+        times.append(t)
+        poses.append(r[t])
+    return np.array(times, np.intp), labels[np.array(poses, np.intp)]
+
+
+def evaluate(times, poses, truth, hz=None):
+    '''Scores switches against the true label of every frame. A switch is
+    false if it goes to anything but the current true label. Latency is
+    counted from each change of the true label to the first switch to it
+    before the next change (missed if there is none); in frames, and in
+    seconds too if hz is given.'''
+    truth = np.asarray(truth)
+    false = int((poses != truth[times]).sum()) if len(times) else 0
+    changes = np.flatnonzero(np.diff(truth)) + 1
+    ## the change each switch follows, and whether it goes to that label
+    seg = np.searchsorted(changes, times, 'right') - 1
+    ok = seg >= 0
+    ok[ok] = poses[ok] == truth[changes[seg[ok]]]
+    ## times are sorted, so unique() finds the first such switch per change
+    hit, first = np.unique(seg[ok], return_index=True)
+    lat = times[ok][first] - changes[hit]
+    missed = len(changes) - len(hit)
+    res = {
+        'switches': len(times),
+        'false_switches': false,
+        'false_rate': false / float(len(times)) if len(times) else 0.0,
+        'changes': len(changes),
+        'missed': missed,
+        'latency_mean': float(np.mean(lat)) if len(lat) else None,
+        'latency_p50': float(np.percentile(lat, 50)) if len(lat) else None,
+        'latency_p90': float(np.percentile(lat, 90)) if len(lat) else None,
+    }
+    if hz:
+        for k in ('latency_mean', 'latency_p50', 'latency_p90'):
+            if res[k] is not None:
+                res[k + '_s'] = res[k] / hz
+    return res
+
+
+def sweep_one(args):
+    y, truth, hist_len, margins, hz = args
+    counts = window_counts(y, hist_len)
+    out = []
+    for margin in margins:
+        times, poses = replay(y, hist_len, margin, counts)
+        res = evaluate(times, poses, truth, hz)
+        res.update(hist_len=hist_len, margin=margin)
+        out.append(res)
+    return out
+
+
+def sweep(y, truth=None, hist_lens=(5, 10, 25, 50), margins=(0, 2, 5, 10), hz=None, workers=None):
+    '''evaluate() for every (hist_len, margin), one process per hist_len
+    (workers=1 runs them here). truth defaults to y itself, which measures
+    only the smoothing delay and the flicker that gets through.'''
+    truth = y if truth is None else truth
+    tasks = [(np.asarray(y), np.asarray(truth), h, tuple(margins), hz) for h in hist_lens]
+    if workers == 1 or len(tasks) == 1:
+        results = map(sweep_one, tasks)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(sweep_one, tasks))
+    return [r for rs in results for r in rs]
+
+
+def main(argv):
+    args = argv[1:]
+    opts = {'--hist': '5,10,25,50', '--margin': '0,2,5,10', '--hz': None}
+    for k in list(opts):
+        if k in args:
+            i = args.index(k)
+            opts[k] = args[i + 1]
+            del args[i:i + 2]
+    if not args:
+        print(__doc__.strip().splitlines()[-1])
+        return 1
+    y = np.load(args[0])
+    truth = np.load(args[1]) if len(args) >= 2 else None
+    hz = float(opts['--hz']) if opts['--hz'] else None
+    results = sweep(y, truth, [int(h) for h in opts['--hist'].split(',')],
+                    [int(m) for m in opts['--margin'].split(',')], hz)
+    print('hist margin switches  false  rate  missed  latency p50  p90 (frames)')
+    for r in results:
+        print('%4d %6d %8d %6d %5.3f %7d %12s %4s' % (
+            r['hist_len'], r['margin'], r['switches'], r['false_switches'], r['false_rate'],
+            r['missed'], '-' if r['latency_p50'] is None else '%.0f' % r['latency_p50'],
+            '-' if r['latency_p90'] is None else '%.0f' % r['latency_p90']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Crash-safe streaming writer for recording sessions.
+
+Rows are collected into fixed-size chunks that a background thread appends
+to disk while recording goes on. The file is MAGIC, a uint32 column count,
+the column names (uint32 length, then comma-separated UTF-8), and then
+chunks: b'CHNK', row count (uint32), CRC32 of the data (uint32) and the rows
+as little-endian float64. recover() reads every intact chunk, so a file cut
+short by a crash or power loss loses at most the chunks in flight.
+
+Recording only ever writes the session file; CSV and .npy copies are made
+afterwards, on demand, by export():
+
+    python session_writer.py export session.rec [out] [--csv-only|--npy-only]
+'''
+
+from __future__ import print_function
+
+import os
+import struct
+import sys
+import threading
+import zlib
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import numpy as np
+
+MAGIC = b'MYOSESS1'
+SUFFIX = '.rec'
+CHUNK = struct.Struct('<4sII')
+CHUNK_MAGIC = b'CHNK'
+DTYPE = np.dtype('<f8')
+
+
+class SessionWriter(object):
+    '''Appends rows of `columns` values to path. Each full chunk of
+    chunk_rows rows is written, flushed and (with fsync) synced by a
+    background thread; close() writes the last partial chunk.'''
+
+    def __init__(self, path, columns, names=None, chunk_rows=1024, fsync=True):
+        self.path = path
+        self.columns = columns
+        self.chunk_rows = chunk_rows
+        self.fsync = fsync
+
+        self.f = open(path, 'wb')
+        names = ','.join(names or []).encode('utf-8')
+        self.f.write(MAGIC + struct.pack('<II', columns, len(names)) + names)
+        self.f.flush()
+
+        ## full chunks go to the writer thread; written buffers come back
+        self.full = queue.Queue()
+        self.free = queue.Queue()
+        self.chunk = self.new_chunk()
+        self.n = 0
+        self.rows = 0
+        self.error = None
+
+        self.thread = threading.Thread(target=self.write_chunks)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def new_chunk(self):
+        try:
+            return self.free.get_nowait()
+        except queue.Empty:
+            return np.empty((self.chunk_rows, self.columns), DTYPE)
+
+    def append(self, row):
+        self.chunk[self.n] = row
+        self.n += 1
+        self.rows += 1
+        if self.n == self.chunk_rows:
+            self.full.put((self.chunk, self.n))
+            self.chunk = self.new_chunk()
+            self.n = 0
+
+    def write_chunks(self):
+        while True:
+            item = self.full.get()
+            if item is None:
+                return
+            chunk, n = item
+            data = chunk[:n].tobytes()
+            try:
+                self.f.write(CHUNK.pack(CHUNK_MAGIC, n, zlib.crc32(data) & 0xffffffff))
+                self.f.write(data)
+                self.f.flush()
+                if self.fsync:
+                    os.fsync(self.f.fileno())
+            except (IOError, OSError) as e:
+                self.error = e
+            self.free.put(chunk)
+
+    def close(self):
+        if self.f is None:
+            return
+        if self.n:
+            self.full.put((self.chunk, self.n))
+            self.n = 0
+        self.full.put(None)
+        self.thread.join()
+        self.f.close()
+        self.f = None
+        if self.error is not None:
+            raise self.error
+
+
+def recover(path):
+    '''Returns (column names, rows) from every intact chunk of a session
+    file, stopping at the first truncated or corrupt one.'''
+    with open(path, 'rb') as f:
+        raw = f.read()
+    if raw[:len(MAGIC)] != MAGIC:
+        raise ValueError('%s is not a session file' % path)
+    pos = len(MAGIC)
+    columns, nlen = struct.unpack_from('<II', raw, pos)
+    pos += 8
+    names = raw[pos:pos + nlen].decode('utf-8').split(',') if nlen else []
+    pos += nlen
+
+    chunks = []
+    while pos + CHUNK.size <= len(raw):
+        magic, n, crc = CHUNK.unpack_from(raw, pos)
+        end = pos + CHUNK.size + n * columns * DTYPE.itemsize
+        if magic != CHUNK_MAGIC or end > len(raw):
+            break
+        data = raw[pos + CHUNK.size:end]
+        if zlib.crc32(data) & 0xffffffff != crc:
+            break
+        chunks.append(np.frombuffer(data, DTYPE).reshape(n, columns))
+        pos = end
+
+    if not chunks:
+        return names, np.zeros((0, columns), DTYPE)
+    return names, np.concatenate(chunks)
+
+
+def write_csv(f, data, fmt='%.5f', delimiter=',', block=4096):
+    '''Writes rows like np.savetxt(f, data, fmt=fmt, delimiter=delimiter),
+    but formats a whole block of rows with a single % operation.'''
+    data = np.asarray(data)
+    if data.ndim != 2 or not len(data):
+        return
+    line = delimiter.join([fmt] * data.shape[1]) + '\n'
+    for i in range(0, len(data), block):
+        rows = data[i:i + block]
+        f.write((line * len(rows)) % tuple(rows.ravel().tolist()))
+
+
+def export(path, out=None, csv=True, npy=True):
+    '''Writes the rows of the session file at path to out.csv (with the
+    column names as header) and/or out.npy; out defaults to path without
+    its extension. Returns the number of rows.'''
+    if out is None:
+        out = os.path.splitext(path)[0]
+    names, data = recover(path)
+    if npy:
+        np.save(out, data)
+    if csv:
+        with open(out + '.csv', 'w') as f:
+            if names:
+                f.write(','.join(names) + '\n')
+            write_csv(f, data)
+    return len(data)
+
+
+def main(argv):
+    args = [a for a in argv[1:] if not a.startswith('--')]
+    ## recover is the old name of export
+    if len(args) < 2 or args[0] not in ('export', 'recover'):
+        print(__doc__.strip().splitlines()[-1])
+        return 1
+    out = args[2] if len(args) >= 3 else os.path.splitext(args[1])[0]
+    csv = '--npy-only' not in argv
+    npy = '--csv-only' not in argv
+    n = export(args[1], out, csv, npy)
+    print('exported %d rows to %s' % (n, ' and '.join(out + ext for ext, on in (('.npy', npy), ('.csv', csv)) if on)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Shared-memory ring buffer of Myo frames for other processes (Python 3.8+).
+
+One process owns the dongle and feeds a RingWriter from its MyoRaw
+handlers. Any number of other processes (logger, classifier, plots) open
+a RingReader by name and read NumPy views straight out of the shared
+memory, without copying or locking.
+
+Each EMG notification becomes one FRAME record, stamped with its arrival
+time and a running sequence number and carrying the latest IMU values.
+The shared block holds a small header followed by `capacity` records;
+the header's head counter is the number of frames ever written. The
+writer fills a record, then advances head, with plain aligned 8-byte
+stores, so a reader only has to compare its own position with head. A
+reader that falls `capacity` frames behind has lost the oldest ones: it
+skips ahead and counts them in `lost`.
+
+    python shm_ring.py serve [name] [tty]   # publish a Myo as `name`
+    python shm_ring.py tail [name]          # print what arrives
+'''
+
+from __future__ import print_function
+
+import sys
+import time
+
+import numpy as np
+from multiprocessing import shared_memory
+
+FRAME = np.dtype([
+    ('t', '<f8'),
+    ('seq', '<u8'),
+    ('emg', '<u2', (8,)),
+    ('moving', 'u1'),
+    ('quat', '<i2', (4,)),
+    ('acc', '<i2', (3,)),
+    ('gyro', '<i2', (3,)),
+], align=True)
+
+NAME = 'myo'
+MAGIC = np.frombuffer(b'MYORING1', '<u8')[0]
+## header fields, as uint64s: magic, capacity, record size, head
+MAGIC_F, CAPACITY_F, ITEMSIZE_F, HEAD_F = range(4)
+HEADER_SIZE = 64
+
+## names of the rings created by this process
+created = set()
+
+
+def frames_view(shm, capacity):
+    return np.ndarray((capacity,), FRAME, shm.buf, HEADER_SIZE)
+
+
+class RingWriter(object):
+    '''Creates the shared ring `name` (a random name if None) and appends
+    frames to it. Use as EMG and IMU handler of a MyoRaw via attach().'''
+
+    def __init__(self, name=NAME, capacity=1 << 14):
+        self.shm = shared_memory.SharedMemory(name, create=True,
+                                              size=HEADER_SIZE + capacity * FRAME.itemsize)
+        self.name = self.shm.name
+        created.add(self.name)
+        self.capacity = capacity
+        self.header = np.ndarray((HEADER_SIZE // 8,), '<u8', self.shm.buf)
+        self.header[:] = 0
+        self.header[CAPACITY_F] = capacity
+        self.header[ITEMSIZE_F] = FRAME.itemsize
+        self.header[MAGIC_F] = MAGIC
+        self.frames = frames_view(self.shm, capacity)
+        self.head = 0
+        ## latest IMU values, copied into every frame
+        self.imu = np.zeros(1, FRAME)[0]
+
+    def attach(self, m):
+        m.add_emg_handler(self.on_emg)
+        m.add_imu_handler(self.on_imu)
+
+    def on_imu(self, quat, acc, gyro):
+        self.imu['quat'] = quat
+        self.imu['acc'] = acc
+        self.imu['gyro'] = gyro
+
+    def on_emg(self, emg, moving):
+        self.append(emg, moving)
+
+    def append(self, emg, moving=0, t=None):
+        i = self.head
+        f = self.frames[i % self.capacity]
+        f['t'] = time.time() if t is None else t
+        f['seq'] = i
+        f['emg'] = emg
+        f['moving'] = moving
+        f['quat'] = self.imu['quat']
+        f['acc'] = self.imu['acc']
+        f['gyro'] = self.imu['gyro']
+        ## publish only once the record is complete
+        self.head = i + 1
+        self.header[HEAD_F] = self.head
+
+    def close(self):
+        '''Closes and removes the shared memory; readers keep their mapping
+        until they close too.'''
+        self.header = self.frames = None
+        self.shm.close()
+        self.shm.unlink()
+        created.discard(self.name)
+
+
+def open_shared_memory(name):
+    ## before Python 3.13 attaching registers the block with this process's
+    ## resource tracker, which would unlink it when the reader exits
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name)
+        if shm.name not in created:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class RingReader(object):
+    '''Attaches to the ring `name`. By default it starts at the oldest frame
+    still held; latest=True starts with the next one written.'''
+
+    def __init__(self, name=NAME, latest=False):
+        self.shm = open_shared_memory(name)
+        self.name = name
+        self.header = np.ndarray((HEADER_SIZE // 8,), '<u8', self.shm.buf)
+        if self.header[MAGIC_F] != MAGIC or self.header[ITEMSIZE_F] != FRAME.itemsize:
+            self.shm.close()
+            raise ValueError('%s is not a Myo frame ring' % name)
+        self.capacity = int(self.header[CAPACITY_F])
+        self.frames = frames_view(self.shm, self.capacity)
+        head = self.head()
+        self.pos = head if latest else max(head - self.capacity + 1, 0)
+        self.start = self.pos
+        self.lost = 0
+
+    def head(self):
+        return int(self.header[HEAD_F])
+
+    @property
+    def behind(self):
+        '''Frames written but not read yet.'''
+        return self.head() - self.pos
+
+    def catch_up(self, head):
+        ## the writer may be overwriting the slot of head - capacity now
+        oldest = head - self.capacity + 1
+        if self.pos < oldest:
+            self.lost += oldest - self.pos
+            self.pos = oldest
+
+    def read(self, n=None):
+        '''Returns a view of up to n unread frames (all of them if None) and
+        advances past them. The view never wraps around, so a second call
+        may return more. Check intact() after using it.'''
+        head = self.head()
+        self.catch_up(head)
+        start = self.pos
+        end = head if n is None else min(head, start + n)
+        i = start % self.capacity
+        end = min(end, start + self.capacity - i)
+        self.pos = end
+        self.start = start
+        return self.frames[i:i + end - start]
+
+    def intact(self):
+        '''Whether the frames returned by the last read() can't have been
+        overwritten yet. If not, this reader is too slow and they (and the
+        frames counted in lost) may be damaged.'''
+        return self.head() - self.start < self.capacity
+
+    def wait(self, timeout=None, poll=.002):
+        '''Sleeps until there is an unread frame; False on timeout.'''
+        t0 = time.time()
+        while self.head() <= self.pos:
+            if timeout is not None and time.time() - t0 >= timeout:
+                return False
+            time.sleep(poll)
+        return True
+
+    def latest(self, n):
+        '''The last n frames written (fewer at first), oldest first, without
+        moving the read position; copied only when they wrap around.'''
+        head = self.head()
+        n = min(n, head, self.capacity - 1)
+        start = (head - n) % self.capacity
+        if start + n <= self.capacity:
+            return self.frames[start:start + n]
+        return np.concatenate([self.frames[start:], self.frames[:start + n - self.capacity]])
+
+    def close(self):
+        self.header = self.frames = None
+        self.shm.close()
+
+
+def main(argv):
+    if len(argv) < 2 or argv[1] not in ('serve', 'tail'):
+        print('\n'.join(__doc__.strip().splitlines()[-2:]))
+        return 1
+    name = argv[2] if len(argv) >= 3 else NAME
+
+    if argv[1] == 'serve':
+        from myo_raw import MyoRaw
+        m = MyoRaw(argv[3] if len(argv) >= 4 else None)
+        w = RingWriter(name)
+        w.attach(m)
+        m.connect()
+        print('publishing as %s' % w.name)
+        try:
+            while True:
+                m.run(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            m.disconnect()
+            w.close()
+        return 0
+
+    r = RingReader(name, latest=True)
+    try:
+        while True:
+            if not r.wait(1):
+                continue
+            f = r.read()
+            print('%d frames, last %s, %d behind, %d lost' % (len(f), f['emg'][-1], r.behind, r.lost))
+            time.sleep(.1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        r.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,107 @@
+from struct import pack
+
+from myo_raw import MyoRaw, Packet
+
+
+class FakeSerial(object):
+    '''Records what is written and never answers.'''
+    timeout = None
+    in_waiting = 0
+
+    def __init__(self):
+        self.written = []
+
+    def write(self, data):
+        self.written.append(bytes(data))
+
+    def read(self, n=1):
+        return b''
+
+    def close(self):
+        pass
+
+
+def connected():
+    m = MyoRaw(FakeSerial())
+    m.conn = 0
+    return m
+
+
+def ops(m):
+    busy = m.bt.att_busy.get(0)
+    return ([busy] if busy else []) + list(m.bt.att_queue.get(0, ()))
+
+
+MC_START = [
+    (0x28, b'\x01\x00'), (0x1d, b'\x01\x00'), (0x24, b'\x02\x00'),
+    (0x19, b'\x01\x03\x01\x01\x01'), (0x28, b'\x01\x00'), (0x1d, b'\x01\x00'),
+    (0x19, b'\x09\x01\x01\x00\x00'), (0x1d, b'\x01\x00'), (0x19, b'\x01\x03\x00\x01\x00'),
+    (0x28, b'\x01\x00'), (0x1d, b'\x01\x00'), (0x19, b'\x01\x03\x01\x01\x00'),
+]
+
+
+def test_writes_with_others_in_between_are_all_queued():
+    m = connected()
+    for attr, val in MC_START:
+        m.write_attr_async(attr, val)
+    assert [(op.attr, op.val) for op in ops(m)] == MC_START
+
+
+def test_identical_consecutive_writes_coalesce():
+    m = connected()
+    fs = [m.write_attr_async(0x19, b'\x03\x01\x00') for _ in range(5)]
+    ## the first is sent at once; the rest fold into one queued op
+    assert len(ops(m)) == 2
+    assert fs[1] is fs[-1] is ops(m)[-1].future
+    f = m.write_attr_async(0x19, b'\x03\x01\x00', coalesce=False)
+    assert len(ops(m)) == 3 and f is ops(m)[-1].future
+
+
+def test_no_coalescing_across_other_writes():
+    m = connected()
+    a = m.write_attr_async(0x28, b'\x01\x00')
+    m.write_attr_async(0x1d, b'\x01\x00')
+    b = m.write_attr_async(0x28, b'\x01\x00')
+    c = m.write_attr_async(0x28, b'\x01\x00')
+    assert a is not b and b is c
+    assert len(ops(m)) == 3
+
+
+def test_next_op_starts_when_write_completes():
+    m = connected()
+    m.write_attr_async(0x28, b'\x01\x00')
+    m.write_attr_async(0x1d, b'\x01\x00')
+    assert len(m.bt.ser.written) == 1
+    first = m.bt.att_busy[0]
+    ## procedure completed for the first write
+    m.bt.handle_att_event(Packet(0x80, 4, 1, pack('<BHH', 0, 0, 0x28)))
+    assert first.future.done()
+    assert m.bt.att_busy[0].attr == 0x1d
+    assert len(m.bt.ser.written) == 2
+
+
+def test_disconnect_drops_ops_of_the_connection():
+    m = connected()
+    fs = [m.write_attr_async(0x28 + i, b'\x01\x00') for i in range(5)]
+    other = m.bt.write_attr_async(1, 0x28, b'\x01\x00')
+    m.disconnect()
+    assert ops(m) == []
+    assert all(f.done() and f.result() is None for f in fs)
+    ## other connections are untouched
+    assert not other.done() and m.bt.att_busy[1].future is other
+
+    ## a new connection getting the same handle starts with an empty queue
+    m.conn = 0
+    sent = len(m.bt.ser.written)
+    m.write_attr_async(0x1d, b'\x01\x00')
+    assert [op.attr for op in ops(m)] == [0x1d]
+    assert len(m.bt.ser.written) == sent + 1
+
+
+def test_disconnected_event_drops_ops():
+    m = connected()
+    fs = [m.write_attr_async(0x28 + i, b'\x01\x00') for i in range(3)]
+    ## link lost: connection 0 disconnected, reason 0x0208 (timeout)
+    m.bt.handle_event(Packet(0x80, 3, 4, pack('<BH', 0, 0x0208)))
+    assert ops(m) == []
+    assert all(f.done() and f.result() is None for f in fs)
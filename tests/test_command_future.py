@@ -0,0 +1,41 @@
+import threading
+
+from myo_raw import CommandFuture
+
+
+class RacyEvent(threading.Event):
+    '''Completes the future on another thread right after the first check of
+    whether it is done, as a reader thread can.'''
+
+    def __init__(self, future):
+        threading.Event.__init__(self)
+        self.future = future
+        self.thread = None
+
+    def is_set(self):
+        res = threading.Event.is_set(self)
+        if self.thread is None and threading.current_thread() is threading.main_thread():
+            self.thread = threading.Thread(target=self.future.set_result, args=('p',))
+            self.thread.start()
+            ## returns early if set_result has to wait for us
+            self.thread.join(.2)
+        return res
+
+
+def test_callback_added_while_completing_runs():
+    f = CommandFuture(None)
+    f.event = RacyEvent(f)
+    calls = []
+    f.add_done_callback(calls.append)
+    f.event.thread.join()
+    assert calls == [f]
+    assert f.packet == 'p'
+
+
+def test_first_result_wins():
+    f = CommandFuture(None)
+    f.set_result('a')
+    f.set_result('b')
+    calls = []
+    f.add_done_callback(lambda f: calls.append(f.packet))
+    assert calls == ['a']
@@ -0,0 +1,26 @@
+import numpy as np
+
+from emg_features import EMGFeatures, features
+
+
+def test_stream_matches_batch():
+    rng = np.random.RandomState(0)
+    X = rng.randint(0, 500, (2000, 8))
+    for window, hop, zc, offset in ((40, 10, 0.0, 250.0), (7, 3, 20.0, 100.0), (2, 1, 0.0, 0.0)):
+        stream = EMGFeatures(window, hop, zc_threshold=zc, offset=offset).process(X)
+        batch = features(X, window, hop, zc_threshold=zc, offset=offset)
+        assert stream.shape == batch.shape
+        assert np.allclose(stream, batch)
+
+
+def test_resync_keeps_sums_exact():
+    rng = np.random.RandomState(1)
+    X = rng.randn(3000, 8) * 1e3
+    f = EMGFeatures(25, 5)
+    f.RESYNC = 256
+    assert np.allclose(f.process(X), features(X, 25, 5))
+
+
+def test_short_input():
+    assert features(np.zeros((5, 8)), 40, 10).shape == (0, 40)
+    assert EMGFeatures(40, 10).process(np.zeros((5, 8))).shape == (0, 40)
@@ -0,0 +1,36 @@
+import numpy as np
+
+from knn import BlockKNN, vote
+
+
+def test_block_knn_matches_brute_force():
+    rng = np.random.RandomState(0)
+    X = rng.randint(0, 2000, (20000, 8)).astype(np.uint16)
+    Y = rng.randint(0, 10, len(X))
+    Q = rng.randint(0, 2000, (300, 8))
+    engine = BlockKNN(15)
+    ## small blocks, so the running merge across blocks is exercised
+    engine.BLOCK_BYTES = 1 << 16
+    engine.fit(X, Y)
+    d, i = engine.kneighbors(Q)
+
+    D = ((Q[:, None, :].astype(np.int64) - X[None].astype(np.int64)) ** 2).sum(2)
+    assert (np.sort(D, 1)[:, :15] == np.take_along_axis(D, i, 1)).all()
+    ## float32 distances are computed as |q|^2 - 2 q.x + |x|^2, ~1e7 here
+    assert np.allclose(d, np.take_along_axis(D, i, 1), rtol=0, atol=16)
+
+
+def test_add_matches_fit():
+    rng = np.random.RandomState(1)
+    X = rng.randint(0, 1000, (3000, 8))
+    Y = rng.randint(0, 5, len(X))
+    Q = rng.randint(0, 1000, (200, 8))
+    whole = BlockKNN(7).fit(X, Y)
+    parts = BlockKNN(7)
+    for s in range(0, len(X), 250):
+        parts.add(X[s:s + 250], Y[s:s + 250])
+    assert (whole.classify_batch(Q) == parts.classify_batch(Q)).all()
+
+
+def test_vote_ties_go_to_smallest_label():
+    assert vote([[2, 1, 2, 1], [0, 3, 3, 0], [4, 4, 4, 4]]).tolist() == [1, 0, 4]
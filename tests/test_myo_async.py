@@ -0,0 +1,28 @@
+import asyncio
+
+from myo_async import AsyncMyo
+from myo_emulator import EmulatedDongle
+
+
+def test_commands_complete_while_a_blocking_subscriber_is_full():
+    async def main(port):
+        async with AsyncMyo(port) as m:
+            await m.connect(timeout=5)
+            sub = m.emg(maxlen=4, overflow='block')
+            ## nobody consumes: the subscriber fills up and reading pauses
+            await asyncio.sleep(.3)
+            assert m.paused and not m.reading
+            res = await asyncio.wait_for(m.write_attr(0x19, b'\x03\x01\x00'), 2)
+            assert res is not None
+            assert await asyncio.wait_for(m.read_attr(0x17), 2) is not None
+            ## paused again once nothing is awaited
+            await asyncio.sleep(.1)
+            assert not m.reading
+            ## and reading resumes as the subscriber catches up
+            for _ in range(len(sub.items)):
+                await sub.__anext__()
+            assert m.reading
+            sub.close()
+
+    with EmulatedDongle(emg_hz=200) as dongle:
+        asyncio.run(main(dongle.port))
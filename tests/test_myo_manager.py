@@ -0,0 +1,24 @@
+import time
+from struct import pack
+
+from myo_emulator import EmulatedDongle
+from myo_manager import MyoManager
+
+
+def test_full_dongle_is_skipped():
+    with EmulatedDongle(armbands=3) as dongle:
+        command = dongle.command
+        def two_connections(cls, cmd, payload):
+            if (cls, cmd) == (0, 6):
+                ## get_connections: this dongle holds only two
+                return dongle.respond(0, 6, pack('B', 2))
+            return command(cls, cmd, payload)
+        dongle.command = two_connections
+
+        mgr = MyoManager([dongle.port])
+        t0 = time.time()
+        devices = mgr.connect(count=3, timeout=5)
+        assert len(devices) == 2
+        assert time.time() - t0 < MyoManager.CONNECT_TIMEOUT
+        assert mgr.dongles[0].max_connections == 2
+        mgr.close()
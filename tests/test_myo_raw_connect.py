@@ -0,0 +1,45 @@
+import time
+
+from myo_emulator import EmulatedDongle
+from myo_raw import MyoRaw
+
+
+def run(m, seconds):
+    t0 = time.time()
+    while time.time() - t0 < seconds:
+        m.run(.05)
+
+
+def test_custom_emg_decoder_survives_connect():
+    with EmulatedDongle() as dongle:
+        m = MyoRaw(dongle.port)
+        raw = []
+        m.register_attr(0x27, '17s', raw.append)
+        m.connect()
+        run(m, .3)
+        assert m.first_emg_time is not None
+        assert raw and all(len(v[0]) == 17 for v in raw)
+        ## and again on reconnecting
+        m.disconnect()
+        n = len(raw)
+        m.connect()
+        run(m, .3)
+        assert len(raw) > n
+        m.bt.close()
+
+
+def test_connect_twice():
+    with EmulatedDongle() as dongle:
+        m = MyoRaw(dongle.port)
+        emg = []
+        m.add_emg_handler(lambda e, moving: emg.append(e))
+        for _ in range(2):
+            m.connect()
+            assert m.conn is not None
+            m.disconnect()
+            assert m.conn is None
+        m.connect()
+        run(m, .5)
+        ## one handle_data, so each frame is handled once (50 Hz)
+        assert 15 <= len(emg) <= 35
+        m.bt.close()
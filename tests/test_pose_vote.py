@@ -0,0 +1,59 @@
+import numpy as np
+
+from pose_vote import PoseVoter, evaluate, replay
+
+
+def live_switches(y, hist_len, margin):
+    v = PoseVoter(hist_len, margin)
+    out = []
+    for t, label in enumerate(y):
+        r = v.vote(int(label))
+        if r is not None:
+            out.append((t, r))
+    return out
+
+
+def test_replay_matches_live_voter():
+    rng = np.random.RandomState(0)
+    for trial in range(600):
+        T = rng.randint(1, 400)
+        ncls = rng.randint(1, 6)
+        hist_len = rng.randint(1, 30)
+        margin = rng.randint(0, 8)
+        truth = np.repeat(rng.randint(0, ncls, T // 10 + 1), 10)[:T]
+        y = np.where(rng.rand(T) < rng.rand(), rng.randint(0, ncls, T), truth)
+        if trial % 3 == 0:
+            ## labels that don't include the initial 0
+            y = y + 3
+        times, poses = replay(y, hist_len, margin)
+        assert list(zip(times.tolist(), poses.tolist())) == live_switches(y, hist_len, margin)
+
+
+def test_replay_empty():
+    times, poses = replay(np.zeros(0, int))
+    assert len(times) == len(poses) == 0
+
+
+def test_evaluate_matches_loop():
+    rng = np.random.RandomState(1)
+    T = 20000
+    truth = np.repeat(rng.randint(0, 5, T // 200), 200)
+    y = np.where(rng.rand(T) < .3, rng.randint(0, 5, T), truth)
+    for hist_len in (3, 10, 25):
+        for margin in (0, 3):
+            times, poses = replay(y, hist_len, margin)
+            res = evaluate(times, poses, truth)
+
+            changes = np.flatnonzero(np.diff(truth)) + 1
+            ends = np.append(changes[1:], len(truth))
+            lat, missed = [], 0
+            for start, end in zip(changes, ends):
+                i = np.searchsorted(times, start)
+                hit = np.flatnonzero((times[i:] < end) & (poses[i:] == truth[start]))
+                if len(hit):
+                    lat.append(times[i + hit[0]] - start)
+                else:
+                    missed += 1
+            assert res['missed'] == missed
+            assert res['latency_mean'] == (float(np.mean(lat)) if lat else None)
+            assert res['false_switches'] == int((poses != truth[times]).sum())
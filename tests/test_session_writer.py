@@ -0,0 +1,49 @@
+import os
+
+import numpy as np
+
+from session_writer import SessionWriter, export, recover
+
+
+def write_session(path, rows):
+    w = SessionWriter(path, 3, ['a', 'b', 'c'], chunk_rows=16, fsync=False)
+    for r in rows:
+        w.append(r)
+    w.close()
+
+
+def test_recover_round_trip(tmp_path):
+    path = str(tmp_path / 's.rec')
+    rows = np.arange(150.).reshape(50, 3)
+    write_session(path, rows)
+    names, data = recover(path)
+    assert names == ['a', 'b', 'c']
+    assert (data == rows).all()
+
+
+def test_recover_stops_at_torn_chunk(tmp_path):
+    path = str(tmp_path / 's.rec')
+    rows = np.arange(150.).reshape(50, 3)
+    write_session(path, rows)
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 5)
+    _, data = recover(path)
+    ## the last, partial chunk (50 = 3 * 16 + 2) is lost, nothing else
+    assert (data == rows[:48]).all()
+
+
+def test_export(tmp_path):
+    path = str(tmp_path / 's.rec')
+    rows = np.arange(30.).reshape(10, 3) / 7
+    write_session(path, rows)
+    assert export(path) == 10
+    out = str(tmp_path / 's')
+    assert np.allclose(np.load(out + '.npy'), rows)
+    with open(out + '.csv') as f:
+        lines = f.read().splitlines()
+    assert lines[0] == 'a,b,c'
+    assert np.allclose(np.loadtxt(lines[1:], delimiter=','), rows, atol=1e-5)
+
+    os.remove(out + '.npy')
+    export(path, csv=True, npy=False)
+    assert not os.path.exists(out + '.npy')
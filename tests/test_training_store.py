@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from training_store import HEADER_SIZE, MAX_CLASSES, TrainingStore
+
+
+def test_append_and_reload(tmp_path):
+    path = str(tmp_path / 't.myo')
+    s = TrainingStore(path)
+    for i in range(300):
+        s.append(i % 3, [i] * 8)
+    s.close()
+    X, Y = TrainingStore(path).load()
+    assert len(Y) == 300
+    assert Y.tolist() == [i % 3 for i in range(300)]
+    assert X[:, 0].tolist() == list(range(300))
+
+
+def test_torn_tail_is_dropped(tmp_path):
+    path = str(tmp_path / 't.myo')
+    s = TrainingStore(path)
+    s.extend(1, np.ones((10, 8)))
+    s.close()
+    ## a crash in the middle of writing a batch: records after the header's
+    ## count, the last one incomplete
+    with open(path, 'ab') as f:
+        f.write(b'\x02\x00' + b'\x07' * 30)
+    s = TrainingStore(path)
+    X, Y = s.load()
+    assert len(Y) == 10
+    assert (Y == 1).all()
+    s.append(2, [5] * 8)
+    s.close()
+    X, Y = TrainingStore(path).load()
+    assert Y.tolist() == [1] * 10 + [2]
+    assert X[-1].tolist() == [5] * 8
+
+
+def test_class_out_of_range_writes_nothing(tmp_path):
+    path = str(tmp_path / 't.myo')
+    s = TrainingStore(path)
+    with pytest.raises(ValueError):
+        s.extend(MAX_CLASSES, np.zeros((3, 8)))
+    with pytest.raises(ValueError):
+        s.append(-1, [0] * 8)
+    s.close()
+    s = TrainingStore(path)
+    assert s.total == 0
+    import os
+    assert os.path.getsize(path) == HEADER_SIZE
+
+
+def test_compact_sorts_by_class(tmp_path):
+    path = str(tmp_path / 't.myo')
+    s = TrainingStore(path)
+    for y in (2, 0, 1, 0, 2, 1, 0):
+        s.append(y, [y] * 8)
+    s.compact()
+    X, Y = s.load()
+    assert Y.tolist() == [0, 0, 0, 1, 1, 2, 2]
+    assert Y[s.class_slice(2)].tolist() == [2, 2]
+    s.close()
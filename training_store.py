@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Single-file, append-only store for labelled EMG training samples.
+
+Layout (little-endian):
+
+    0     magic b'MYOTRAIN'
+    8     format version (uint16), channel count (uint16), max classes (uint16)
+    14    sample dtype, NumPy type string padded with NULs to 8 bytes
+    24    committed record count (uint64), class-sorted prefix length (uint64)
+    64    per-class table of (offset, count) uint64 pairs
+    HEADER_SIZE  records: label (uint16) followed by the channel values
+
+Records are only ever appended. The header is rewritten after each flush, so
+it never covers a record that isn't fully on disk, and a torn tail left by a
+crash is ignored on the next open. The per-class counts cover all records;
+the offsets index the class-sorted prefix, which compact() extends to the
+whole file (importing vals*.dat files compacts automatically).
+'''
+
+from __future__ import print_function
+
+import atexit
+import glob
+import hashlib
+import os
+import re
+import struct
+import time
+
+import numpy as np
+
+MAGIC = b'MYOTRAIN'
+VERSION = 1
+MAX_CLASSES = 256
+PREAMBLE = struct.Struct('<8sHHH8sQQ')
+TABLE_OFFSET = 64
+HEADER_SIZE = 8192
+
+
+class TrainingStore(object):
+    '''Buffers appended samples in memory and writes them out in batches of
+    FLUSH_EVERY samples, or after FLUSH_INTERVAL seconds, whichever is first.
+    load() memory-maps the file, so X and Y are read-only views of it.'''
+
+    FLUSH_EVERY = 256
+    FLUSH_INTERVAL = 1.0
+
+    def __init__(self, path, channels=8, dtype='<u2'):
+        self.path = path
+        self.created = not os.path.exists(path)
+        if self.created:
+            self.channels = channels
+            self.dtype = np.dtype(dtype)
+            self.total = 0
+            self.sorted_end = 0
+            self.table = np.zeros((MAX_CLASSES, 2), '<u8')
+            with open(path, 'wb') as f:
+                f.write(self.header())
+        else:
+            self.read_header()
+
+        self.record = np.dtype([('y', '<u2'), ('x', self.dtype, (self.channels,))])
+        self.pending = np.zeros(self.FLUSH_EVERY, self.record)
+        self.npending = 0
+        self.last_flush = time.time()
+
+        ## drop a partially written tail left over from a crash
+        end = HEADER_SIZE + self.total * self.record.itemsize
+        if os.path.getsize(path) > end:
+            with open(path, 'r+b') as f:
+                f.truncate(end)
+
+        self.f = open(path, 'ab')
+        atexit.register(self.close)
+
+    ## header
+    def header(self):
+        pre = PREAMBLE.pack(MAGIC, VERSION, self.channels, MAX_CLASSES,
+                            self.dtype.str.encode('ascii'), self.total, self.sorted_end)
+        out = bytearray(HEADER_SIZE)
+        out[:len(pre)] = pre
+        table = self.table.tobytes()
+        out[TABLE_OFFSET:TABLE_OFFSET + len(table)] = table
+        return bytes(out)
+
+    def read_header(self):
+        with open(self.path, 'rb') as f:
+            raw = f.read(HEADER_SIZE)
+        if len(raw) < HEADER_SIZE or raw[:len(MAGIC)] != MAGIC:
+            raise ValueError('%s is not a training store' % self.path)
+        magic, version, channels, max_classes, dtype, total, sorted_end = PREAMBLE.unpack_from(raw)
+        if version != VERSION:
+            raise ValueError('%s: unsupported training store version %d' % (self.path, version))
+        self.channels = channels
+        self.dtype = np.dtype(dtype.rstrip(b'\0').decode('ascii'))
+        self.total = total
+        self.sorted_end = sorted_end
+        self.table = np.frombuffer(raw, '<u8', max_classes * 2, TABLE_OFFSET).reshape(-1, 2).copy()
+
+    def write_header(self):
+        with open(self.path, 'r+b') as f:
+            f.write(self.header())
+
+    ## writing
+    def append(self, cls, vals):
+        if not 0 <= cls < MAX_CLASSES:
+            raise ValueError('class %d out of range' % cls)
+        rec = self.pending[self.npending]
+        rec['y'] = cls
+        rec['x'] = vals
+        self.npending += 1
+        if self.npending == self.FLUSH_EVERY or time.time() - self.last_flush > self.FLUSH_INTERVAL:
+            self.flush()
+
+    def extend(self, cls, X):
+        '''Appends a block of samples, all of class cls.'''
+        if not 0 <= cls < MAX_CLASSES:
+            raise ValueError('class %d out of range' % cls)
+        self.flush()
+        recs = np.zeros(len(X), self.record)
+        recs['y'] = cls
+        recs['x'] = X
+        self.write(recs)
+
+    def flush(self):
+        self.last_flush = time.time()
+        if self.npending:
+            self.write(self.pending[:self.npending])
+            self.npending = 0
+
+    def write(self, recs):
+        if self.f is None:
+            raise ValueError('training store is closed')
+        self.f.write(recs.tobytes())
+        self.f.flush()
+        self.table[:, 1] += np.bincount(recs['y'], minlength=MAX_CLASSES).astype('<u8')
+        self.total += len(recs)
+        self.write_header()
+
+    def close(self):
+        if self.f is not None:
+            self.flush()
+            self.f.close()
+            self.f = None
+            atexit.unregister(self.close)
+
+    ## reading
+    def records(self):
+        self.flush()
+        if self.total == 0:
+            return np.zeros(0, self.record)
+        return np.memmap(self.path, self.record, 'r', HEADER_SIZE, (self.total,))
+
+    def load(self):
+        '''Returns (X, Y) as views of the memory-mapped file.'''
+        recs = self.records()
+        return recs['x'], recs['y']
+
+    def fingerprint(self):
+        '''Hash of the layout and committed records, in hex; changes whenever
+        the data or its order does.'''
+        self.flush()
+        h = hashlib.sha1(self.header()[:TABLE_OFFSET])
+        remaining = self.total * self.record.itemsize
+        with open(self.path, 'rb') as f:
+            f.seek(HEADER_SIZE)
+            while remaining > 0:
+                chunk = f.read(min(remaining, 1 << 20))
+                if not chunk:
+                    break
+                h.update(chunk)
+                remaining -= len(chunk)
+        return h.hexdigest()
+
+    def counts(self):
+        return self.table[:, 1]
+
+    def class_slice(self, cls):
+        '''Record range of class cls within the class-sorted prefix.'''
+        offset, count = self.table[cls]
+        if self.sorted_end < self.total:
+            ## records appended since the last compact() aren't in the prefix
+            count = self.sorted_prefix_counts()[cls]
+        return slice(int(offset), int(offset + count))
+
+    def sorted_prefix_counts(self):
+        recs = self.records()
+        return np.bincount(recs['y'][:self.sorted_end], minlength=MAX_CLASSES)
+
+    def compact(self):
+        '''Rewrites the file with the records sorted by class (stably), so
+        every class is contiguous and the table offsets cover all of it.'''
+        recs = self.records()
+        order = np.argsort(recs['y'], kind='mergesort')
+        counts = np.bincount(recs['y'], minlength=MAX_CLASSES)
+
+        self.table[:, 0] = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        self.table[:, 1] = counts
+        self.sorted_end = self.total
+
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(self.header())
+            f.write(np.asarray(recs[order]).tobytes())
+        del recs
+        self.f.close()
+        os.replace(tmp, self.path)
+        self.f = open(self.path, 'ab')
+
+    def import_vals(self, pattern='vals*.dat'):
+        '''Imports the legacy per-class vals<N>.dat files; returns the number
+        of samples imported.'''
+        n = 0
+        for fn in sorted(glob.glob(pattern)):
+            m = re.search(r'(\d+)\.dat$', fn)
+            if not m:
+                continue
+            if int(m.group(1)) >= MAX_CLASSES:
+                print('skipping %s: class out of range' % fn)
+                continue
+            X = np.fromfile(fn, dtype=np.uint16).reshape((-1, self.channels))
+            self.extend(int(m.group(1)), X)
+            n += len(X)
+        if n:
+            self.compact()
+        return n